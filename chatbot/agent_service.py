@@ -0,0 +1,67 @@
+"""
+Minimal HTTP front for the agent, mirroring the Streamlit refine -> accept -> answer flow.
+Used as the service target of loadtest.py.
+
+    uvicorn agent_service:app --port 8001
+    AGENT_FAKES=bench_fixtures/replay.json uvicorn agent_service:app --port 8001
+"""
+import os
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from fastapi import FastAPI, Request
+from pydantic import BaseModel
+from langchain_core.messages import HumanMessage, AIMessage
+import agent
+from agent import AgentState
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # connect when the server starts, not on import
+    fixtures = os.getenv("AGENT_FAKES")
+    if fixtures:
+        from fakes import load_fakes
+        agent.use_backends(**load_fakes(fixtures))
+    else:
+        agent.init_backends()
+    app.state.graph = agent.compiled_graph()
+    app.state.schema = agent.kg_schema()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+class RefineBody(BaseModel):
+    messages: List[Message]
+    hist: Dict[str, str] = {}
+
+
+class AnswerBody(BaseModel):
+    intent: str
+    hist: Dict[str, str] = {}
+
+
+@app.get("/health")
+def health():
+    return {"ok": True}
+
+
+@app.post("/refine")
+def refine(body: RefineBody):
+    messages = [HumanMessage(content=m.content) if m.role == "user" else AIMessage(content=m.content)
+                for m in body.messages]
+    return {"intent": agent.intent_refinement(messages, body.hist)}
+
+
+@app.post("/answer")
+def answer(body: AnswerBody, request: Request):
+    app_state = request.app.state
+    state = AgentState(user_query=body.intent, schema=app_state.schema, rag_query=body.intent, hist=body.hist)
+    result = app_state.graph.invoke(state)
+    return {"result": result.get("result", "No result.")}
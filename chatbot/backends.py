@@ -0,0 +1,301 @@
+"""
+Lazily imported, lazily connected backends for the agent.
+
+Nothing heavy is imported until a backend is first used (or warmed up in the
+background), so the UI renders immediately and a dead Neo4j only disables the graph
+branch instead of the whole app. Each backend tracks its state and timings, which the
+UI shows as readiness and the profile command prints:
+
+    python backends.py profile            # import time per module, connect time per backend
+    python backends.py profile --isolated # each module imported in a fresh interpreter
+"""
+import argparse
+import importlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+# shared KG access module (one pooled Neo4j driver per process)
+KG_DIR = Path(__file__).resolve().parent.parent / "knowledge_graph"
+if str(KG_DIR) not in sys.path:
+    sys.path.append(str(KG_DIR))
+
+JSON_DIR = "combined.json"
+CHROMA_DIR = "./chroma_db"
+
+PENDING, CONNECTING, READY, FAILED = "pending", "connecting", "ready", "failed"
+
+# a failed backend is not retried until this many seconds have passed
+RETRY_AFTER_S = float(os.getenv("BACKEND_RETRY_AFTER_S", "30"))
+
+# module -> milliseconds spent importing it through timed_import()
+IMPORT_TIMES = {}
+
+
+def timed_import(module: str):
+    # always go through import_module: it waits on a module another warm-up thread
+    # is still initializing instead of handing back the half-built object
+    first = module not in sys.modules
+    start = time.perf_counter()
+    mod = importlib.import_module(module)
+    if first:
+        IMPORT_TIMES.setdefault(module, round((time.perf_counter() - start) * 1000, 1))
+    return mod
+
+
+class Backend:
+    def __init__(self, name: str, factory):
+        self.name = name
+        self.factory = factory
+        self.state = PENDING
+        self.error = None
+        self.connect_ms = None
+        self.value = None
+        self.failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.state == READY:
+            return self.value
+        with self._lock:
+            if self.state == FAILED and time.monotonic() - self.failed_at < RETRY_AFTER_S:
+                raise RuntimeError(f"{self.name} unavailable: {self.error}")
+            if self.state != READY:
+                self._connect()
+        return self.value
+
+    def _connect(self):
+        self.state = CONNECTING
+        start = time.perf_counter()
+        try:
+            self.value = self.factory()
+            self.state = READY
+            self.error = None
+        except Exception as e:
+            self.state = FAILED
+            self.failed_at = time.monotonic()
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self.connect_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def set(self, value):
+        with self._lock:
+            self.value = value
+            self.state = READY
+            self.error = None
+            self.connect_ms = 0.0
+
+    def status(self) -> dict:
+        return {"state": self.state, "connect_ms": self.connect_ms, "error": self.error}
+
+
+def _load_env():
+    timed_import("dotenv").load_dotenv()
+
+
+def _connect_llm():
+    _load_env()
+    genai = timed_import("langchain_google_genai")
+    model_router = timed_import("model_router")
+    # chat models are created per model name on first use, see model_router.DEFAULT_ROUTES
+    return model_router.ModelRouter(lambda name: genai.ChatGoogleGenerativeAI(model=name))
+
+
+def _connect_kg():
+    _load_env()
+    kg_access = timed_import("kg_access")
+    # connects through the shared pooled driver and fetches the schema
+    return kg_access.KnowledgeGraph()
+
+
+# load the json file
+def load_json(filepath):
+    docs = []
+    with open(filepath, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    for item in data:
+        text = f"{item['query']}: {item['mechanism_of_action']}"
+        meta = {"name": item["query"], "source": filepath}
+        docs.append({"text": text, "meta": meta})
+    return docs
+
+
+def create_chroma_db(docs, embeddings):
+    splitters = timed_import("langchain_text_splitters")
+    vectorstores = timed_import("langchain_community.vectorstores")
+    splitter = splitters.RecursiveCharacterTextSplitter(chunk_size = 600, chunk_overlap=100)
+    doc_texts = []
+    doc_metas = []
+    for i in docs:
+        for chunk in splitter.split_text(i["text"]):
+            doc_texts.append(chunk) # get all the text data chunks
+            doc_metas.append(i['meta']) # get all the metadata chunks
+    db = vectorstores.Chroma.from_texts(
+        texts = doc_texts,
+        embedding=embeddings,
+        metadatas=doc_metas,
+        persist_directory=CHROMA_DIR
+    )
+    db.persist()
+    print(f"Finished creating vector store")
+    return db
+
+
+def _connect_vectorstore():
+    _load_env()
+    genai = timed_import("langchain_google_genai")
+    embeddings = genai.GoogleGenerativeAIEmbeddings(model="models/gemini-embedding-001") # google gemini embeddings model
+    if not Path(CHROMA_DIR).exists():
+        docs = load_json(JSON_DIR)
+        if not docs:
+            raise RuntimeError(f"No docs found in {JSON_DIR}")
+        try:
+            db = create_chroma_db(docs, embeddings)
+        except Exception:
+            # don't leave a half-built store behind to be picked up as "existing" next time
+            shutil.rmtree(CHROMA_DIR, ignore_errors=True)
+            raise
+        print(f"Ingested {len(docs)} docs into Chroma")
+        return db
+    print("Using existing ChromaDB")
+    vectorstores = timed_import("langchain_community.vectorstores")
+    return vectorstores.Chroma(persist_directory=CHROMA_DIR, embedding_function=embeddings)
+
+
+def _connect_entities():
+    # the module keeps one index per process and rebuilds it when the node CSVs change
+    return timed_import("entity_index")
+
+
+def _connect_web_search():
+    tools = timed_import("langchain_community.tools")
+    return tools.DuckDuckGoSearchRun(max_results=2)
+
+
+BACKENDS = {
+    "llm": Backend("llm", _connect_llm),
+    "kg_graph": Backend("kg_graph", _connect_kg),
+    "vectorstore": Backend("vectorstore", _connect_vectorstore),
+    "web_search": Backend("web_search", _connect_web_search),
+    "entities": Backend("entities", _connect_entities),
+}
+
+_warmup_lock = threading.Lock()
+_warmup_threads = []
+
+
+def register(name: str, factory):
+    """Add a lazily built resource (agent.py registers the compiled graph this way)"""
+    if name not in BACKENDS:
+        BACKENDS[name] = Backend(name, factory)
+
+
+def get(name: str):
+    return BACKENDS[name].get()
+
+
+def override(**values):
+    """Replace backends with ready-made objects, e.g. the replay fakes"""
+    for name, value in values.items():
+        if value is not None:
+            BACKENDS[name].set(value)
+
+
+def connect_all(names=None):
+    """Connect backends in this thread; failures are recorded on the backend, not raised"""
+    for name in names or list(BACKENDS):
+        try:
+            BACKENDS[name].get()
+        except Exception as e:
+            print(f"[backends] {name} unavailable: {e}")
+
+
+def warm_up(names=None):
+    """Connect backends in background threads (one each, so a slow Neo4j holds up nothing else), once per process"""
+    with _warmup_lock:
+        if not _warmup_threads:
+            for name in names or list(BACKENDS):
+                t = threading.Thread(target=connect_all, args=([name],), name=f"warmup-{name}", daemon=True)
+                _warmup_threads.append(t)
+                t.start()
+    return list(_warmup_threads)
+
+
+def readiness() -> dict:
+    return {name: b.status() for name, b in BACKENDS.items()}
+
+
+PROFILE_MODULES = [
+    "streamlit",
+    "langchain_core.messages",
+    "langchain_core.prompts",
+    "langgraph.graph",
+    "langchain_google_genai",
+    "kg_access",
+    "entity_index",
+    "langchain_community.vectorstores",
+    "langchain_community.tools",
+    "langchain_text_splitters",
+]
+
+
+def isolated_import_ms(module: str):
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(KG_DIR), os.getenv("PYTHONPATH")]))}
+    out = subprocess.run([sys.executable, "-W", "ignore", "-c", code], capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        return None
+    return round(float(out.stdout.strip().splitlines()[-1]), 1)
+
+
+def profile(isolated=False) -> dict:
+    report = {"imports_ms": {}, "backends": {}}
+    if isolated:
+        for module in PROFILE_MODULES:
+            report["imports_ms"][module] = isolated_import_ms(module)
+
+    import agent  # registers the graph backend
+    for name in list(BACKENDS):
+        try:
+            BACKENDS[name].get()
+        except Exception:
+            pass
+        report["backends"][name] = BACKENDS[name].status()
+    if not isolated:
+        # cumulative within this process: shared dependencies count towards the first importer
+        report["imports_ms"] = dict(IMPORT_TIMES)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend diagnostics for the SupplementsRX agent")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("profile", help="import time per module and connect time per backend")
+    p.add_argument("--isolated", action="store_true", help="time each module import in a fresh interpreter")
+    p.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    report = profile(args.isolated)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return 0
+    print("Import time per module (ms)")
+    for module, ms in report["imports_ms"].items():
+        print(f"  {module:<36} {ms if ms is not None else 'failed':>8}")
+    print("Connect time per backend (ms)")
+    for name, st in report["backends"].items():
+        detail = f"  {st['error']}" if st["error"] else ""
+        print(f"  {name:<36} {st['connect_ms'] if st['connect_ms'] is not None else '-':>8}  {st['state']}{detail}")
+    return 0
+
+
+if __name__ == "__main__":
+    # run through the importable module so agent.py and the CLI share one registry
+    import backends
+    exit(backends.main())
@@ -0,0 +1,213 @@
+"""
+Offline replay benchmark for the agent workflow.
+
+Runs the compiled graph from agent.py against the recorded fixtures in fakes.py (no
+Gemini, Neo4j or DuckDuckGo needed) and reports per-node and end-to-end latency,
+token counts and throughput at several concurrency levels. Results are written as
+JSON so runs from different commits can be compared with --compare.
+
+    python benchmark.py --concurrency 1,4,16 --requests 32
+    python benchmark.py --latency llm=300 --compare bench_results/bench-abc1234.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+import agent
+import retrieval_router
+from agent import AgentState
+from fakes import RUN_STATS, load_fakes, load_fixtures, record
+
+DEFAULT_FIXTURES = Path(__file__).parent / "bench_fixtures" / "replay.json"
+
+
+def distribution(samples):
+    """Summary of a list of millisecond samples"""
+    if not samples:
+        return {"n": 0}
+    ordered = sorted(samples)
+
+    def pct(p):
+        # nearest-rank percentile, good enough for the sample sizes we run
+        idx = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+        return round(ordered[idx], 2)
+
+    return {
+        "n": len(ordered),
+        "mean": round(statistics.fmean(ordered), 2),
+        "p50": pct(50),
+        "p90": pct(90),
+        "p95": pct(95),
+        "p99": pct(99),
+        "max": round(ordered[-1], 2),
+    }
+
+
+def timed_node(name, fn):
+    def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return fn(state)
+        finally:
+            record(f"node_ms:{name}", (time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+def run_one(app, query: str, schema: str) -> dict:
+    stats = {}
+    RUN_STATS.set(stats)
+    start = time.perf_counter()
+    try:
+        state = AgentState(user_query=query, schema=schema, rag_query=query, hist={})
+        app.invoke(state)
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {e}"
+    stats["total_ms"] = (time.perf_counter() - start) * 1000
+    return stats
+
+
+def run_level(app, queries, schema: str, concurrency: int, n_requests: int) -> dict:
+    work = [queries[i % len(queries)] for i in range(n_requests)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(lambda q: run_one(app, q, schema), work))
+    wall = time.perf_counter() - start
+
+    ok = [r for r in runs if "error" not in r]
+    node_names = sorted({k.split(":", 1)[1] for r in ok for k in r if k.startswith("node_ms:")})
+    input_tokens = sum(r.get("input_tokens", 0) for r in ok)
+    output_tokens = sum(r.get("output_tokens", 0) for r in ok)
+
+    return {
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": len(runs) - len(ok),
+        "error_samples": sorted({r["error"] for r in runs if "error" in r})[:5],
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(ok) / wall, 3) if wall else 0.0,
+        "end_to_end_ms": distribution([r["total_ms"] for r in ok]),
+        "nodes_ms": {n: distribution([r[f"node_ms:{n}"] for r in ok if f"node_ms:{n}" in r]) for n in node_names},
+        "tokens": {
+            "input": input_tokens,
+            "output": output_tokens,
+            "per_request_input": round(input_tokens / len(ok), 1) if ok else 0,
+            "per_request_output": round(output_tokens / len(ok), 1) if ok else 0,
+            "output_per_s": round(output_tokens / wall, 1) if wall else 0.0,
+        },
+        "backend_calls": {k: sum(r.get(k, 0) for r in ok) for k in ("llm_calls", "kg_calls", "embed_calls", "web_calls")},
+    }
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return "unknown", False
+
+
+def parse_overrides(values):
+    overrides = {}
+    for item in values or []:
+        backend, _, ms = item.partition("=")
+        overrides[backend.strip()] = float(ms)
+    return overrides
+
+
+def compare(current: dict, baseline: dict):
+    """Print p50/p95/throughput deltas against a previous results file"""
+    print(f"\nComparison vs {baseline.get('commit')} ({baseline.get('created')})")
+    base_levels = {lvl["concurrency"]: lvl for lvl in baseline.get("levels", [])}
+    print(f"{'conc':>5} {'metric':<16} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for lvl in current["levels"]:
+        base = base_levels.get(lvl["concurrency"])
+        if not base:
+            continue
+        rows = [
+            ("e2e p50 ms", base["end_to_end_ms"].get("p50"), lvl["end_to_end_ms"].get("p50")),
+            ("e2e p95 ms", base["end_to_end_ms"].get("p95"), lvl["end_to_end_ms"].get("p95")),
+            ("throughput rps", base["throughput_rps"], lvl["throughput_rps"]),
+            ("tokens/request", base["tokens"]["per_request_input"] + base["tokens"]["per_request_output"],
+             lvl["tokens"]["per_request_input"] + lvl["tokens"]["per_request_output"]),
+        ]
+        for name, b, c in rows:
+            if b is None or c is None:
+                continue
+            delta = f"{(c - b) / b * 100:+.1f}%" if b else "n/a"
+            print(f"{lvl['concurrency']:>5} {name:<16} {b:>10} {c:>10} {delta:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline replay benchmark for the SupplementsRX agent")
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--concurrency", default="1,4,16", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=32, help="requests per concurrency level")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every recorded latency")
+    parser.add_argument("--latency", action="append", metavar="BACKEND=MS",
+                        help="fixed latency for a backend (llm, kg, embed, vector, web); repeatable")
+    parser.add_argument("--jitter", type=float, default=None, help="lognormal sigma, overrides the fixture value")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="results file (default bench_results/bench-<commit>.json)")
+    parser.add_argument("--compare", default=None, help="previous results file to diff against")
+    parser.add_argument("--no-routing", action="store_true", help="run every retrieval branch for every query")
+    args = parser.parse_args()
+
+    retrieval_router.LOG_PATH = None
+    if args.no_routing:
+        os.environ["RETRIEVAL_ROUTER"] = "off"
+
+    overrides = parse_overrides(args.latency)
+    fixtures = load_fixtures(args.fixtures)
+    agent.use_backends(**load_fakes(args.fixtures, args.latency_scale, overrides, args.jitter, args.seed))
+    app = agent.build_workflow(node_wrapper=timed_node).compile()
+    schema = agent.kg_schema()
+    queries = fixtures["queries"]
+
+    commit, dirty = git_revision()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "fixtures": str(args.fixtures),
+        "latency_scale": args.latency_scale,
+        "latency_overrides": overrides,
+        "retrieval_routing": retrieval_router.enabled(),
+        "levels": [],
+    }
+
+    router = agent.backends.get("llm")
+    for conc in [int(c) for c in args.concurrency.split(",") if c.strip()]:
+        print(f"Running {args.requests} requests at concurrency {conc}...")
+        router.reset_stats()
+        level = run_level(app, queries, schema, conc, args.requests)
+        # per call site: model that answered, hedges, fallbacks, tokens, latency
+        level["llm_sites"] = router.stats()
+        results["levels"].append(level)
+        e2e = level["end_to_end_ms"]
+        print(f"  {level['throughput_rps']} req/s, e2e p50 {e2e.get('p50')} ms, p95 {e2e.get('p95')} ms, "
+              f"p99 {e2e.get('p99')} ms, errors {level['errors']}")
+        for node, dist in level["nodes_ms"].items():
+            print(f"    {node:<14} p50 {dist.get('p50'):>8} ms  p95 {dist.get('p95'):>8} ms")
+        for site, st in level["llm_sites"].items():
+            print(f"    llm:{site:<10} {st['answered_by']} hedges {st['hedges']} fallbacks {st['fallbacks']}")
+
+    out = Path(args.output or Path("bench_results") / f"bench-{commit}{'-dirty' if dirty else ''}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,217 @@
+"""
+Local stand-ins for Gemini, Neo4j, the Chroma retriever and DuckDuckGo that replay
+recorded fixtures (see bench_fixtures/replay.json) with configurable latency. They are
+plugged into the agent with agent.use_backends(**load_fakes(path)).
+"""
+import json
+import math
+import random
+import re
+import threading
+import time
+import zlib
+import contextvars
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage
+from langchain_core.runnables import Runnable
+
+DEFAULT_LATENCY_MS = {"llm": 700, "kg": 30, "embed": 150, "vector": 10, "web": 900}
+
+# Per-run counters (tokens, backend calls). The caller sets a fresh dict around each
+# workflow invoke; langgraph copies the context into node execution
+RUN_STATS = contextvars.ContextVar("run_stats", default=None)
+
+
+def record(key: str, value=1):
+    stats = RUN_STATS.get()
+    if stats is not None:
+        stats[key] = stats.get(key, 0) + value
+
+
+class Latency:
+    """Sleeps for the recorded latency of a call, scaled, overridden and jittered"""
+
+    def __init__(self, defaults=None, scale=1.0, overrides=None, jitter=0.0, seed=0):
+        self.defaults = {**DEFAULT_LATENCY_MS, **(defaults or {})}
+        self.scale = scale
+        self.overrides = overrides or {}
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self, backend: str, recorded_ms=None):
+        ms = self.overrides.get(backend)
+        if ms is None:
+            ms = recorded_ms if recorded_ms is not None else self.defaults.get(backend, 0)
+        ms *= self.scale
+        if self.jitter and ms > 0:
+            with self._lock:
+                # lognormal keeps the median at the recorded value with a long right tail
+                ms *= self._rng.lognormvariate(0, self.jitter)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def chance(self, p: float) -> bool:
+        with self._lock:
+            return self._rng.random() < p
+
+
+def _first_match(entries, text: str):
+    for entry in entries:
+        pattern = entry.get("match")
+        if pattern is None or re.search(pattern, text, re.IGNORECASE):
+            return entry
+    return None
+
+
+def _prompt_text(prompt) -> str:
+    if hasattr(prompt, "to_string"):
+        return prompt.to_string()
+    if isinstance(prompt, list):
+        return "\n".join(str(getattr(m, "content", m)) for m in prompt)
+    return str(prompt)
+
+
+class ReplayLLM(Runnable):
+    """Chat model fake: returns the first recorded response whose pattern matches the prompt"""
+
+    def __init__(self, responses, latency: Latency, backend="llm", models=None, model=None):
+        self.responses = responses
+        self.latency = latency
+        self.backend = backend
+        self.models = models or {}
+        self.model = model
+
+    def for_model(self, name: str) -> "ReplayLLM":
+        """The same fake under another model name, with that model's latency profile"""
+        return ReplayLLM(self.responses, self.latency, self.backend, self.models, name)
+
+    def invoke(self, input, config=None, **kwargs):
+        text = _prompt_text(input)
+        entry = _first_match(self.responses, text) or {"content": ""}
+        profile = self.models.get(self.model, {})
+        if profile.get("error_rate") and self.latency.chance(profile["error_rate"]):
+            raise RuntimeError(f"429 Resource exhausted ({self.model})")
+        recorded = entry.get("latency_ms", self.latency.defaults.get(self.backend, 0))
+        self.latency.wait(self.backend, recorded * profile.get("latency_scale", 1.0))
+
+        content = entry.get("content", "")
+        # recorded counts where we have them, otherwise the usual ~4 chars per token
+        input_tokens = entry.get("input_tokens", max(1, len(text) // 4))
+        output_tokens = entry.get("output_tokens", max(1, len(content) // 4))
+        record("input_tokens", input_tokens)
+        record("output_tokens", output_tokens)
+        record("llm_calls")
+        if self.model:
+            record(f"llm_calls:{self.model}")
+        return AIMessage(
+            content=content,
+            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                            "total_tokens": input_tokens + output_tokens},
+        )
+
+
+class ReplayGraph:
+    """kg_access.KnowledgeGraph fake: schema plus recorded rows for Cypher matching a pattern"""
+
+    def __init__(self, schema: str, results, latency: Latency):
+        self.schema = schema
+        self.results = results
+        self.latency = latency
+
+    def query(self, query: str, params=None):
+        entry = _first_match(self.results, query) or {"rows": []}
+        self.latency.wait("kg", entry.get("latency_ms"))
+        record("kg_calls")
+        if entry.get("error"):
+            raise RuntimeError(entry["error"])
+        return entry.get("rows", [])
+
+
+class ReplayEmbeddings:
+    """
+    Embeddings fake. Recorded vectors are used when the text matches exactly, anything
+    else gets a hashed bag-of-words vector so similarity still behaves sensibly
+    """
+
+    def __init__(self, recorded, dim: int, latency: Latency):
+        self.recorded = recorded
+        self.dim = dim
+        self.latency = latency
+
+    def _hash_vector(self, text: str):
+        vec = [0.0] * self.dim
+        for word in re.findall(r"\w+", text.lower()):
+            vec[zlib.crc32(word.encode()) % self.dim] += 1.0
+        return vec
+
+    def embed_query(self, text: str):
+        self.latency.wait("embed")
+        record("embed_calls")
+        return self.recorded.get(text) or self._hash_vector(text)
+
+    def embed_documents(self, texts):
+        return [self.recorded.get(t) or self._hash_vector(t) for t in texts]
+
+
+def _cosine(a, b) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+class ReplayVectorStore:
+    """Chroma fake: brute-force cosine search over the fixture passages"""
+
+    def __init__(self, docs, embeddings: ReplayEmbeddings, latency: Latency):
+        self.embeddings = embeddings
+        self.latency = latency
+        texts = [d["text"] for d in docs]
+        self.docs = [Document(page_content=d["text"], metadata=d.get("meta", {})) for d in docs]
+        self.vectors = embeddings.embed_documents(texts)
+
+    def similarity_search(self, query: str, k: int = 4):
+        qvec = self.embeddings.embed_query(query)
+        self.latency.wait("vector")
+        scored = sorted(zip(self.vectors, self.docs), key=lambda p: _cosine(qvec, p[0]), reverse=True)
+        return [doc for _, doc in scored[:k]]
+
+
+class ReplaySearch:
+    """DuckDuckGoSearchRun fake"""
+
+    def __init__(self, snippets, latency: Latency):
+        self.snippets = snippets
+        self.latency = latency
+
+    def run(self, query: str) -> str:
+        entry = _first_match(self.snippets, query) or {"snippet": ""}
+        self.latency.wait("web", entry.get("latency_ms"))
+        record("web_calls")
+        return entry.get("snippet", "")
+
+
+def load_fixtures(path) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_fakes(path, latency_scale=1.0, latency_overrides=None, jitter=None, seed=0) -> dict:
+    """Build the replay backends from a fixture file, keyed like agent.use_backends()"""
+    fx = load_fixtures(path)
+    latency = Latency(
+        defaults=fx.get("latency_ms"),
+        scale=latency_scale,
+        overrides=latency_overrides,
+        jitter=fx.get("jitter", 0.0) if jitter is None else jitter,
+        seed=seed,
+    )
+    emb = fx.get("embeddings", {})
+    embeddings = ReplayEmbeddings(emb.get("recorded", {}), emb.get("dim", 64), latency)
+    return {
+        "llm": ReplayLLM(fx.get("llm", []), latency, models=fx.get("models")),
+        "kg_graph": ReplayGraph(fx.get("schema", ""), fx.get("cypher", []), latency),
+        "vectorstore": ReplayVectorStore(fx.get("rag_docs", []), embeddings, latency),
+        "web_search": ReplaySearch(fx.get("web", []), latency),
+    }
@@ -0,0 +1,283 @@
+"""
+Concurrent-user load generator for the agent.
+
+Each virtual user walks the same flow as the Streamlit app: send a message, get the
+refined intent, think, press Accept, get the answer, think, repeat. Users are ramped
+in stages (--users 1,2,4,...) and every stage reports throughput, latency
+percentiles per step, error/timeout rates and whether the process has saturated.
+
+Targets:
+    in-process (default)  the compiled graph from agent.py with the replay fakes
+                          from fakes.py; --live kg,llm,... keeps real backends instead
+    http                  agent_service.py (or anything speaking /refine and /answer)
+
+    python loadtest.py --users 1,2,4,8,16,32 --stage-seconds 30 --think 3
+    python loadtest.py --target http --url http://localhost:8001
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+import agent
+import retrieval_router
+from agent import AgentState
+from benchmark import DEFAULT_FIXTURES, distribution, git_revision, parse_overrides
+from fakes import load_fakes, load_fixtures
+from langchain_core.messages import HumanMessage, AIMessage
+
+BACKENDS = ("llm", "kg_graph", "vectorstore", "web_search")
+
+
+class StepTimeout(Exception):
+    pass
+
+
+class InProcessTarget:
+    def __init__(self):
+        self.graph = agent.compiled_graph()
+        self.schema = agent.kg_schema()
+
+    def refine(self, messages, hist, timeout):
+        msgs = [HumanMessage(content=m["content"]) if m["role"] == "user" else AIMessage(content=m["content"])
+                for m in messages]
+        return agent.intent_refinement(msgs, hist)
+
+    def answer(self, intent, hist, timeout):
+        state = AgentState(user_query=intent, schema=self.schema, rag_query=intent, hist=hist)
+        return self.graph.invoke(state).get("result", "No result.")
+
+
+class HttpTarget:
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+
+    def _post(self, path, payload, timeout):
+        req = urllib.request.Request(
+            self.url + path,
+            data=json.dumps(payload).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=timeout) as resp:
+                return json.loads(resp.read())
+        except (socket.timeout, TimeoutError) as e:
+            raise StepTimeout(str(e))
+        except urllib.error.URLError as e:
+            if isinstance(e.reason, (socket.timeout, TimeoutError)):
+                raise StepTimeout(str(e))
+            raise
+
+    def refine(self, messages, hist, timeout):
+        return self._post("/refine", {"messages": messages, "hist": hist}, timeout)["intent"]
+
+    def answer(self, intent, hist, timeout):
+        return self._post("/answer", {"intent": intent, "hist": hist}, timeout)["result"]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def add(self, step, ms, status):
+        with self.lock:
+            self.samples.append({"step": step, "ms": ms, "status": status})
+
+
+def timed_step(recorder, step, timeout, fn, *args):
+    start = time.perf_counter()
+    try:
+        out = fn(*args, timeout)
+    except StepTimeout:
+        recorder.add(step, (time.perf_counter() - start) * 1000, "timeout")
+        return None
+    except Exception:
+        recorder.add(step, (time.perf_counter() - start) * 1000, "error")
+        return None
+    ms = (time.perf_counter() - start) * 1000
+    # in-process calls can't be cancelled, so a slow call only counts as a timeout afterwards
+    recorder.add(step, ms, "timeout" if ms > timeout * 1000 else "ok")
+    return out if ms <= timeout * 1000 else None
+
+
+def virtual_user(target, queries, rng, deadline, think_s, timeout, recorder):
+    hist = {}
+
+    def think():
+        if think_s > 0:
+            # lognormal think time, median think_s, capped so a stage can still end
+            time.sleep(min(rng.lognormvariate(0, 0.5) * think_s, max(0.0, deadline - time.monotonic())))
+
+    while time.monotonic() < deadline:
+        messages = [{"role": "user", "content": rng.choice(queries)}]
+        flow_start = time.perf_counter()
+        intent = timed_step(recorder, "refine", timeout, target.refine, messages, dict(hist))
+        if intent is None:
+            think()
+            continue
+        think()  # reading the proposed intent before pressing Accept
+        if time.monotonic() >= deadline:
+            break
+        output = timed_step(recorder, "answer", timeout, target.answer, intent, dict(hist))
+        if output is not None:
+            recorder.add("flow", (time.perf_counter() - flow_start) * 1000, "ok")
+            # same two-entry history window as the Streamlit app
+            hist[intent] = output
+            if len(hist) > 2:
+                del hist[next(iter(hist))]
+        think()
+
+
+def run_stage(target, queries, users, seconds, think_s, timeout, seed) -> dict:
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + seconds
+    threads = []
+    for i in range(users):
+        rng = random.Random(seed * 10007 + i)
+        t = threading.Thread(target=virtual_user, args=(target, queries, rng, deadline, think_s, timeout, recorder), daemon=True)
+        threads.append(t)
+        t.start()
+        # spread user arrivals over the first tenth of the stage
+        time.sleep(seconds * 0.1 / users)
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - start
+
+    steps = {}
+    for step in ("refine", "answer"):
+        rows = [s for s in recorder.samples if s["step"] == step]
+        n = len(rows)
+        steps[step] = {
+            "requests": n,
+            "latency_ms": distribution([s["ms"] for s in rows if s["status"] == "ok"]),
+            "error_rate": round(sum(s["status"] == "error" for s in rows) / n, 4) if n else 0.0,
+            "timeout_rate": round(sum(s["status"] == "timeout" for s in rows) / n, 4) if n else 0.0,
+        }
+    flows = [s["ms"] for s in recorder.samples if s["step"] == "flow"]
+    total = sum(steps[s]["requests"] for s in steps)
+    failed = sum(1 for s in recorder.samples if s["step"] != "flow" and s["status"] != "ok")
+
+    return {
+        "users": users,
+        "wall_s": round(wall, 2),
+        "completed_flows": len(flows),
+        "throughput_rps": round(len(flows) / wall, 3),
+        "request_rps": round(total / wall, 3),
+        "failure_rate": round(failed / total, 4) if total else 0.0,
+        "flow_ms": distribution(flows),
+        "steps": steps,
+    }
+
+
+def find_saturation(stages, slo_ms, max_failure_rate, min_scaling) -> dict:
+    """
+    A stage is saturated when it breaks the latency SLO or failure budget, or when
+    throughput stops keeping up with the added users (scaling efficiency < min_scaling)
+    """
+    capacity = None
+    for prev, cur in zip([None] + stages[:-1], stages):
+        reasons = []
+        p99 = cur["steps"]["answer"]["latency_ms"].get("p99")
+        if slo_ms and p99 is not None and p99 > slo_ms:
+            reasons.append(f"answer p99 {p99} ms > SLO {slo_ms} ms")
+        if cur["failure_rate"] > max_failure_rate:
+            reasons.append(f"failure rate {cur['failure_rate']:.2%} > {max_failure_rate:.2%}")
+        if prev and prev["throughput_rps"] > 0:
+            efficiency = (cur["throughput_rps"] / prev["throughput_rps"]) / (cur["users"] / prev["users"])
+            cur["scaling_efficiency"] = round(efficiency, 3)
+            if efficiency < min_scaling:
+                reasons.append(f"scaling efficiency {efficiency:.2f} < {min_scaling}")
+        if reasons:
+            return {
+                "saturated_at_users": cur["users"],
+                "reasons": reasons,
+                "capacity_users": capacity["users"] if capacity else 0,
+                "capacity_rps": capacity["throughput_rps"] if capacity else 0.0,
+            }
+        capacity = cur
+    return {
+        "saturated_at_users": None,
+        "reasons": ["not saturated at the highest stage, add more users"],
+        "capacity_users": capacity["users"] if capacity else 0,
+        "capacity_rps": capacity["throughput_rps"] if capacity else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load generator for the SupplementsRX agent")
+    parser.add_argument("--target", choices=["inproc", "http"], default="inproc")
+    parser.add_argument("--url", default="http://localhost:8001", help="agent_service.py base url for --target http")
+    parser.add_argument("--users", default="1,2,4,8,16,32", help="virtual users per stage")
+    parser.add_argument("--stage-seconds", type=float, default=30.0)
+    parser.add_argument("--think", type=float, default=3.0, help="median think time in seconds")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--slo-ms", type=float, default=None, help="answer p99 latency budget")
+    parser.add_argument("--max-failure-rate", type=float, default=0.01)
+    parser.add_argument("--min-scaling", type=float, default=0.5,
+                        help="throughput gain per added user below which a stage counts as saturated")
+    parser.add_argument("--fixtures", default=str(DEFAULT_FIXTURES))
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--latency", action="append", metavar="BACKEND=MS")
+    parser.add_argument("--live", default="", help=f"backends to keep live in-process: {','.join(BACKENDS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    queries = load_fixtures(args.fixtures)["queries"]
+    retrieval_router.LOG_PATH = None
+    if args.target == "http":
+        target = HttpTarget(args.url)
+    else:
+        live = {b.strip() for b in args.live.split(",") if b.strip()}
+        unknown = live - set(BACKENDS)
+        if unknown:
+            parser.error(f"unknown --live backends: {','.join(sorted(unknown))} (expected {','.join(BACKENDS)})")
+        if live:
+            # only the live ones: the rest are about to be replaced by fakes
+            agent.init_backends(sorted(live))
+        fakes = load_fakes(args.fixtures, args.latency_scale, parse_overrides(args.latency), seed=args.seed)
+        agent.use_backends(**{k: v for k, v in fakes.items() if k not in live})
+        target = InProcessTarget()
+
+    stages = []
+    for users in [int(u) for u in args.users.split(",") if u.strip()]:
+        print(f"Stage: {users} users for {args.stage_seconds}s...")
+        stage = run_stage(target, queries, users, args.stage_seconds, args.think, args.timeout, args.seed)
+        stages.append(stage)
+        ans = stage["steps"]["answer"]["latency_ms"]
+        print(f"  {stage['throughput_rps']} flows/s, answer p50 {ans.get('p50')} ms p99 {ans.get('p99')} ms, "
+              f"failures {stage['failure_rate']:.2%}")
+
+    saturation = find_saturation(stages, args.slo_ms, args.max_failure_rate, args.min_scaling)
+    print(f"Capacity: {saturation['capacity_users']} users ({saturation['capacity_rps']} flows/s); "
+          f"saturated at {saturation['saturated_at_users']}: {'; '.join(saturation['reasons'])}")
+
+    commit, dirty = git_revision()
+    results = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "target": args.url if args.target == "http" else "inproc",
+        "live_backends": args.live,
+        "think_s": args.think,
+        "timeout_s": args.timeout,
+        "stages": stages,
+        "saturation": saturation,
+    }
+    out = Path(args.output or Path("bench_results") / f"load-{commit}{'-dirty' if dirty else ''}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,241 @@
+"""
+Per-call-site model routing for the agent's LLM calls.
+
+Each call site (intent refinement, Cypher generation, final synthesis) has an ordered
+list of models. The first model is tried first; the next one is used when:
+  - the first is at its concurrency limit and the next has room (when every model is
+    full the call waits up to MODEL_SLOT_TIMEOUT_S for the first one),
+  - the call fails (rate limit, server error), or
+  - the call is slower than the site's hedge threshold (by default the observed p95
+    for that site and model), in which case the next model is raced against it
+    and whichever answers first wins.
+
+Routes and limits can be overridden with the MODEL_ROUTES / MODEL_LIMITS environment
+variables (JSON), e.g. MODEL_ROUTES='{"final": {"models": ["gemini-2.5-flash"]}}'.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from langchain_core.runnables import Runnable
+
+DEFAULT_ROUTES = {
+    # structured, short outputs: small model first, big model as fallback/hedge
+    "intent": {"models": ["gemini-2.0-flash-lite", "gemini-2.0-flash"], "hedge_after_ms": "p95"},
+    "cypher": {"models": ["gemini-2.0-flash-lite", "gemini-2.0-flash"], "hedge_after_ms": "p95"},
+    # answer synthesis keeps the larger model
+    "final": {"models": ["gemini-2.0-flash", "gemini-2.0-flash-lite"], "hedge_after_ms": "p95"},
+}
+
+# max in-flight requests per model in this process
+DEFAULT_LIMITS = {"gemini-2.0-flash": 8, "gemini-2.0-flash-lite": 16}
+# how long a call waits for a slot when every model of its site is at its limit
+SLOT_TIMEOUT_S = float(os.getenv("MODEL_SLOT_TIMEOUT_S", "30"))
+
+# until a site/model has this many samples its p95 isn't trusted and the default applies
+MIN_SAMPLES = 20
+DEFAULT_HEDGE_MS = 4000.0
+
+
+def load_routes() -> dict:
+    routes = {site: dict(cfg) for site, cfg in DEFAULT_ROUTES.items()}
+    for site, cfg in json.loads(os.getenv("MODEL_ROUTES", "{}")).items():
+        routes[site] = {**routes.get(site, {}), **cfg}
+    return routes
+
+
+def load_limits() -> dict:
+    return {**DEFAULT_LIMITS, **json.loads(os.getenv("MODEL_LIMITS", "{}"))}
+
+
+def _percentile(samples, p):
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[idx]
+
+
+class SiteStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.hedges = 0
+        self.fallbacks = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.wins = defaultdict(int)
+        self.latency = deque(maxlen=500)
+
+    def snapshot(self) -> dict:
+        lat = list(self.latency)
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "fallbacks": self.fallbacks,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "answered_by": dict(self.wins),
+            "latency_ms": {
+                "p50": round(_percentile(lat, 50), 1),
+                "p95": round(_percentile(lat, 95), 1),
+            } if lat else {},
+        }
+
+
+class ModelRouter:
+    def __init__(self, model_factory, routes=None, limits=None, max_workers=64, slot_timeout=SLOT_TIMEOUT_S):
+        self.model_factory = model_factory
+        self.routes = routes or load_routes()
+        self.limits = limits or load_limits()
+        self.slot_timeout = slot_timeout
+        self._models = {}
+        self._slots = {}  # model -> BoundedSemaphore(limit)
+        self._model_latency = defaultdict(lambda: deque(maxlen=200))  # (site, model) -> ms
+        self._stats = defaultdict(SiteStats)
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm")
+
+    def for_site(self, site: str) -> "RoutedLLM":
+        return RoutedLLM(self, site)
+
+    def _model(self, name):
+        with self._lock:
+            if name not in self._models:
+                self._models[name] = self.model_factory(name)
+            return self._models[name]
+
+    def _slot(self, model) -> threading.BoundedSemaphore:
+        with self._lock:
+            if model not in self._slots:
+                self._slots[model] = threading.BoundedSemaphore(self.limits.get(model, 8))
+            return self._slots[model]
+
+    def _acquire(self, model, timeout=None) -> bool:
+        """Take one of the model's slots; without a timeout only if one is free right now"""
+        slot = self._slot(model)
+        return slot.acquire(timeout=timeout) if timeout is not None else slot.acquire(blocking=False)
+
+    def _call(self, site, model, input):
+        # the caller took the model's slot before submitting, so no pool thread waits for one
+        start = time.perf_counter()
+        try:
+            return self._model(model).invoke(input), model
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self._slot(model).release()
+            with self._lock:
+                self._model_latency[(site, model)].append(ms)
+
+    def _hedge_after(self, site, model, route):
+        setting = route.get("hedge_after_ms", "p95")
+        if setting is None or setting is False:
+            return None
+        if isinstance(setting, (int, float)):
+            return float(setting)
+        with self._lock:
+            samples = list(self._model_latency[(site, model)])
+        if len(samples) < MIN_SAMPLES:
+            return float(route.get("hedge_default_ms", DEFAULT_HEDGE_MS))
+        return _percentile(samples, int(str(setting).lstrip("p") or 95))
+
+    def _submit(self, site, model, input):
+        ctx = contextvars.copy_context()  # keep per-request context (e.g. benchmark counters)
+        return self._pool.submit(ctx.run, self._call, site, model, input)
+
+    def _next_free(self, models: list):
+        """Pop models off the front until one has a free slot (taken); None when none has"""
+        while models:
+            model = models.pop(0)
+            if self._acquire(model):
+                return model
+        return None
+
+    def _fail(self, site, error):
+        with self._lock:
+            stats = self._stats[site]
+            stats.calls += 1
+            stats.errors += 1
+        raise error
+
+    def invoke(self, site: str, input):
+        route = self.routes.get(site) or self.routes["final"]
+        models = list(route["models"])
+        start = time.perf_counter()
+
+        # skip ahead past models that are at their concurrency limit; when all are, wait for the first
+        remaining = list(models)
+        first = self._next_free(remaining)
+        if first is None:
+            first, remaining = models[0], models[1:]
+            if not self._acquire(first, timeout=self.slot_timeout):
+                self._fail(site, TimeoutError(f"every model for {site} stayed at its concurrency limit "
+                                              f"for {self.slot_timeout}s"))
+        pending = {self._submit(site, first, input)}
+        hedge_ms = self._hedge_after(site, first, route)
+        hedged = fell_back = False
+        error = None
+
+        while pending:
+            timeout = None
+            if remaining and not hedged and hedge_ms is not None:
+                timeout = max(0.0, hedge_ms / 1000 - (time.perf_counter() - start))
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                try:
+                    result, model = fut.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self._account(site, model, result, start, hedged, fell_back)
+                return result
+
+            if not done:
+                # too slow: race the next model with a free slot against the one in flight (none left
+                # in remaining afterwards if none had one, so this happens once)
+                model = self._next_free(remaining)
+                if model is not None:
+                    hedged = True
+                    pending.add(self._submit(site, model, input))
+            elif not pending and remaining:
+                # failed: fall back to the next model with a free slot
+                model = self._next_free(remaining)
+                if model is not None:
+                    fell_back = True
+                    pending.add(self._submit(site, model, input))
+
+        self._fail(site, error)
+
+    def _account(self, site, model, result, start, hedged, fell_back):
+        usage = getattr(result, "usage_metadata", None) or {}
+        with self._lock:
+            stats = self._stats[site]
+            stats.calls += 1
+            stats.hedges += hedged
+            stats.fallbacks += fell_back
+            stats.wins[model] += 1
+            stats.input_tokens += usage.get("input_tokens", 0)
+            stats.output_tokens += usage.get("output_tokens", 0)
+            stats.latency.append((time.perf_counter() - start) * 1000)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {site: s.snapshot() for site, s in self._stats.items()}
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class RoutedLLM(Runnable):
+    """Runnable bound to one call site, so it drops into `prompt | llm` chains"""
+
+    def __init__(self, router: ModelRouter, site: str):
+        self.router = router
+        self.site = site
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.router.invoke(self.site, input)
@@ -0,0 +1,133 @@
+"""
+Decides which retrieval branches (kg, rag, web) an accepted intent needs.
+
+Ordered keyword rules over the intent text; the first rule that matches wins and the
+fallback runs everything. Every decision is appended to ROUTE_LOG (JSONL, default
+chatbot/logs/route_log.jsonl, rotated at ROUTE_LOG_MAX_MB with ROUTE_LOG_BACKUPS old
+files kept). With ROUTE_LOG_ANSWERS=on the final answer is logged too, so routing can be
+checked against answer quality offline:
+
+    python retrieval_router.py classify "what supplements help with anemia"
+    python retrieval_router.py report logs/route_log.jsonl
+
+Set RETRIEVAL_ROUTER=off to always run all branches (e.g. for A/B benchmarks).
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+ALL_BRANCHES = ("kg", "rag", "web")
+
+# (rule name, pattern, branches). The KG only holds supplement -> relation -> condition
+# triples, RAG holds mechanism-of-action text, the web covers everything else.
+RULES = [
+    ("dosage", r"\b(dos(e|age|ing)|how much|how many|mg|mcg|iu|daily (amount|intake)|per day|"
+               r"side effects?|interactions?|safe to take|overdose|toxicity)\b", ("rag", "web")),
+    ("condition_lookup", r"\b(what|which|find|list)\b.*\b(supplements?|vitamins?|minerals?)\b.*"
+                         r"\b(for|treat|help|prevent|manage|indicated)", ("kg",)),
+    ("supplement_uses", r"\b(what|which) (conditions?|diseases?|symptoms?)\b|\bused (to treat|for)\b|"
+                        r"\b(treats?|helps? with|indicated for|prevents?)\b", ("kg", "rag")),
+    ("mechanism", r"\b(how does|mechanism|works?|absorb(ed|tion)?|metaboli[sz]|biochemi)", ("rag",)),
+    ("current_info", r"\b(latest|recent|news|new stud(y|ies)|research|brand|price|buy|where to get|recall)\b", ("rag", "web")),
+]
+_COMPILED = [(name, re.compile(pattern, re.IGNORECASE), branches) for name, pattern, branches in RULES]
+
+LOG_DIR = Path(__file__).resolve().parent / "logs"
+LOG_PATH = os.getenv("ROUTE_LOG", str(LOG_DIR / "route_log.jsonl"))
+LOG_MAX_BYTES = int(float(os.getenv("ROUTE_LOG_MAX_MB", "10")) * 1024 * 1024)
+LOG_BACKUPS = int(os.getenv("ROUTE_LOG_BACKUPS", "3"))
+# answers can hold whatever the user asked about, so they're only kept when asked for
+LOG_ANSWERS = os.getenv("ROUTE_LOG_ANSWERS", "off").lower() in ("on", "1", "true")
+_log_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return os.getenv("RETRIEVAL_ROUTER", "on").lower() not in ("off", "0", "false")
+
+
+def route(intent: str) -> dict:
+    if enabled():
+        for name, pattern, branches in _COMPILED:
+            if pattern.search(intent or ""):
+                return {"rule": name, "branches": list(branches)}
+        return {"rule": "default", "branches": list(ALL_BRANCHES)}
+    return {"rule": "disabled", "branches": list(ALL_BRANCHES)}
+
+
+def _rotate(path: Path):
+    """route_log.jsonl -> .1 -> .2 ... once it passes LOG_MAX_BYTES, dropping the oldest"""
+    if not path.exists() or path.stat().st_size < LOG_MAX_BYTES:
+        return
+    if LOG_BACKUPS <= 0:
+        path.unlink()
+        return
+    for i in range(LOG_BACKUPS - 1, 0, -1):
+        older = path.with_name(f"{path.name}.{i}")
+        if older.exists():
+            older.replace(path.with_name(f"{path.name}.{i + 1}"))
+    path.replace(path.with_name(f"{path.name}.1"))
+
+
+def log_decision(intent: str, decision: dict, answer: str = None):
+    if not LOG_PATH:
+        return
+    entry = {"ts": time.time(), "intent": intent, **decision}
+    if LOG_ANSWERS:
+        entry["answer"] = answer
+    path = Path(LOG_PATH)
+    with _log_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _rotate(path)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def report(path: str) -> dict:
+    """Branch usage in a decision log, and how the current rules would route the same intents"""
+    rules, branch_sets, changed = Counter(), Counter(), 0
+    skipped = Counter()
+    total = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            total += 1
+            rules[entry["rule"]] += 1
+            branch_sets["+".join(entry["branches"])] += 1
+            for b in ALL_BRANCHES:
+                skipped[b] += b not in entry["branches"]
+            if route(entry["intent"])["branches"] != entry["branches"]:
+                changed += 1
+    return {
+        "decisions": total,
+        "rules": dict(rules),
+        "branch_sets": dict(branch_sets),
+        "skip_rate": {b: round(skipped[b] / total, 3) if total else 0.0 for b in ALL_BRANCHES},
+        "would_change_with_current_rules": changed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval branch router")
+    sub = parser.add_subparsers(dest="command", required=True)
+    c = sub.add_parser("classify")
+    c.add_argument("intent")
+    r = sub.add_parser("report")
+    r.add_argument("path", nargs="?", default=LOG_PATH)
+    args = parser.parse_args()
+
+    if args.command == "classify":
+        print(json.dumps(route(args.intent)))
+    else:
+        print(json.dumps(report(args.path), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,18 +1,12 @@
-from neo4j import GraphDatabase
+import kg_access
 
-URI = "bolt://localhost:7687"
-AUTH = ("neo4j", "neo4jpassword")
-
-driver = GraphDatabase.driver(URI, auth=AUTH)
-
-def run(q, params=None):
-    with driver.session() as s:
-        return s.run(q, params or {}).data()
-
-print(run("""
+print(kg_access.read("""
 MATCH (s:Supplement)-[r:TREATS]->(c:Condition)
 RETURN s.id AS supplement_id, c.id AS condition_id
 LIMIT 5
 """))
 
-driver.close()
\ No newline at end of file
+print(kg_access.treats("magnesium", limit=5))
+print(kg_access.pool_metrics())
+
+kg_access.close()
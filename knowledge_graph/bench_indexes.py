@@ -0,0 +1,189 @@
+"""
+Before/after benchmark for the full-text and relationship property indexes.
+
+Loads a synthetic graph (default 100k nodes) next to whatever is in the database,
+times name search and top-confidence queries with the indexes dropped, creates
+them, times the same workload again and prints latency and db hits side by side.
+Synthetic nodes carry `synthetic: true` and are deleted afterwards unless --keep.
+Use a scratch database (NEO4J_DATABASE): the indexes are dropped during the run.
+
+    python bench_indexes.py --nodes 100000 --edges-per-supplement 10 --repeats 20
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import kg_access
+
+METHODS = ["condition", "llm", "pattern", "manual"]
+REL_TYPES = list(kg_access.INDEXED_REL_TYPES)
+WORDS = [
+    "magnesium", "zinc", "iron", "calcium", "selenium", "vitamin", "omega", "ginseng", "turmeric", "melatonin",
+    "probiotic", "collagen", "biotin", "folate", "iodine", "chromium", "potassium", "echinacea", "ginkgo", "garlic",
+    "hypertension", "anemia", "diabetes", "migraine", "insomnia", "arthritis", "asthma", "eczema", "depression",
+    "anxiety", "osteoporosis", "obesity", "fatigue", "acne", "gout", "psoriasis", "cholesterol", "neuropathy",
+]
+
+
+def synthetic_graph(n_nodes: int, edges_per_supplement: int, seed: int):
+    rng = random.Random(seed)
+    n_supp = n_nodes // 5
+    supplements = [{"id": f"syn-s{i}", "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} s{i}"} for i in range(n_supp)]
+    conditions = [{"id": f"syn-c{i}", "name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} c{i}"}
+                  for i in range(n_nodes - n_supp)]
+    edges = {rel: [] for rel in REL_TYPES}
+    for s in supplements:
+        for c in rng.sample(conditions, edges_per_supplement):
+            edges[rng.choice(REL_TYPES)].append({
+                "sid": s["id"], "cid": c["id"],
+                "confidence": round(rng.betavariate(2, 2), 4),
+                "method": rng.choice(METHODS),
+            })
+    return supplements, conditions, edges
+
+
+def batched(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def load(supplements, conditions, edges, batch_size: int):
+    start = time.perf_counter()
+    for label, rows in (("Supplement", supplements), ("Condition", conditions)):
+        kg_access.write_batches(
+            f"UNWIND $rows AS row CREATE (n:{label} {{id: row.id, name: row.name, synthetic: true}})",
+            batched(rows, batch_size))
+    for rel, rows in edges.items():
+        kg_access.write_batches(f"""
+        UNWIND $rows AS row
+        MATCH (s:Supplement {{id: row.sid}}), (c:Condition {{id: row.cid}})
+        CREATE (s)-[:{rel} {{confidence: row.confidence, extraction_method: row.method}}]->(c)
+        """, batched(rows, batch_size))
+    return time.perf_counter() - start
+
+
+def cleanup():
+    with kg_access.get_driver().session(database=kg_access._database()) as session:
+        # CALL ... IN TRANSACTIONS needs an auto-commit transaction
+        session.run("""
+        MATCH (n) WHERE n.synthetic
+        CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 10000 ROWS
+        """).consume()
+
+
+def db_hits(plan) -> int:
+    if plan is None:
+        return 0
+    return plan.get("dbHits", 0) + sum(db_hits(child) for child in plan.get("children", []))
+
+
+def profile(query: str, params: dict) -> int:
+    def work(tx):
+        return tx.run("PROFILE " + query, params).consume().profile
+    return db_hits(kg_access._managed(lambda s: s.execute_read, work))
+
+
+def time_queries(query: str, param_sets, repeats: int) -> dict:
+    kg_access.read(query, param_sets[0])  # warm the plan cache
+    samples = []
+    for i in range(repeats):
+        params = param_sets[i % len(param_sets)]
+        start = time.perf_counter()
+        kg_access.read(query, params)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 2),
+        "db_hits": profile(query, param_sets[0]),
+    }
+
+
+NAME_SCAN = """
+MATCH (n:Supplement) WHERE toLower(n.name) CONTAINS $q
+RETURN n.id AS id, n.name AS name LIMIT 10
+"""
+NAME_SEARCH = """
+CALL db.index.fulltext.queryNodes($index, $lucene, {limit: 40}) YIELD node, score
+WHERE 'Supplement' IN labels(node)
+RETURN node.id AS id, node.name AS name, score ORDER BY score DESC LIMIT 10
+"""
+TOP_CONFIDENCE = """
+MATCH (s:Supplement)-[r:TREATS]->(c:Condition)
+WHERE r.confidence >= $min_conf
+RETURN s.id AS supplement_id, c.id AS condition_id, r.confidence AS confidence
+ORDER BY r.confidence DESC LIMIT 25
+"""
+BY_METHOD = """
+MATCH (s:Supplement)-[r:INDICATED_FOR]->(c:Condition)
+WHERE r.extraction_method = $method
+RETURN s.id AS supplement_id, c.id AS condition_id, r.confidence AS confidence
+LIMIT 25
+"""
+
+
+def workload(indexed: bool):
+    terms = ["magnesium zinc", "vitamin", "ginseng", "turmeric omega"]
+    if indexed:
+        name = (NAME_SEARCH, [{"index": kg_access.FULLTEXT_INDEX, "lucene": kg_access.lucene_query(t)} for t in terms])
+    else:
+        name = (NAME_SCAN, [{"q": t} for t in terms])
+    return {
+        "name_search": name,
+        "top_confidence": (TOP_CONFIDENCE, [{"min_conf": c} for c in (0.97, 0.95, 0.9)]),
+        "by_method": (BY_METHOD, [{"method": m} for m in METHODS]),
+    }
+
+
+def run_workload(indexed: bool, repeats: int) -> dict:
+    return {name: time_queries(q, params, repeats) for name, (q, params) in workload(indexed).items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index before/after benchmark on a synthetic KG")
+    parser.add_argument("--nodes", type=int, default=100_000)
+    parser.add_argument("--edges-per-supplement", type=int, default=10)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="leave the synthetic graph and indexes in place")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    for stmt in kg_access.CONSTRAINTS:
+        kg_access.write(stmt)
+    supplements, conditions, edges = synthetic_graph(args.nodes, args.edges_per_supplement, args.seed)
+    n_edges = sum(len(rows) for rows in edges.values())
+    print(f"Loading {len(supplements) + len(conditions)} nodes, {n_edges} relationships...")
+    print(f"  loaded in {load(supplements, conditions, edges, args.batch_size):.1f}s")
+
+    try:
+        kg_access.drop_indexes()
+        before = run_workload(indexed=False, repeats=args.repeats)
+        start = time.perf_counter()
+        kg_access.ensure_indexes()
+        build_s = time.perf_counter() - start
+        after = run_workload(indexed=True, repeats=args.repeats)
+    finally:
+        if not args.keep:
+            cleanup()
+        kg_access.close()
+
+    print(f"\nIndexes built in {build_s:.1f}s")
+    print(f"{'query':<16} {'before p50':>11} {'after p50':>10} {'before p95':>11} {'after p95':>10} "
+          f"{'before hits':>12} {'after hits':>11}")
+    for name in before:
+        b, a = before[name], after[name]
+        print(f"{name:<16} {b['p50_ms']:>11} {a['p50_ms']:>10} {b['p95_ms']:>11} {a['p95_ms']:>10} "
+              f"{b['db_hits']:>12} {a['db_hits']:>11}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"nodes": args.nodes, "relationships": n_edges, "index_build_s": round(build_s, 2),
+                       "before": before, "after": after}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
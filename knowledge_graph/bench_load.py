@@ -0,0 +1,154 @@
+"""
+Load throughput: data/setup.cypher (LOAD CSV) vs load_kg.py (batched UNWIND) on the
+same synthetic extraction output.
+
+Synthetic CSVs are written under data/bench_load/ (inside the container's import
+mount, so LOAD CSV can read them) with relation types in the proportions of the real
+edges_detailed.csv. Each loader runs on an empty slice of the graph: synthetic ids
+start with "bench-" and are deleted before, between and after the runs.
+
+    python bench_load.py --triples 200000 --workers 4 --batch-size 2000
+"""
+import argparse
+import csv
+import json
+import random
+import shutil
+import time
+from collections import Counter
+from pathlib import Path
+import kg_access
+from load_kg import DATA_DIR, EDGES_FILE, Loader
+
+BENCH_DIR = DATA_DIR / "bench_load"
+SOURCE_PREFIX = "https://bench.invalid/"
+EDGE_COLUMNS = ["supplement_id", "supplement_name", "relation_type", "condition_id", "condition_name",
+                "confidence", "extraction_method", "source_url", "evidence_text"]
+
+
+def relation_weights() -> dict:
+    counts = Counter()
+    path = DATA_DIR / EDGES_FILE
+    if path.exists():
+        with open(path, newline="", encoding="utf-8") as f:
+            counts.update(row["relation_type"] for row in csv.DictReader(f) if row.get("relation_type"))
+    return {rel: counts.get(rel, 0) + 1 for rel in kg_access.REL_TYPES}  # +1 keeps rare types present
+
+
+def write_synthetic(out_dir: Path, n_triples: int, seed: int):
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_supp, n_cond = max(10, n_triples // 50), max(10, n_triples // 10)
+    with open(out_dir / "nodes_supplements.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["supplement_id", "supplement_name", "entity_type"])
+        w.writerows([f"bench-s{i}", f"Bench Supplement {i}", "supplement"] for i in range(n_supp))
+    with open(out_dir / "nodes_conditions.csv", "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(["condition_id", "condition_name", "entity_type"])
+        w.writerows([f"bench-c{i}", f"Bench Condition {i}", "condition"] for i in range(n_cond))
+
+    weights = relation_weights()
+    rels = rng.choices(list(weights), weights=list(weights.values()), k=n_triples)
+    with open(out_dir / EDGES_FILE, "w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(EDGE_COLUMNS)
+        for i, rel in enumerate(rels):
+            s, c = rng.randrange(n_supp), rng.randrange(n_cond)
+            w.writerow([f"bench-s{s}", f"Bench Supplement {s}", rel, f"bench-c{c}", f"Bench Condition {c}",
+                        round(rng.uniform(0.5, 1.0), 3), rng.choice(["condition", "llm", "symptom"]),
+                        f"{SOURCE_PREFIX}{i % 1000}", f"synthetic evidence sentence {i} " * 4])
+    return Counter(rels)
+
+
+def cleanup():
+    with kg_access.get_driver().session(database=kg_access._database()) as session:
+        for query in (
+            "MATCH (n:Supplement) WHERE n.id STARTS WITH 'bench-' "
+            "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 5000 ROWS",
+            "MATCH (n:Condition) WHERE n.id STARTS WITH 'bench-' "
+            "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 5000 ROWS",
+            f"MATCH (n:Source) WHERE n.id STARTS WITH '{SOURCE_PREFIX}' "
+            "CALL { WITH n DETACH DELETE n } IN TRANSACTIONS OF 5000 ROWS",
+        ):
+            session.run(query).consume()
+
+
+def loaded_relationships() -> dict:
+    rows = kg_access.read("""
+    MATCH (s:Supplement)-[r]->(:Condition) WHERE s.id STARTS WITH 'bench-'
+    RETURN type(r) AS rel, count(*) AS n
+    """)
+    return {r["rel"]: r["n"] for r in rows}
+
+
+def setup_cypher_statements(import_subdir: str) -> list:
+    text = (DATA_DIR / "setup.cypher").read_text()
+    text = "\n".join(line for line in text.splitlines() if not line.strip().startswith("//"))
+    text = text.replace("file:///", f"file:///{import_subdir}/")
+    return [stmt.strip() for stmt in text.split(";") if stmt.strip()]
+
+
+def run_setup_cypher() -> float:
+    statements = setup_cypher_statements(BENCH_DIR.name)
+    start = time.perf_counter()
+    with kg_access.get_driver().session(database=kg_access._database()) as session:
+        for stmt in statements:
+            # auto-commit, the way cypher-shell -f runs the file
+            session.run(stmt).consume()
+    return time.perf_counter() - start
+
+
+def run_loader(workers: int, batch_size: int) -> float:
+    start = time.perf_counter()
+    Loader(BENCH_DIR, batch_size=batch_size, workers=workers, record=False).run()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="setup.cypher vs load_kg.py load throughput")
+    parser.add_argument("--triples", type=int, default=200_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep-files", action="store_true")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    written = write_synthetic(BENCH_DIR, args.triples, args.seed)
+    print(f"Wrote {args.triples} synthetic triples over {len(written)} relation types to {BENCH_DIR}")
+    results = {"triples": args.triples, "relation_types": dict(written), "runs": {}}
+    try:
+        kg_access.ensure_indexes()
+        for name, run in (("setup.cypher", run_setup_cypher),
+                          ("load_kg.py", lambda: run_loader(args.workers, args.batch_size))):
+            cleanup()
+            print(f"\nLoading with {name}...")
+            seconds = run()
+            rels = loaded_relationships()
+            loaded = sum(rels.values())
+            results["runs"][name] = {
+                "seconds": round(seconds, 2),
+                "input_rows_per_s": round(args.triples / seconds, 1),
+                "relationships": loaded,
+                "relationships_per_s": round(loaded / seconds, 1),
+                "types_loaded": len(rels),
+            }
+        cleanup()
+    finally:
+        kg_access.close()
+        if not args.keep_files:
+            shutil.rmtree(BENCH_DIR, ignore_errors=True)
+
+    print(f"\n{'loader':<14} {'seconds':>9} {'rows/s':>10} {'rels':>9} {'rels/s':>10} {'types':>6}")
+    for name, r in results["runs"].items():
+        print(f"{name:<14} {r['seconds']:>9} {r['input_rows_per_s']:>10} {r['relationships']:>9} "
+              f"{r['relationships_per_s']:>10} {r['types_loaded']:>6}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,158 @@
+"""
+Benchmark for kg_service.py: individual requests without and with the response cache,
+conditional requests (If-None-Match -> 304) and /batch, at a fixed concurrency.
+
+Runs the app in-process over ASGI by default (backend from KG_SERVICE_BACKEND, e.g.
+csv for the in-process CSV graph, neo4j for a local Neo4j), or against a running
+service with --url (the server's own cache then decides what "uncached" means, so
+only the first pass there is cold).
+
+    KG_SERVICE_BACKEND=csv python bench_service.py --lookups 2000 --concurrency 16
+    python bench_service.py --url http://localhost:8002 --batch-size 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import httpx
+from load_kg import DATA_DIR, NODE_FILES, read_nodes
+
+
+def workload(n: int, seed: int, data_dir=DATA_DIR) -> list:
+    """Mixed lookups as (op, id, label) drawn from the node CSVs"""
+    rng = random.Random(seed)
+    nodes = {label: list(read_nodes(data_dir / fname, id_col, name_col))
+             for label, (fname, id_col, name_col) in NODE_FILES.items()}
+    supps, conds = nodes["Supplement"], nodes["Condition"]
+    out = []
+    for _ in range(n):
+        kind = rng.random()
+        if kind < 0.3:
+            out.append(("treats", rng.choice(supps)["id"], None))
+        elif kind < 0.55:
+            out.append(("indicated_for", rng.choice(conds)["id"], None))
+        elif kind < 0.8:
+            node = rng.choice(supps + conds)
+            out.append(("neighbors", node["id"], "supplement" if node in supps else "condition"))
+        else:
+            name = rng.choice(supps + conds)["name"] or ""
+            out.append(("search", name[:max(3, len(name) - 2)].lower(), None))  # partial names
+    return out
+
+
+def path_for(op, key, label):
+    if op == "treats":
+        return f"/supplements/{key}/treats", {}
+    if op == "indicated_for":
+        return f"/conditions/{key}/indicated-for", {}
+    if op == "neighbors":
+        return f"/neighbors/{label}/{key}", {}
+    return "/search", {"q": key}
+
+
+async def run_requests(client, lookups, concurrency: int, etags: dict = None) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+
+    async def one(lookup):
+        path, params = path_for(*lookup)
+        headers = {"If-None-Match": etags[lookup]} if etags and lookup in etags else {}
+        async with sem:
+            start = time.perf_counter()
+            r = await client.get(path, params=params, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        if etags is not None and "etag" in r.headers:
+            etags.setdefault(lookup, r.headers["etag"])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(l) for l in lookups))
+    return summarize(latencies, len(lookups), time.perf_counter() - start, statuses)
+
+
+async def run_batches(client, lookups, concurrency: int, batch_size: int) -> dict:
+    sem = asyncio.Semaphore(concurrency)
+    latencies, statuses = [], {}
+    batches = [lookups[i:i + batch_size] for i in range(0, len(lookups), batch_size)]
+
+    async def one(batch):
+        body = {"lookups": [{"op": op, "id": key, "label": label, "limit": 25} for op, key, label in batch]}
+        async with sem:
+            start = time.perf_counter()
+            r = await client.post("/batch", json=body)
+            latencies.append((time.perf_counter() - start) * 1000)
+        statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(b) for b in batches))
+    return summarize(latencies, len(lookups), time.perf_counter() - start, statuses)
+
+
+def summarize(latencies, n_lookups, wall, statuses) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "lookups": n_lookups,
+        "wall_s": round(wall, 3),
+        "requests_per_s": round(len(ordered) / wall, 1),
+        "lookups_per_s": round(n_lookups / wall, 1),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def in_process_client(cache_size: int):
+    import kg_service
+    kg_service.app.state.service = kg_service.Service(kg_service.make_store(), cache_size=cache_size)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=kg_service.app), base_url="http://kg")
+
+
+async def bench(args) -> dict:
+    lookups = workload(args.lookups, args.seed)
+    results = {}
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            results["first_pass"] = await run_requests(client, lookups, args.concurrency)
+            etags = {}
+            results["repeat"] = await run_requests(client, lookups, args.concurrency, etags)
+            results["conditional_304"] = await run_requests(client, lookups, args.concurrency, etags)
+            results["batch"] = await run_batches(client, lookups, args.concurrency, args.batch_size)
+        return results
+
+    async with in_process_client(cache_size=0) as client:
+        results["uncached"] = await run_requests(client, lookups, args.concurrency)
+        results["batch_uncached"] = await run_batches(client, lookups, args.concurrency, args.batch_size)
+    async with in_process_client(cache_size=100_000) as client:
+        await run_requests(client, lookups, args.concurrency)  # warm
+        etags = {}
+        results["cached"] = await run_requests(client, lookups, args.concurrency, etags)
+        results["conditional_304"] = await run_requests(client, lookups, args.concurrency, etags)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="kg_service.py benchmark")
+    parser.add_argument("--url", default=None, help="running service; default runs the app in-process")
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench(args))
+    print(f"{'scenario':<18} {'req/s':>9} {'lookups/s':>10} {'p50 ms':>8} {'p95 ms':>8}  statuses")
+    for name, r in results.items():
+        print(f"{name:<18} {r['requests_per_s']:>9} {r['lookups_per_s']:>10} {r['p50_ms']:>8} {r['p95_ms']:>8}  "
+              f"{r['statuses']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
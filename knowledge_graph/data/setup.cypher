@@ -1,6 +1,15 @@
 CREATE CONSTRAINT IF NOT EXISTS FOR (s:Supplement) REQUIRE s.id IS UNIQUE;
 CREATE CONSTRAINT IF NOT EXISTS FOR (c:Condition)  REQUIRE c.id IS UNIQUE;
 CREATE CONSTRAINT IF NOT EXISTS FOR (src:Source)   REQUIRE src.id IS UNIQUE;
+CREATE CONSTRAINT IF NOT EXISTS FOR (p:Passage)    REQUIRE p.id IS UNIQUE;
+
+// name search goes through the full-text index (db.index.fulltext.queryNodes), see kg_access.search
+CREATE FULLTEXT INDEX entity_names IF NOT EXISTS FOR (n:Supplement|Condition) ON EACH [n.name];
+// relationship indexes are per type; these serve "top confidence" and per-method filters
+CREATE INDEX treats_confidence IF NOT EXISTS FOR ()-[r:TREATS]-() ON (r.confidence);
+CREATE INDEX treats_method IF NOT EXISTS FOR ()-[r:TREATS]-() ON (r.extraction_method);
+CREATE INDEX indicated_for_confidence IF NOT EXISTS FOR ()-[r:INDICATED_FOR]-() ON (r.confidence);
+CREATE INDEX indicated_for_method IF NOT EXISTS FOR ()-[r:INDICATED_FOR]-() ON (r.extraction_method);
 
 LOAD CSV WITH HEADERS FROM 'file:///nodes_supplements.csv' AS row
 WITH trim(row.supplement_id) AS sid, trim(row.supplement_name) AS sname, trim(row.entity_type) AS et
@@ -16,6 +25,13 @@ MERGE (c:Condition {id: cid})
 SET c.name = coalesce(cname, c.name),
     c.entity_type = CASE WHEN et IS NOT NULL AND et <> '' THEN et ELSE c.entity_type END;
 
+// evidence text, once per passage; edges point at it with passage_id and the offsets of their evidence
+LOAD CSV WITH HEADERS FROM 'file:///passages.csv' AS row
+WITH trim(row.passage_id) AS pid, row
+WHERE pid IS NOT NULL AND pid <> ''
+MERGE (p:Passage {id: pid})
+SET p.text = row.text, p.url = trim(row.source_url), p.start = toInteger(row.start), p.end = toInteger(row.end);
+
 LOAD CSV WITH HEADERS FROM 'file:///edges_relationships.csv' AS row
 WITH toUpper(trim(row.type)) AS t, trim(row.supplement_id) AS sid, trim(row.condition_id) AS cid, trim(row.url) AS url
 WHERE sid <> '' AND cid <> '' AND t IN ['TREATS','INDICATED_FOR']
@@ -30,21 +46,26 @@ FOREACH (_ IN CASE WHEN t='INDICATED_FOR' THEN [1] ELSE [] END |
 LOAD CSV WITH HEADERS FROM 'file:///edges_detailed.csv' AS row
 WITH trim(row.supplement_id) AS sid, trim(row.relation_type) AS rt, trim(row.supplement_name) AS sname,
      trim(row.condition_id) AS cid, toFloat(row.confidence) AS conf,
-     trim(row.extraction_method) AS method, trim(row.source_url) AS srcurl, row.evidence_text AS evidence
+     trim(row.extraction_method) AS method, trim(row.source_url) AS srcurl, trim(row.passage_id) AS pid,
+     toInteger(row.evidence_start) AS estart, toInteger(row.evidence_end) AS eend
 WHERE sid <> '' AND cid <> '' AND rt IN ['TREATS','INDICATED_FOR']
 MATCH (s:Supplement {id: sid}), (c:Condition {id: cid})
 FOREACH (_ IN CASE WHEN rt='TREATS' THEN [1] ELSE [] END |
   MERGE (s)-[r:TREATS]->(c)
   SET r.confidence = coalesce(conf, r.confidence),
       r.extraction_method = coalesce(method, r.extraction_method),
-      r.evidence_text = coalesce(evidence, r.evidence_text),
+      r.passage_id = coalesce(pid, r.passage_id),
+      r.evidence_start = coalesce(estart, r.evidence_start),
+      r.evidence_end = coalesce(eend, r.evidence_end),
       r.url = coalesce(srcurl, r.url)
 )
 FOREACH (_ IN CASE WHEN rt='INDICATED_FOR' THEN [1] ELSE [] END |
   MERGE (s)-[r:INDICATED_FOR]->(c)
   SET r.confidence = coalesce(conf, r.confidence),
       r.extraction_method = coalesce(method, r.extraction_method),
-      r.evidence_text = coalesce(evidence, r.evidence_text),
+      r.passage_id = coalesce(pid, r.passage_id),
+      r.evidence_start = coalesce(estart, r.evidence_start),
+      r.evidence_end = coalesce(eend, r.evidence_end),
       r.url = coalesce(srcurl, r.url)
 );
 
@@ -54,6 +75,11 @@ WHERE srcurl IS NOT NULL AND srcurl <> ''
 MERGE (src:Source {id: srcurl})
 SET src.url = srcurl;
 
+CALL db.awaitIndexes(300);
+
+// top_conditions/top_supplements, degree and relation_counts (what the agent's Cypher reads) are not
+// computed here: run `python materialize.py` from the host after this script
+
 MATCH (s:Supplement)-[r]->(c:Condition)
 RETURN type(r) AS rel, count(*) AS n
 ORDER BY n DESC
@@ -0,0 +1,237 @@
+"""
+In-memory entity linking: resolve supplement/condition mentions to KG node ids so
+queries can seek the unique `id` constraints instead of scanning names.
+
+Built from nodes_supplements.csv / nodes_conditions.csv (or newer .parquet versions) with three lookups:
+  - exact/alias map   normalized name, id or alias -> entries (aliases seeded from
+                      MedicalEntityExtractor.NORMALIZATION_MAP)
+  - prefix index      sorted keys + bisect, for partial names ("vitamin b")
+  - trigram index     character trigrams, for misspellings ("magnesum")
+
+get_index() rebuilds the shared index when the node CSVs change, so it follows KG reloads.
+
+    python entity_index.py "does magnesum help with high blood pressure"
+"""
+import bisect
+import os
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional
+
+sys.path.append(str(Path(__file__).resolve().parent / "triple_extraction"))
+from re_extractor import MedicalEntityExtractor  # noqa: E402
+from utils import create_id, parquet_name, read_rows  # noqa: E402
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+NODE_FILES = {
+    "Supplement": ("nodes_supplements.csv", "supplement_id", "supplement_name"),
+    "Condition": ("nodes_conditions.csv", "condition_id", "condition_name"),
+}
+MAX_MENTION_WORDS = 5
+# words never worth a fuzzy lookup on their own
+STOPWORDS = {
+    "about", "after", "against", "before", "could", "daily", "dosage", "helps", "other", "should",
+    "supplement", "supplements", "taking", "treat", "treats", "there", "these", "which", "while", "would",
+    "wants", "know", "whether", "conditions", "condition", "recommended", "understand", "find",
+}
+
+
+@dataclass(frozen=True)
+class Entity:
+    label: str
+    id: str
+    name: str
+
+
+@dataclass(frozen=True)
+class Match:
+    entity: Entity
+    score: float
+    method: str  # exact | alias | prefix | fuzzy
+    mention: str = ""
+
+
+def normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", str(text).lower()).split())
+
+
+def trigrams(key: str):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class EntityIndex:
+    def __init__(self, entities: List[Entity], aliases: Optional[Dict[str, str]] = None):
+        self.entities = entities
+        self.exact = defaultdict(list)  # key -> [Entity]
+        self.alias = defaultdict(list)
+        by_id = {}
+        for ent in entities:
+            by_id[(ent.label, ent.id)] = ent
+            for key in {normalize(ent.name), normalize(ent.id)}:
+                if key and ent not in self.exact[key]:
+                    self.exact[key].append(ent)
+
+        # aliases point at normalized names; resolve them through create_id like the extractor does
+        for alias, canonical in (aliases or {}).items():
+            for label in NODE_FILES:
+                ent = by_id.get((label, create_id(canonical)))
+                if ent and ent not in self.alias[normalize(alias)]:
+                    self.alias[normalize(alias)].append(ent)
+
+        self.keys = sorted(set(self.exact) | set(self.alias))
+        self.grams = defaultdict(set)
+        self.gram_counts = []
+        for pos, key in enumerate(self.keys):
+            key_grams = trigrams(key)
+            self.gram_counts.append(len(key_grams))
+            for g in key_grams:
+                self.grams[g].add(pos)
+
+        self.data_dir = None
+        self.sources = {}
+        self.loaded_at = time.time()
+
+    @classmethod
+    def from_csv(cls, data_dir=DATA_DIR) -> "EntityIndex":
+        data_dir = Path(data_dir)
+        entities = []
+        for label, (fname, id_col, name_col) in NODE_FILES.items():
+            path = data_dir / fname
+            if not path.exists() and not (data_dir / parquet_name(fname)).exists():
+                continue
+            for row in read_rows(path, [id_col, name_col]):
+                eid = (row.get(id_col) or "").strip()
+                if eid:
+                    entities.append(Entity(label, eid, (row.get(name_col) or eid).strip()))
+        index = cls(entities, MedicalEntityExtractor.NORMALIZATION_MAP)
+        index.data_dir = data_dir
+        index.sources = {name: _mtime(data_dir / name) for fname, _, _ in NODE_FILES.values()
+                         for name in (fname, parquet_name(fname))}
+        return index
+
+    def _lookup(self, key):
+        if key in self.exact:
+            return [(e, "exact") for e in self.exact[key]]
+        if key in self.alias:
+            return [(e, "alias") for e in self.alias[key]]
+        return []
+
+    def resolve(self, mention: str, label: str = None, fuzzy: bool = True, limit: int = 5,
+                min_score: float = 0.5) -> List[Match]:
+        """Best entities for one mention: exact/alias, then prefix, then trigram similarity"""
+        key = normalize(mention)
+        if not key:
+            return []
+        hits = [Match(e, 1.0, method, mention) for e, method in self._lookup(key)]
+
+        if not hits:
+            lo = bisect.bisect_left(self.keys, key)
+            hi = bisect.bisect_left(self.keys, key + "￿")
+            for k in self.keys[lo:min(hi, lo + limit * 4)]:
+                # shorter completions are better matches for the same prefix
+                hits += [Match(e, round(len(key) / len(k), 3), "prefix", mention) for e, _ in self._lookup(k)]
+
+        if not hits and fuzzy:
+            grams = trigrams(key)
+            counts = defaultdict(int)
+            for g in grams:
+                for pos in self.grams.get(g, ()):
+                    counts[pos] += 1
+            for pos, shared in counts.items():
+                score = 2 * shared / (len(grams) + self.gram_counts[pos])  # Dice coefficient
+                if score >= min_score:
+                    hits += [Match(e, round(score, 3), "fuzzy", mention) for e, _ in self._lookup(self.keys[pos])]
+
+        if label:
+            hits = [m for m in hits if m.entity.label == label]
+        best = {}
+        for m in sorted(hits, key=lambda m: -m.score):
+            best.setdefault((m.entity.label, m.entity.id), m)
+        return list(best.values())[:limit]
+
+    def link(self, text: str, fuzzy: bool = True) -> List[Match]:
+        """
+        Find entity mentions in free text: longest exact/alias n-gram first, then a
+        fuzzy pass over leftover words long enough to be names
+        """
+        words = normalize(text).split()
+        used = [False] * len(words)
+        found = []
+        for n in range(min(MAX_MENTION_WORDS, len(words)), 0, -1):
+            for i in range(len(words) - n + 1):
+                if any(used[i:i + n]):
+                    continue
+                mention = " ".join(words[i:i + n])
+                hits = self._lookup(mention)
+                if hits:
+                    found += [Match(e, 1.0, method, mention) for e, method in hits]
+                    for j in range(i, i + n):
+                        used[j] = True
+        if fuzzy:
+            for i, word in enumerate(words):
+                if not used[i] and len(word) >= 5 and word not in STOPWORDS:
+                    found += [m for m in self.resolve(word, fuzzy=True, limit=1, min_score=0.6) if m.method == "fuzzy"]
+        seen = set()
+        unique = []
+        for m in found:
+            k = (m.entity.label, m.entity.id)
+            if k not in seen:
+                seen.add(k)
+                unique.append(m)
+        return unique
+
+    def changed_on_disk(self) -> bool:
+        if self.data_dir is None:
+            return False
+        return any(_mtime(self.data_dir / fname) != mtime for fname, mtime in self.sources.items())
+
+
+def _mtime(path: Path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+_index = None
+_index_lock = threading.Lock()
+_last_check = 0.0
+CHECK_INTERVAL_S = 1.0
+
+
+def get_index(data_dir=DATA_DIR) -> EntityIndex:
+    """Process-wide index, rebuilt when the node CSVs change (checked at most once a second)"""
+    global _index, _last_check
+    now = time.monotonic()
+    if _index is not None and now - _last_check < CHECK_INTERVAL_S:
+        return _index
+    with _index_lock:
+        _last_check = now
+        if _index is None or _index.changed_on_disk():
+            _index = EntityIndex.from_csv(data_dir)
+    return _index
+
+
+def reload(data_dir=DATA_DIR) -> EntityIndex:
+    """Rebuild now, e.g. right after a KG load"""
+    global _index
+    with _index_lock:
+        _index = EntityIndex.from_csv(data_dir)
+    return _index
+
+
+if __name__ == "__main__":
+    idx = get_index()
+    text = " ".join(sys.argv[1:]) or "magnesium for high blood pressure"
+    start = time.perf_counter()
+    matches = idx.link(text)
+    elapsed_us = (time.perf_counter() - start) * 1e6
+    for m in matches:
+        print(f"{m.entity.label:<10} {m.entity.id:<30} {m.entity.name:<30} {m.method:<6} {m.score}  ('{m.mention}')")
+    print(f"{len(idx.entities)} entities, linked in {elapsed_us:.0f} us")
@@ -0,0 +1,432 @@
+"""
+Shared Neo4j access for the chatbot, helper scripts and loaders.
+
+One pooled driver per process, configured from the environment:
+
+    NEO4J_URI, NEO4J_USERNAME, NEO4J_PASSWORD, NEO4J_DATABASE
+    NEO4J_MAX_POOL_SIZE          connections per process (default 50)
+    NEO4J_MAX_CONN_LIFETIME      seconds before a pooled connection is recycled (default 3600)
+    NEO4J_ACQUISITION_TIMEOUT    seconds to wait for a free connection (default 60)
+    NEO4J_CONNECTION_TIMEOUT     seconds to open a new connection (default 30)
+    NEO4J_MAX_RETRY_TIME         seconds managed transactions keep retrying transient errors (default 30)
+
+Queries run as managed transactions (execute_read / execute_write), which the
+driver retries on ServiceUnavailable, SessionExpired and TransientError.
+"""
+import json
+import os
+import re
+import threading
+import time
+from dotenv import load_dotenv
+from neo4j import GraphDatabase
+from relation_types import ALL_RELATION_TYPES
+
+load_dotenv()
+
+DEFAULT_URI = "bolt://localhost:7687"
+DEFAULT_AUTH = ("neo4j", "neo4jpassword")
+
+
+def pool_config() -> dict:
+    return {
+        "max_connection_pool_size": int(os.getenv("NEO4J_MAX_POOL_SIZE", "50")),
+        "max_connection_lifetime": float(os.getenv("NEO4J_MAX_CONN_LIFETIME", "3600")),
+        "connection_acquisition_timeout": float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "60")),
+        "connection_timeout": float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "30")),
+        "max_transaction_retry_time": float(os.getenv("NEO4J_MAX_RETRY_TIME", "30")),
+    }
+
+
+class PoolMetrics:
+    """
+    Counters kept around every managed transaction. The driver doesn't expose its pool,
+    so "wait" is measured from asking for a transaction until the transaction function
+    starts, which covers connection acquisition and BEGIN
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.in_use = 0
+            self.peak_in_use = 0
+            self.transactions = 0
+            self.retries = 0
+            self.errors = 0
+            self.wait_ms_total = 0.0
+            self.wait_ms_max = 0.0
+            self.query_ms_total = 0.0
+
+    def start(self):
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def acquired(self, wait_ms: float, attempt: int):
+        with self._lock:
+            if attempt == 1:
+                self.wait_ms_total += wait_ms
+                self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+            else:
+                self.retries += 1
+
+    def finish(self, elapsed_ms: float, failed: bool):
+        with self._lock:
+            self.in_use -= 1
+            self.transactions += 1
+            self.query_ms_total += elapsed_ms
+            if failed:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            n = self.transactions or 1
+            return {
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "transactions": self.transactions,
+                "retries": self.retries,
+                "errors": self.errors,
+                "wait_ms_avg": round(self.wait_ms_total / n, 3),
+                "wait_ms_max": round(self.wait_ms_max, 3),
+                "query_ms_avg": round(self.query_ms_total / n, 3),
+            }
+
+
+metrics = PoolMetrics()
+
+_driver = None
+_driver_pid = None
+_driver_lock = threading.Lock()
+
+
+def get_driver():
+    """The process-wide driver, created on first use (and again after a fork)"""
+    global _driver, _driver_pid
+    if _driver is not None and _driver_pid == os.getpid():
+        return _driver
+    with _driver_lock:
+        if _driver is None or _driver_pid != os.getpid():
+            uri = os.getenv("NEO4J_URI", DEFAULT_URI)
+            auth = (os.getenv("NEO4J_USERNAME", DEFAULT_AUTH[0]), os.getenv("NEO4J_PASSWORD", DEFAULT_AUTH[1]))
+            _driver = GraphDatabase.driver(uri, auth=auth, **pool_config())
+            _driver_pid = os.getpid()
+    return _driver
+
+
+def close():
+    global _driver, _driver_pid
+    with _driver_lock:
+        if _driver is not None and _driver_pid == os.getpid():
+            _driver.close()
+        _driver = None
+        _driver_pid = None
+
+
+def _database():
+    return os.getenv("NEO4J_DATABASE") or None
+
+
+def _managed(execute, work):
+    """Run work(tx) as a managed transaction, keeping pool metrics"""
+    attempts = 0
+    requested = time.perf_counter()
+
+    def tx_fn(tx):
+        nonlocal attempts
+        attempts += 1
+        metrics.acquired((time.perf_counter() - requested) * 1000, attempts)
+        return work(tx)
+
+    metrics.start()
+    failed = False
+    try:
+        with get_driver().session(database=_database()) as session:
+            return execute(session)(tx_fn)
+    except Exception:
+        failed = True
+        raise
+    finally:
+        metrics.finish((time.perf_counter() - requested) * 1000, failed)
+
+
+def read(query: str, params=None) -> list:
+    """Run a read query and return its rows as dicts"""
+    return _managed(lambda s: s.execute_read, lambda tx: tx.run(query, params or {}).data())
+
+
+COUNTERS = ("nodes_created", "nodes_deleted", "relationships_created", "relationships_deleted", "properties_set")
+
+
+def write(query: str, params=None) -> dict:
+    """Run a write query and return the update counters"""
+    def work(tx):
+        counters = tx.run(query, params or {}).consume().counters
+        return {k: getattr(counters, k) for k in COUNTERS}
+    return _managed(lambda s: s.execute_write, work)
+
+
+def write_statements(statements) -> dict:
+    """Run several (query, params) pairs in one write transaction; returns summed counters"""
+    def work(tx):
+        totals = dict.fromkeys(COUNTERS, 0)
+        for query, params in statements:
+            counters = tx.run(query, params or {}).consume().counters
+            for k in COUNTERS:
+                totals[k] += getattr(counters, k)
+        return totals
+    return _managed(lambda s: s.execute_write, work)
+
+
+def write_batches(query: str, batches, param="rows") -> int:
+    """Run one write transaction per batch, passing each batch as $rows; returns rows written"""
+    total = 0
+    for batch in batches:
+        write(query, {param: batch})
+        total += len(batch)
+    return total
+
+
+# Schema the loaders rely on; the same statements are in data/setup.cypher
+CONSTRAINTS = (
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (s:Supplement) REQUIRE s.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (c:Condition) REQUIRE c.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (src:Source) REQUIRE src.id IS UNIQUE",
+    "CREATE CONSTRAINT IF NOT EXISTS FOR (p:Passage) REQUIRE p.id IS UNIQUE",
+)
+FULLTEXT_INDEX = "entity_names"
+# every relationship type the extraction emits gets its own confidence/method indexes
+REL_TYPES = ALL_RELATION_TYPES
+INDEXED_REL_TYPES = REL_TYPES
+
+
+def index_statements(rel_types=INDEXED_REL_TYPES) -> list:
+    stmts = [f"CREATE FULLTEXT INDEX {FULLTEXT_INDEX} IF NOT EXISTS FOR (n:Supplement|Condition) ON EACH [n.name]"]
+    for rel in rel_types:
+        name = rel.lower()
+        stmts.append(f"CREATE INDEX {name}_confidence IF NOT EXISTS FOR ()-[r:{rel}]-() ON (r.confidence)")
+        stmts.append(f"CREATE INDEX {name}_method IF NOT EXISTS FOR ()-[r:{rel}]-() ON (r.extraction_method)")
+    return stmts
+
+
+def ensure_indexes(rel_types=INDEXED_REL_TYPES, wait_s: int = 300):
+    """Create the id constraints and search/confidence indexes if missing, and wait until they're online"""
+    with get_driver().session(database=_database()) as session:
+        for stmt in CONSTRAINTS + tuple(index_statements(rel_types)):
+            session.run(stmt).consume()
+        session.run("CALL db.awaitIndexes($timeout)", {"timeout": wait_s}).consume()
+
+
+def drop_indexes(rel_types=INDEXED_REL_TYPES):
+    with get_driver().session(database=_database()) as session:
+        names = [FULLTEXT_INDEX] + [f"{rel.lower()}_{prop}" for rel in rel_types for prop in ("confidence", "method")]
+        for name in names:
+            session.run(f"DROP INDEX {name} IF EXISTS").consume()
+
+
+def graph_version() -> int:
+    """Version stamp of the loaded graph, bumped by every load or sync that changes it (0 if never stamped)"""
+    rows = read("MATCH (m:GraphMeta {id: 'kg'}) RETURN m.version AS version")
+    return rows[0]["version"] if rows else 0
+
+
+def bump_version(summary: dict = None) -> int:
+    def work(tx):
+        return tx.run("""
+        MERGE (m:GraphMeta {id: 'kg'})
+        SET m.version = coalesce(m.version, 0) + 1,
+            m.updated_at = datetime(),
+            m.last_change = $summary
+        RETURN m.version AS version
+        """, {"summary": json.dumps(summary or {})}).single()["version"]
+    return _managed(lambda s: s.execute_write, work)
+
+
+def pool_metrics() -> dict:
+    return {**metrics.snapshot(), "config": pool_config()}
+
+
+# Parameterized helpers for the common agent lookups
+
+def treats(supplement_id: str, limit: int = 25) -> list:
+    return read("""
+    MATCH (s:Supplement {id:$sid})-[r:TREATS]->(c:Condition)
+    RETURN s.id AS supplement_id, c.id AS condition_id, c.name AS condition,
+           coalesce(r.confidence,0.0) AS confidence, r.url AS url,
+           r.passage_id AS passage_id, r.evidence_start AS evidence_start, r.evidence_end AS evidence_end
+    ORDER BY confidence DESC, condition
+    LIMIT $limit
+    """, {"sid": supplement_id, "limit": limit})
+
+
+def indicated_for(condition_id: str, limit: int = 25) -> list:
+    return read("""
+    MATCH (s:Supplement)-[r:INDICATED_FOR]->(c:Condition {id:$cid})
+    RETURN s.id AS supplement_id, s.name AS supplement, c.id AS condition_id,
+           coalesce(r.confidence,0.0) AS confidence, r.url AS url,
+           r.passage_id AS passage_id, r.evidence_start AS evidence_start, r.evidence_end AS evidence_end
+    ORDER BY confidence DESC, supplement
+    LIMIT $limit
+    """, {"cid": condition_id, "limit": limit})
+
+
+def passages(ids: list) -> dict:
+    """Passage id -> {text, url, start, end}; edges carry only the id, the text is fetched when an answer needs it"""
+    rows = read("""
+    UNWIND $ids AS id
+    MATCH (p:Passage {id: id})
+    RETURN p.id AS id, p.text AS text, p.url AS url, p.start AS start, p.end AS end
+    """, {"ids": list(dict.fromkeys(ids))})
+    return {r.pop("id"): r for r in rows}
+
+
+def with_evidence(rows: list) -> list:
+    """treats()/indicated_for() rows with an `evidence` key: their slice of their passage, all passages in one query"""
+    found = passages([r["passage_id"] for r in rows if r.get("passage_id")])
+    for r in rows:
+        p = found.get(r.get("passage_id"))
+        r["evidence"] = p["text"][r["evidence_start"]:r["evidence_end"]] if p else None
+    return rows
+
+
+def supplement_conditions(supplement_id: str, limit: int = 25) -> list:
+    """Every relation from a supplement, best first"""
+    return read("""
+    MATCH (s:Supplement {id:$sid})-[r]->(c:Condition)
+    RETURN c.id AS condition_id, c.name AS condition, type(r) AS relation,
+           coalesce(r.confidence,0.0) AS confidence
+    ORDER BY confidence DESC, condition
+    LIMIT $limit
+    """, {"sid": supplement_id, "limit": limit})
+
+
+def condition_supplements(condition_id: str, limit: int = 25) -> list:
+    """Every relation into a condition, best first"""
+    return read("""
+    MATCH (s:Supplement)-[r]->(c:Condition {id:$cid})
+    RETURN s.id AS supplement_id, s.name AS supplement, type(r) AS relation,
+           coalesce(r.confidence,0.0) AS confidence
+    ORDER BY confidence DESC, supplement
+    LIMIT $limit
+    """, {"cid": condition_id, "limit": limit})
+
+
+def _materialized(label: str, prop: str, node_id: str) -> list:
+    rows = read(f"MATCH (n:{label} {{id:$id}}) RETURN n.{prop} AS top", {"id": node_id})
+    return json.loads(rows[0]["top"]) if rows and rows[0]["top"] else []
+
+
+def top_conditions(supplement_id: str) -> list:
+    """Best conditions for a supplement, precomputed by materialize.py (one property read)"""
+    return _materialized("Supplement", "top_conditions", supplement_id)
+
+
+def top_supplements(condition_id: str) -> list:
+    """Best supplements for a condition, precomputed by materialize.py (one property read)"""
+    return _materialized("Condition", "top_supplements", condition_id)
+
+
+def lucene_query(text: str, fuzzy: bool = True) -> str:
+    """
+    Every word must match, as a word, a prefix or (optionally) within one edit. Words are
+    split the way the index's standard analyzer splits them, so no Lucene escaping is needed
+    """
+    clauses = []
+    for t in re.findall(r"[a-z0-9]+", str(text).lower()):
+        options = [t, f"{t}*"] + ([f"{t}~1"] if fuzzy and len(t) >= 4 else [])
+        clauses.append("(" + " OR ".join(options) + ")")
+    return " AND ".join(clauses)
+
+
+def search(text: str, label: str = None, limit: int = 10, fuzzy: bool = True) -> list:
+    """Supplements/conditions by name through the full-text index, best score first"""
+    query = lucene_query(text, fuzzy)
+    if not query:
+        return []
+    return read("""
+    CALL db.index.fulltext.queryNodes($index, $query, {limit: $fetch}) YIELD node, score
+    WHERE $label IS NULL OR $label IN labels(node)
+    RETURN node.id AS id, node.name AS name, labels(node)[0] AS label, score
+    ORDER BY score DESC
+    LIMIT $limit
+    """, {"index": FULLTEXT_INDEX, "query": query, "label": label, "limit": limit,
+          # over-fetch when filtering by label, the index covers both
+          "fetch": limit * 4 if label else limit})
+
+
+def top_relations(rel_type: str = "TREATS", min_confidence: float = 0.8, method: str = None,
+                  limit: int = 25) -> list:
+    """
+    Highest-confidence edges of one type. The range index on confidence gives the
+    seek and the order; a method filter uses the extraction_method index instead
+    """
+    if rel_type not in INDEXED_REL_TYPES:
+        raise ValueError(f"no confidence index for {rel_type}")
+    method_filter = "AND r.extraction_method = $method" if method else ""
+    return read(f"""
+    MATCH (s:Supplement)-[r:{rel_type}]->(c:Condition)
+    WHERE r.confidence >= $min_conf {method_filter}
+    RETURN s.id AS supplement_id, c.id AS condition_id, r.confidence AS confidence,
+           r.extraction_method AS method
+    ORDER BY r.confidence DESC
+    LIMIT $limit
+    """, {"min_conf": min_confidence, "method": method, "limit": limit})
+
+
+def schema_text() -> str:
+    """Graph schema in the same layout langchain's Neo4jGraph gives the LLM"""
+    node_props = read("CALL db.schema.nodeTypeProperties() YIELD nodeLabels, propertyName, propertyTypes "
+                      "RETURN nodeLabels, propertyName, propertyTypes")
+    rel_props = read("CALL db.schema.relTypeProperties() YIELD relType, propertyName, propertyTypes "
+                     "RETURN relType, propertyName, propertyTypes")
+
+    def patterns(tx):
+        # db.schema.visualization comes from the count store, no graph scan
+        record = tx.run("CALL db.schema.visualization()").single()
+        found = set()
+        for rel in record["relationships"] if record else []:
+            found.add((list(rel.start_node.labels)[0], rel.type, list(rel.end_node.labels)[0]))
+        return [{"src": a, "rel": r, "dst": b} for a, r, b in sorted(found, key=lambda p: (p[1], p[0], p[2]))]
+
+    rels = _managed(lambda s: s.execute_read, patterns)
+
+    def group(rows, key):
+        out = {}
+        for row in rows:
+            name = row[key]
+            props = out.setdefault(name, [])
+            if row["propertyName"]:
+                ptype = (row["propertyTypes"] or ["ANY"])[0].upper()
+                props.append(f"{row['propertyName']}: {ptype}")
+        return out
+
+    nodes = group([{**r, "label": ":".join(r["nodeLabels"])} for r in node_props], "label")
+    relationships = group([{**r, "rel": r["relType"].lstrip(":").strip("`")} for r in rel_props], "rel")
+    lines = ["Node properties:"]
+    lines += [f"{label} {{{', '.join(props)}}}" for label, props in nodes.items()]
+    lines.append("Relationship properties:")
+    lines += [f"{rel} {{{', '.join(props)}}}" for rel, props in relationships.items() if props]
+    lines.append("The relationships:")
+    lines += [f"(:{r['src']})-[:{r['rel']}]->(:{r['dst']})" for r in rels]
+    return "\n".join(lines)
+
+
+class KnowledgeGraph:
+    """
+    Drop-in for langchain's Neo4jGraph as used by the agent (.query and .schema),
+    backed by the shared driver. Agent queries run in read transactions, so
+    LLM-written Cypher can't modify the graph
+    """
+
+    def __init__(self):
+        get_driver().verify_connectivity()
+        self.schema = schema_text()
+
+    def query(self, query: str, params=None) -> list:
+        return read(query, params)
+
+    def refresh_schema(self):
+        self.schema = schema_text()
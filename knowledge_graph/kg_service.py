@@ -0,0 +1,499 @@
+"""
+HTTP service in front of the KG, so other services don't have to speak Bolt.
+
+Typed, read-only endpoints (no free-form Cypher):
+    GET  /supplements/{id}/treats            conditions a supplement treats
+    GET  /conditions/{id}/indicated-for      supplements indicated for a condition
+    GET  /search?q=...&label=...             full-text name search
+    GET  /neighbors/{label}/{id}             top-K neighbors, degree, relation counts
+    GET  /passages?id=...&id=...             evidence passages by the passage_id of an edge
+    POST /batch                              many of the above in one round trip
+    GET  /health, /metrics
+
+Responses carry an ETag derived from the graph version (kg_access.graph_version), are
+cached in-process until the version changes, and If-None-Match gets a 304.
+
+Backends (KG_SERVICE_BACKEND):
+    neo4j  async driver, pooled with the same NEO4J_* settings as kg_access (default)
+    csv    in-process graph built from the CSVs in data/, for local use and benchmarks
+
+    uvicorn kg_service:app --port 8002
+    KG_SERVICE_BACKEND=csv uvicorn kg_service:app --port 8002
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+import kg_access
+import materialize
+from load_kg import DATA_DIR, EDGES_FILE, NODE_FILES, PASSAGES_FILE, REL_TYPES, read_edges, read_nodes, read_passages
+
+sys.path.append(str(Path(__file__).resolve().parent / "triple_extraction"))
+from utils import data_file  # noqa: E402
+
+CACHE_SIZE = int(os.getenv("KG_CACHE_SIZE", "10000"))
+VERSION_TTL_S = float(os.getenv("KG_VERSION_TTL_S", "1.0"))
+MAX_LIMIT = 200
+LABELS = {"supplement": "Supplement", "condition": "Condition"}
+
+TREATS = """
+UNWIND $ids AS id
+MATCH (s:Supplement {id: id})-[r:TREATS]->(c:Condition)
+WITH id, c, r ORDER BY coalesce(r.confidence, 0.0) DESC, c.name
+RETURN id, collect({condition_id: c.id, condition: c.name, confidence: coalesce(r.confidence, 0.0),
+                    url: r.url, passage_id: r.passage_id, evidence_start: r.evidence_start,
+                    evidence_end: r.evidence_end})[..$limit] AS rows
+"""
+INDICATED_FOR = """
+UNWIND $ids AS id
+MATCH (s:Supplement)-[r:INDICATED_FOR]->(c:Condition {id: id})
+WITH id, s, r ORDER BY coalesce(r.confidence, 0.0) DESC, s.name
+RETURN id, collect({supplement_id: s.id, supplement: s.name, confidence: coalesce(r.confidence, 0.0),
+                    url: r.url, passage_id: r.passage_id, evidence_start: r.evidence_start,
+                    evidence_end: r.evidence_end})[..$limit] AS rows
+"""
+PASSAGES = """
+UNWIND $ids AS id
+MATCH (p:Passage {id: id})
+RETURN id, p {.text, .url, .start, .end} AS passage
+"""
+SEARCH = """
+UNWIND $terms AS t
+CALL {
+  WITH t
+  CALL db.index.fulltext.queryNodes($index, t.lucene, {limit: $fetch}) YIELD node, score
+  WHERE $label IS NULL OR $label IN labels(node)
+  RETURN node, score ORDER BY score DESC LIMIT $limit
+}
+RETURN t.q AS id, collect({id: node.id, name: node.name, label: labels(node)[0], score: score}) AS rows
+"""
+
+
+def materialized_query(label: str) -> str:
+    prop, _ = materialize.SIDES[label]
+    return f"""
+    UNWIND $ids AS id
+    MATCH (n:{label} {{id: id}})
+    RETURN id, n.{prop} AS top, n.degree AS degree, n.relation_counts AS relation_counts
+    """
+
+
+class Neo4jStore:
+    name = "neo4j"
+
+    def __init__(self):
+        from neo4j import AsyncGraphDatabase
+        uri = os.getenv("NEO4J_URI", kg_access.DEFAULT_URI)
+        auth = (os.getenv("NEO4J_USERNAME", kg_access.DEFAULT_AUTH[0]),
+                os.getenv("NEO4J_PASSWORD", kg_access.DEFAULT_AUTH[1]))
+        self.driver = AsyncGraphDatabase.driver(uri, auth=auth, **kg_access.pool_config())
+        self.database = os.getenv("NEO4J_DATABASE") or None
+
+    async def _read(self, query: str, params: dict) -> list:
+        async def work(tx):
+            result = await tx.run(query, params)
+            return await result.data()
+        async with self.driver.session(database=self.database) as session:
+            return await session.execute_read(work)
+
+    async def version(self) -> int:
+        rows = await self._read("MATCH (m:GraphMeta {id: 'kg'}) RETURN m.version AS version", {})
+        return rows[0]["version"] if rows else 0
+
+    async def treats(self, ids, limit):
+        return {r["id"]: r["rows"] for r in await self._read(TREATS, {"ids": ids, "limit": limit})}
+
+    async def indicated_for(self, ids, limit):
+        return {r["id"]: r["rows"] for r in await self._read(INDICATED_FOR, {"ids": ids, "limit": limit})}
+
+    async def passages(self, ids):
+        return {r["id"]: r["passage"] for r in await self._read(PASSAGES, {"ids": ids})}
+
+    async def search(self, queries, limit, label=None):
+        terms = [{"q": q, "lucene": kg_access.lucene_query(q)} for q in queries]
+        terms = [t for t in terms if t["lucene"]]
+        rows = await self._read(SEARCH, {"terms": terms, "index": kg_access.FULLTEXT_INDEX, "label": label,
+                                         "limit": limit, "fetch": limit * 4 if label else limit})
+        return {r["id"]: r["rows"] for r in rows}
+
+    async def neighbors(self, label, ids, limit):
+        out = {}
+        missing = []
+        for r in await self._read(materialized_query(label), {"ids": ids}):
+            if r["top"] is None:
+                missing.append(r["id"])  # not materialized yet
+                continue
+            out[r["id"]] = {"top": json.loads(r["top"])[:limit], "degree": r["degree"],
+                            "relation_counts": json.loads(r["relation_counts"] or "{}")}
+        if missing:
+            _, pattern = materialize.SIDES[label]
+            rows = await self._read(f"""
+            {pattern} WHERE n.id IN $ids
+            RETURN n.id AS id, m.id AS nid, m.name AS name, type(r) AS rel, r.confidence AS confidence
+            """, {"ids": missing})
+            rows = [(r["id"], r["nid"], r["name"], r["rel"], r["confidence"]) for r in rows]
+            for nid, entry in materialize.summarize(rows, missing, limit).items():
+                out[nid] = entry
+        return out
+
+    def pool(self) -> dict:
+        return kg_access.pool_config()
+
+    async def close(self):
+        await self.driver.close()
+
+
+class CsvStore:
+    """The KG held in memory from the CSVs, rebuilt when they change on disk"""
+    name = "csv"
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self.reload_lock = None  # asyncio.Lock, created on the serving loop
+        self.mtimes = None
+        self._passages = None
+        self._load()
+
+    def _files(self):
+        # the CSVs, or their Parquet siblings when those are newer
+        return [data_file(self.data_dir / fname) for fname, _, _ in NODE_FILES.values()] + \
+            [data_file(self.data_dir / EDGES_FILE)]
+
+    def _load(self):
+        import entity_index
+        mtimes = tuple(os.stat(p).st_mtime_ns for p in self._files())
+        names = {label: {row["id"]: row["name"] for row in read_nodes(self.data_dir / fname, id_col, name_col)}
+                 for label, (fname, id_col, name_col) in NODE_FILES.items()}
+        edges = {}
+        for edge, _ in read_edges(self.data_dir / EDGES_FILE, REL_TYPES):
+            if edge:
+                key = (edge["sid"], edge["rel"], edge["cid"])
+                old = edges.get(key, {})
+                edges[key] = {k: v if v is not None else old.get(k) for k, v in edge.items()}
+        by_supp, by_cond = defaultdict(list), defaultdict(list)
+        for (sid, rel, cid), e in edges.items():
+            by_supp[sid].append((rel, cid, e))
+            by_cond[cid].append((rel, sid, e))
+        supp_rows = [(s, c, names["Condition"].get(c), rel, e["confidence"]) for (s, rel, c), e in edges.items()]
+        cond_rows = [(c, s, names["Supplement"].get(s), rel, e["confidence"]) for (s, rel, c), e in edges.items()]
+        self.names, self.by_supp, self.by_cond = names, by_supp, by_cond
+        # materialized up front, like materialize.py does in Neo4j
+        self.materialized = {
+            "Supplement": materialize.summarize(supp_rows, list(names["Supplement"]), MAX_LIMIT),
+            "Condition": materialize.summarize(cond_rows, list(names["Condition"]), MAX_LIMIT),
+        }
+        self.index = entity_index.EntityIndex.from_csv(self.data_dir)
+        self._passages = None  # read on first use, most answers don't need the text
+        self.mtimes = mtimes
+        self._version = int(hashlib.blake2b(repr(mtimes).encode(), digest_size=6).hexdigest(), 16)
+
+    async def version(self) -> int:
+        mtimes = tuple(os.stat(p).st_mtime_ns for p in self._files())
+        if mtimes != self.mtimes:
+            self.reload_lock = self.reload_lock or asyncio.Lock()
+            async with self.reload_lock:
+                if mtimes != self.mtimes:
+                    await asyncio.to_thread(self._load)
+        return self._version
+
+    @staticmethod
+    def _ranked(rows, key_name):
+        return sorted(rows, key=lambda r: (-r["confidence"], r[key_name]))
+
+    async def treats(self, ids, limit):
+        out = {}
+        for sid in ids:
+            rows = [{"condition_id": cid, "condition": self.names["Condition"].get(cid),
+                     "confidence": e["confidence"] or 0.0, "url": e["url"], **self._evidence_ref(e)}
+                    for rel, cid, e in self.by_supp.get(sid, ()) if rel == "TREATS"]
+            out[sid] = self._ranked(rows, "condition")[:limit]
+        return out
+
+    async def indicated_for(self, ids, limit):
+        out = {}
+        for cid in ids:
+            rows = [{"supplement_id": sid, "supplement": self.names["Supplement"].get(sid),
+                     "confidence": e["confidence"] or 0.0, "url": e["url"], **self._evidence_ref(e)}
+                    for rel, sid, e in self.by_cond.get(cid, ()) if rel == "INDICATED_FOR"]
+            out[cid] = self._ranked(rows, "supplement")[:limit]
+        return out
+
+    @staticmethod
+    def _evidence_ref(e):
+        return {"passage_id": e["passage"], "evidence_start": e["evidence_start"], "evidence_end": e["evidence_end"]}
+
+    async def passages(self, ids):
+        if self._passages is None:
+            self._passages = await asyncio.to_thread(
+                lambda: {p.pop("id"): p for p in read_passages(self.data_dir / PASSAGES_FILE)})
+        return {pid: self._passages[pid] for pid in ids if pid in self._passages}
+
+    async def search(self, queries, limit, label=None):
+        return {q: [{"id": m.entity.id, "name": m.entity.name, "label": m.entity.label, "score": m.score}
+                    for m in self.index.resolve(q, label=label, limit=limit)] for q in queries}
+
+    async def neighbors(self, label, ids, limit):
+        out = {}
+        for nid in ids:
+            entry = self.materialized[label].get(nid)
+            if entry is not None:
+                out[nid] = {**entry, "top": entry["top"][:limit]}
+        return out
+
+    def pool(self) -> dict:
+        return {}
+
+    async def close(self):
+        pass
+
+
+def _percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = defaultdict(lambda: {"requests": 0, "errors": 0, "not_modified": 0, "cache_hits": 0,
+                                           "latency": deque(maxlen=2000)})
+        self.started = time.time()
+
+    def record(self, route: str, ms: float, status: int, cache_hit: bool):
+        with self.lock:
+            r = self.routes[route]
+            r["requests"] += 1
+            r["errors"] += status >= 500
+            r["not_modified"] += status == 304
+            r["cache_hits"] += cache_hit
+            r["latency"].append(ms)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            out = {}
+            for route, r in self.routes.items():
+                lat = sorted(r["latency"])
+                out[route] = {k: v for k, v in r.items() if k != "latency"}
+                if lat:
+                    out[route]["latency_ms"] = {"p50": round(_percentile(lat, 50), 2),
+                                                "p95": round(_percentile(lat, 95), 2),
+                                                "p99": round(_percentile(lat, 99), 2)}
+            return {"uptime_s": round(time.time() - self.started, 1), "routes": out}
+
+
+class ResponseCache:
+    """LRU of response bodies keyed by (graph version, request); a version change invalidates everything"""
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        return None
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class Service:
+    def __init__(self, store, cache_size: int = CACHE_SIZE):
+        self.store = store
+        self.cache = ResponseCache(cache_size)
+        self.metrics = Metrics()
+        self._version = None
+        self._version_checked = 0.0
+
+    async def version(self) -> int:
+        now = time.monotonic()
+        if self._version is None or now - self._version_checked >= VERSION_TTL_S:
+            version = await self.store.version()
+            if version != self._version:
+                self.cache.clear()
+            self._version, self._version_checked = version, now
+        return self._version
+
+    def etag(self, version, key) -> str:
+        return f'"v{version}-{hashlib.blake2b(repr(key).encode(), digest_size=8).hexdigest()}"'
+
+    async def respond(self, request: Request, key, compute) -> Response:
+        """Cached, ETag-validated JSON response for `key`; compute() runs only on a miss"""
+        version = await self.version()
+        etag = self.etag(version, key)
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Graph-Version": str(version)}
+        request.state.cache_hit = False
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        body = self.cache.get((version, key))
+        if body is None:
+            body = json.dumps(await compute()).encode()
+            self.cache.put((version, key), body)
+        else:
+            request.state.cache_hit = True
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    async def lookup(self, op: str, ids: list, limit: int, label: Optional[str] = None) -> dict:
+        if label is not None and label.lower() not in LABELS:
+            raise HTTPException(status_code=422, detail=f"unknown label {label}")
+        if op == "treats":
+            return await self.store.treats(ids, limit)
+        if op == "indicated_for":
+            return await self.store.indicated_for(ids, limit)
+        if op == "search":
+            return await self.store.search(ids, limit, LABELS[label.lower()] if label else None)
+        if op == "neighbors":
+            return await self.store.neighbors(LABELS[(label or "supplement").lower()], ids, limit)
+        if op == "passages":
+            return await self.store.passages(ids)
+        raise ValueError(op)
+
+
+def make_store():
+    backend = os.getenv("KG_SERVICE_BACKEND", "neo4j").lower()
+    return CsvStore(os.getenv("KG_DATA_DIR", DATA_DIR)) if backend == "csv" else Neo4jStore()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if getattr(app.state, "service", None) is None:
+        app.state.service = Service(make_store())
+    yield
+    await app.state.service.store.close()
+
+
+app = FastAPI(title="SupplementsRX KG", lifespan=lifespan)
+
+
+def service(request: Request) -> Service:
+    return request.app.state.service
+
+
+@app.middleware("http")
+async def record_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        name = f"{request.method} {route.path if route else request.url.path}"
+        if route and route.path != "/metrics":
+            service(request).metrics.record(name, (time.perf_counter() - start) * 1000, status,
+                                            getattr(request.state, "cache_hit", False))
+
+
+Limit = Query(25, ge=1, le=MAX_LIMIT)
+
+
+@app.get("/health")
+async def health(request: Request):
+    svc = service(request)
+    return {"ok": True, "backend": svc.store.name, "graph_version": await svc.version(), "pool": svc.store.pool()}
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    svc = service(request)
+    return {**svc.metrics.snapshot(), "cache_entries": len(svc.cache.entries)}
+
+
+@app.get("/supplements/{supplement_id}/treats")
+async def treats(request: Request, supplement_id: str, limit: int = Limit):
+    svc = service(request)
+    return await svc.respond(request, ("treats", supplement_id, limit),
+                             lambda: _one(svc, "treats", supplement_id, limit, default=[]))
+
+
+@app.get("/conditions/{condition_id}/indicated-for")
+async def indicated_for(request: Request, condition_id: str, limit: int = Limit):
+    svc = service(request)
+    return await svc.respond(request, ("indicated_for", condition_id, limit),
+                             lambda: _one(svc, "indicated_for", condition_id, limit, default=[]))
+
+
+@app.get("/search")
+async def search(request: Request, q: str = Query(..., min_length=1, max_length=200),
+                 label: Optional[Literal["Supplement", "Condition"]] = None, limit: int = Query(10, ge=1, le=MAX_LIMIT)):
+    svc = service(request)
+    return await svc.respond(request, ("search", q, label, limit),
+                             lambda: _one(svc, "search", q, limit, label, default=[]))
+
+
+@app.get("/neighbors/{label}/{node_id}")
+async def neighbors(request: Request, label: Literal["supplement", "condition"], node_id: str, limit: int = Limit):
+    svc = service(request)
+
+    async def compute():
+        found = await svc.lookup("neighbors", [node_id], limit, label)
+        if node_id not in found:
+            raise HTTPException(status_code=404, detail=f"no {label} {node_id}")
+        return found[node_id]
+    return await svc.respond(request, ("neighbors", label, node_id, limit), compute)
+
+
+@app.get("/passages")
+async def passages(request: Request, id: List[str] = Query(..., min_length=1, max_length=MAX_LIMIT)):
+    """Passage id -> text, url and its span in the source text; ids not found are left out"""
+    svc = service(request)
+    ids = list(dict.fromkeys(id))
+    return await svc.respond(request, ("passages", tuple(ids)), lambda: svc.lookup("passages", ids, MAX_LIMIT))
+
+
+async def _one(svc: Service, op: str, key: str, limit: int, label: str = None, default=None):
+    return (await svc.lookup(op, [key], limit, label)).get(key, default)
+
+
+class Lookup(BaseModel):
+    op: Literal["treats", "indicated_for", "search", "neighbors", "passages"]
+    id: str = Field(..., min_length=1, max_length=200, description="supplement/condition/passage id, or the search text")
+    limit: int = Field(25, ge=1, le=MAX_LIMIT)
+    label: Optional[str] = Field(None, description="search: Supplement|Condition; neighbors: supplement|condition")
+
+
+class BatchBody(BaseModel):
+    lookups: List[Lookup] = Field(..., max_length=500)
+
+
+@app.post("/batch")
+async def batch(request: Request, body: BatchBody):
+    """Results in request order; lookups sharing op/limit/label go to the store as one query"""
+    svc = service(request)
+    key = ("batch", tuple((l.op, l.id, l.limit, l.label) for l in body.lookups))
+
+    async def compute():
+        groups = defaultdict(list)
+        for l in body.lookups:
+            groups[(l.op, l.limit, l.label)].append(l.id)
+        keys = list(groups)
+        answers = await asyncio.gather(*(svc.lookup(op, list(dict.fromkeys(ids)), limit, label)
+                                         for (op, limit, label), ids in groups.items()))
+        found = dict(zip(keys, answers))
+        return {"results": [{"op": l.op, "id": l.id,
+                             "result": found[(l.op, l.limit, l.label)].get(
+                                 l.id, None if l.op in ("neighbors", "passages") else [])}
+                            for l in body.lookups]}
+    return await svc.respond(request, key, compute)
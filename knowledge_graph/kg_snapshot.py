@@ -0,0 +1,118 @@
+"""
+The last state loaded into the KG, so sync_kg.py can diff a new extraction against it
+instead of re-merging everything.
+
+Nodes are keyed on (label, id), edges on (supplement_id, relation_type, condition_id).
+Passages are keyed on their id (a hash of their text). The snapshot file keeps only a
+short fingerprint of each one's properties; evidence text is hashed, never stored. The snapshot records the graph version
+(kg_access.graph_version) it was saved at.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+SNAPSHOT_PATH = Path(__file__).resolve().parent / "data" / "kg_snapshot.json"
+LABELS = ("Supplement", "Condition")
+
+
+def edge_key(edge: dict) -> str:
+    return f"{edge['sid']}|{edge['rel']}|{edge['cid']}"
+
+
+def split_key(key: str) -> dict:
+    sid, rel, cid = key.split("|")
+    return {"sid": sid, "rel": rel, "cid": cid}
+
+
+def digest(value) -> str:
+    return hashlib.blake2b(json.dumps(value, sort_keys=True).encode(), digest_size=8).hexdigest()
+
+
+def merge(old, new):
+    """Field-wise, a later non-null value wins: the same rule as SET x = coalesce(row.x, x)"""
+    if old is None:
+        return new
+    return type(new)(n if n is not None else o for n, o in zip(new, old))
+
+
+def edge_digest(props: list, passage: list) -> str:
+    """Edge fingerprint; edges without a passage reference fingerprint as they did before passages"""
+    return digest(props + passage if any(v is not None for v in passage) else props)
+
+
+EDGE_FIELDS = ("confidence", "method", "evidence", "url", "passage", "evidence_start", "evidence_end")
+PASSAGE_FIELDS = ("url", "start", "end", "text")
+
+
+class State:
+    """
+    Nodes, edges, passages and sources as read from the CSVs. With keep_rows the full edge
+    and passage rows (including evidence) are kept for writing; otherwise only what's needed
+    to fingerprint
+    """
+
+    def __init__(self, keep_rows: bool = False):
+        self.keep_rows = keep_rows
+        self.nodes = {label: {} for label in LABELS}  # label -> id -> (name, entity_type)
+        self.edges = {}  # edge key -> tuple of EDGE_FIELDS (evidence hashed unless keep_rows)
+        self.passages = {}  # passage id -> tuple of PASSAGE_FIELDS (text only with keep_rows)
+        self.sources = set()
+
+    def add_node(self, label: str, row: dict):
+        self.nodes[label][row["id"]] = merge(self.nodes[label].get(row["id"]), (row["name"], row["entity_type"]))
+
+    def add_edge(self, edge: dict):
+        evidence = edge["evidence"]
+        if not self.keep_rows and evidence is not None:
+            evidence = digest(evidence)
+        key = edge_key(edge)
+        values = (edge["confidence"], edge["method"], evidence, edge["url"], edge["passage"],
+                  edge["evidence_start"], edge["evidence_end"])
+        self.edges[key] = merge(self.edges.get(key), values)
+
+    def add_passage(self, row: dict):
+        text = row["text"] if self.keep_rows else None  # the id already stands for the text
+        self.passages[row["id"]] = (row["url"], row["start"], row["end"], text)
+
+    def add_source(self, url: str):
+        self.sources.add(url)
+
+    def edge_fingerprint(self, key: str) -> str:
+        confidence, method, evidence, url, *passage = self.edges[key]
+        if self.keep_rows and evidence is not None:
+            evidence = digest(evidence)
+        return edge_digest([confidence, method, evidence, url], passage)
+
+    def edge_row(self, key: str) -> dict:
+        return {**split_key(key), **dict(zip(EDGE_FIELDS, self.edges[key]))}
+
+    def passage_row(self, pid: str) -> dict:
+        return {"id": pid, **dict(zip(PASSAGE_FIELDS, self.passages[pid]))}
+
+    def fingerprints(self) -> dict:
+        return {
+            "nodes": {label: {nid: digest(list(props)) for nid, props in ids.items()} for label, ids in self.nodes.items()},
+            "edges": {key: self.edge_fingerprint(key) for key in self.edges},
+            "passages": {pid: digest(list(props[:3])) for pid, props in self.passages.items()},
+            "sources": sorted(self.sources),
+        }
+
+
+def load_snapshot(path=SNAPSHOT_PATH) -> dict:
+    """Fingerprints of the last loaded state, or None if nothing was loaded from here yet"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_snapshot(fingerprints: dict, version: int, path=SNAPSHOT_PATH):
+    path = Path(path)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "saved": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                   **fingerprints}, f)
+    os.replace(tmp, path)  # never leave a half-written snapshot behind
@@ -0,0 +1,344 @@
+"""
+Bulk loader for the KG CSVs, a Python replacement for setup.cypher that talks Bolt
+(through kg_access) instead of needing the container's import mount.
+
+Each input file is streamed once and written in batches with parameterized
+`UNWIND $rows` statements:
+  - node batches run in parallel (ids are unique within a file)
+  - edges are bucketed on a grid of supplement bucket x condition bucket. Cells on the
+    same diagonal share no nodes, so a whole diagonal is written concurrently without
+    transactions waiting on each other's node locks; diagonals run one after another
+  - Source nodes come from the same pass over edges_detailed.csv
+  - evidence text is stored once per passage (passages.csv, Passage nodes keyed by content
+    hash); an edge only holds its passage id and the offsets of its evidence in it
+After a load the graph version is bumped, the loaded state saved as the snapshot
+sync_kg.py diffs the next extraction against, and materialize.py recomputes the
+per-node neighbor lists and stats.
+
+    python load_kg.py --data-dir data --workers 4 --batch-size 2000
+    python load_kg.py --dry-run     # parse and partition only, no Neo4j
+"""
+import argparse
+import sys
+import threading
+import time
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import kg_access
+import kg_snapshot
+
+sys.path.append(str(Path(__file__).resolve().parent / "triple_extraction"))
+from utils import PASSAGE_COLUMNS, PASSAGES_FILE, data_file, read_rows  # noqa: E402
+
+DATA_DIR = Path(__file__).resolve().parent / "data"
+NODE_FILES = {
+    "Supplement": ("nodes_supplements.csv", "supplement_id", "supplement_name"),
+    "Condition": ("nodes_conditions.csv", "condition_id", "condition_name"),
+}
+EDGES_FILE = "edges_detailed.csv"
+# evidence_text: extraction output from before the passage store
+EDGE_COLUMNS = ["supplement_id", "condition_id", "relation_type", "confidence", "extraction_method",
+                "evidence_text", "passage_id", "evidence_start", "evidence_end", "source_url"]
+# every type create_relation/get_relation_type can produce (setup.cypher only loads TREATS/INDICATED_FOR)
+REL_TYPES = kg_access.REL_TYPES
+
+NODE_QUERY = """
+UNWIND $rows AS row
+MERGE (n:{label} {{id: row.id}})
+SET n.name = coalesce(row.name, n.name),
+    n.entity_type = coalesce(row.entity_type, n.entity_type)
+"""
+PASSAGE_QUERY = """
+UNWIND $rows AS row
+MERGE (p:Passage {id: row.id})
+SET p.text = row.text, p.url = row.url, p.start = row.start, p.end = row.end
+"""
+SOURCE_QUERY = """
+UNWIND $rows AS url
+MERGE (src:Source {id: url})
+SET src.url = url
+"""
+
+
+def edge_query(rel: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MATCH (s:Supplement {{id: row.sid}})
+    MATCH (c:Condition {{id: row.cid}})
+    MERGE (s)-[r:{rel}]->(c)
+    SET r.confidence = coalesce(row.confidence, r.confidence),
+        r.extraction_method = coalesce(row.method, r.extraction_method),
+        r.evidence_text = CASE WHEN row.passage IS NULL THEN coalesce(row.evidence, r.evidence_text) END,
+        r.passage_id = coalesce(row.passage, r.passage_id),
+        r.evidence_start = coalesce(row.evidence_start, r.evidence_start),
+        r.evidence_end = coalesce(row.evidence_end, r.evidence_end),
+        r.url = coalesce(row.url, r.url)
+    """
+
+
+def clean(value):
+    value = (value or "").strip()
+    return value or None
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def read_nodes(path: Path, id_col: str, name_col: str):
+    """Node rows of a node CSV, or of its Parquet sibling when that's the newer output"""
+    for row in read_rows(path, [id_col, name_col, "entity_type"]):
+        nid = clean(row.get(id_col))
+        if nid:
+            yield {"id": nid, "name": clean(row.get(name_col)), "entity_type": clean(row.get("entity_type"))}
+
+
+def read_edges(path: Path, rel_types=REL_TYPES):
+    """(edge row, source url) per usable line of edges_detailed.csv (or .parquet)"""
+    for row in read_rows(path, EDGE_COLUMNS):
+        url = clean(row.get("source_url"))
+        sid, cid = clean(row.get("supplement_id")), clean(row.get("condition_id"))
+        rel = (clean(row.get("relation_type")) or "").upper()
+        edge = None
+        if sid and cid and rel in rel_types:
+            edge = {
+                "rel": rel, "sid": sid, "cid": cid,
+                "confidence": to_float(row.get("confidence")),
+                "method": clean(row.get("extraction_method")),
+                # evidence is kept verbatim, like setup.cypher
+                "evidence": row.get("evidence_text") or None,
+                "passage": clean(row.get("passage_id")),
+                "evidence_start": to_int(row.get("evidence_start")),
+                "evidence_end": to_int(row.get("evidence_end")),
+                "url": url,
+            }
+        yield edge, url
+
+
+def read_passages(path: Path):
+    """Passage rows of passages.csv (or .parquet); nothing for extraction output from before passages"""
+    if not data_file(path).exists():
+        return
+    for row in read_rows(path, PASSAGE_COLUMNS):
+        pid = clean(row.get("passage_id"))
+        if pid:
+            yield {"id": pid, "url": clean(row.get("source_url")), "start": to_int(row.get("start")),
+                   "end": to_int(row.get("end")), "text": row.get("text") or ""}
+
+
+def chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+class Progress:
+    """Thread-safe row/counter totals per phase, printed at most every `interval` seconds"""
+
+    def __init__(self, interval: float = 2.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.phases = {}
+        self.counters = defaultdict(int)
+        self.last_print = 0.0
+
+    def start(self, phase: str):
+        self.phases[phase] = {"rows": 0, "batches": 0, "start": time.perf_counter(), "seconds": 0.0}
+
+    def add(self, phase: str, rows: int, counters: dict = None):
+        with self.lock:
+            p = self.phases[phase]
+            p["rows"] += rows
+            p["batches"] += 1
+            for k, v in (counters or {}).items():
+                self.counters[k] += v
+            now = time.perf_counter()
+            if now - self.last_print >= self.interval:
+                self.last_print = now
+                elapsed = now - p["start"]
+                print(f"  {phase}: {p['rows']} rows in {p['batches']} batches, {p['rows'] / elapsed:.0f} rows/s")
+
+    def finish(self, phase: str):
+        p = self.phases[phase]
+        p["seconds"] = time.perf_counter() - p["start"]
+        rate = p["rows"] / p["seconds"] if p["seconds"] else 0.0
+        print(f"  {phase}: done, {p['rows']} rows in {p['seconds']:.2f}s ({rate:.0f} rows/s)")
+
+    def report(self) -> dict:
+        phases = {
+            name: {"rows": p["rows"], "batches": p["batches"], "seconds": round(p["seconds"], 3),
+                   "rows_per_s": round(p["rows"] / p["seconds"], 1) if p["seconds"] else None}
+            for name, p in self.phases.items()
+        }
+        return {"phases": phases, "counters": dict(self.counters)}
+
+
+class Loader:
+    def __init__(self, data_dir=DATA_DIR, batch_size: int = 1000, workers: int = 4, grid: int = None,
+                 window_batches: int = 4, rel_types=REL_TYPES, dry_run: bool = False, record: bool = True):
+        self.data_dir = Path(data_dir)
+        self.batch_size = batch_size
+        self.workers = workers
+        self.grid = grid or workers
+        # rows buffered per cell before a flush, so memory stays bounded on large inputs
+        self.window = batch_size * window_batches * self.grid * self.grid
+        self.rel_types = tuple(rel_types)
+        self.dry_run = dry_run
+        # bump the graph version and save the sync snapshot afterwards (off for benchmarks)
+        self.record = record
+        self.rel_counts = defaultdict(int)
+        self.skipped = 0
+        self.progress = Progress()
+        self.state = kg_snapshot.State()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="load")
+
+    def _write(self, phase: str, statements, rows: int):
+        counters = {} if self.dry_run else kg_access.write_statements(statements)
+        self.progress.add(phase, rows, counters)
+
+    def _parallel(self, phase: str, query: str, rows: list):
+        jobs = [self.pool.submit(self._write, phase, [(query, {"rows": batch})], len(batch))
+                for batch in chunks(rows, self.batch_size)]
+        for job in jobs:
+            job.result()
+
+    def load_nodes(self):
+        for label, (fname, id_col, name_col) in NODE_FILES.items():
+            phase = f"nodes:{label}"
+            self.progress.start(phase)
+            query = NODE_QUERY.format(label=label)
+            buffer = []
+            for row in read_nodes(self.data_dir / fname, id_col, name_col):
+                self.state.add_node(label, row)
+                buffer.append(row)
+                if len(buffer) >= self.batch_size * self.workers:
+                    self._parallel(phase, query, buffer)
+                    buffer = []
+            self._parallel(phase, query, buffer)
+            self.progress.finish(phase)
+
+    def load_passages(self):
+        self.progress.start("passages")
+        buffer = []
+        for row in read_passages(self.data_dir / PASSAGES_FILE):
+            self.state.add_passage(row)
+            buffer.append(row)
+            if len(buffer) >= self.batch_size * self.workers:
+                self._parallel("passages", PASSAGE_QUERY, buffer)
+                buffer = []
+        self._parallel("passages", PASSAGE_QUERY, buffer)
+        self.progress.finish("passages")
+
+    def _bucket(self, key: str) -> int:
+        return zlib.crc32(key.encode()) % self.grid
+
+    def _write_cell(self, rows: list):
+        # one relationship type per batch, so each transaction is a single typed UNWIND
+        by_rel = defaultdict(list)
+        for row in rows:
+            by_rel[row["rel"]].append(row)
+        for rel, rel_rows in by_rel.items():
+            query = edge_query(rel)
+            for batch in chunks(rel_rows, self.batch_size):
+                self._write("edges", [(query, {"rows": batch})], len(batch))
+
+    def flush_edges(self, cells: dict):
+        k = self.grid
+        for d in range(k):
+            # cells (i, i+d mod k) touch disjoint supplement and condition buckets
+            jobs = [self.pool.submit(self._write_cell, cells[(i, (i + d) % k)])
+                    for i in range(k) if cells.get((i, (i + d) % k))]
+            for job in jobs:
+                job.result()
+
+    def load_edges(self):
+        self.progress.start("edges")
+        self.progress.start("sources")
+        cells = defaultdict(list)
+        buffered = 0
+        sources = []
+        for edge, url in read_edges(self.data_dir / EDGES_FILE, self.rel_types):
+            if url and url not in self.state.sources:
+                self.state.add_source(url)
+                sources.append(url)
+            if edge is None:
+                self.skipped += 1
+                continue
+            self.rel_counts[edge["rel"]] += 1
+            self.state.add_edge(edge)
+            cells[(self._bucket(edge["sid"]), self._bucket(edge["cid"]))].append(edge)
+            buffered += 1
+            if buffered >= self.window:
+                self.flush_edges(cells)
+                cells, buffered = defaultdict(list), 0
+            if len(sources) >= self.batch_size * self.workers:
+                self._parallel("sources", SOURCE_QUERY, sources)
+                sources = []
+        self.flush_edges(cells)
+        self._parallel("sources", SOURCE_QUERY, sources)
+        self.progress.finish("edges")
+        self.progress.finish("sources")
+
+    def run(self) -> dict:
+        start = time.perf_counter()
+        if not self.dry_run:
+            kg_access.ensure_indexes()
+        try:
+            self.load_nodes()
+            self.load_passages()
+            self.load_edges()
+        finally:
+            self.pool.shutdown()
+        report = self.progress.report()
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        report["dry_run"] = self.dry_run
+        report["edges_by_type"] = dict(self.rel_counts)
+        report["edge_rows_skipped"] = self.skipped
+        if not self.dry_run:
+            if self.record:
+                import materialize  # imports this module
+                report["version"] = kg_access.bump_version({"load": report["counters"]})
+                kg_snapshot.save_snapshot(self.state.fingerprints(), report["version"])
+                report["materialized"] = materialize.refresh()
+            report["pool"] = kg_access.pool_metrics()
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk load the KG CSVs into Neo4j over Bolt")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent transactions")
+    parser.add_argument("--grid", type=int, default=None, help="edge partition buckets per side (default: workers)")
+    parser.add_argument("--dry-run", action="store_true", help="read and partition without writing")
+    args = parser.parse_args()
+
+    loader = Loader(args.data_dir, args.batch_size, args.workers, args.grid, dry_run=args.dry_run)
+    try:
+        report = loader.run()
+    finally:
+        if not args.dry_run:
+            kg_access.close()
+    print(f"Loaded in {report['seconds']}s" + (f", graph version {report['version']}" if "version" in report else ""))
+    for name, counter in report["counters"].items():
+        print(f"  {name}: {counter}")
+    for rel, n in sorted(report["edges_by_type"].items(), key=lambda kv: -kv[1]):
+        print(f"  {rel}: {n} rows")
+    if report["edge_rows_skipped"]:
+        print(f"  skipped {report['edge_rows_skipped']} edge rows (missing ids or unknown relation type)")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
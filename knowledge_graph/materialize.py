@@ -0,0 +1,196 @@
+"""
+Precomputed neighborhoods for the common agent lookups, so "top conditions for
+supplement X" and "supplements for condition Y" are one property read instead of an
+expand + sort per request.
+
+Every Supplement gets
+    top_conditions    JSON list of {id, name, relation, confidence}, best first (top K)
+    degree            number of relationships to conditions
+    relation_counts   JSON {relation type: count}
+and every Condition the same with top_supplements. The same data is written to
+data/materialized.json (keyed by label and id, stamped with the graph version) for
+readers without Neo4j.
+
+load_kg.py reruns this over the whole graph after a load, sync_kg.py only for the
+nodes a delta touched. setup.cypher doesn't, so run it by hand after that script.
+
+    python materialize.py                 # recompute everything from Neo4j
+    python materialize.py --from-csv      # sidecar only, from the CSVs (no Neo4j)
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+import kg_access
+from load_kg import DATA_DIR, EDGES_FILE, NODE_FILES, REL_TYPES, chunks, read_edges, read_nodes
+
+TOP_K = int(os.getenv("KG_TOP_K", "10"))
+SIDECAR_PATH = DATA_DIR / "materialized.json"
+# label -> (property, MATCH pattern with n = the node being materialized, m = its neighbor)
+SIDES = {
+    "Supplement": ("top_conditions", "MATCH (n:Supplement)-[r]->(m:Condition)"),
+    "Condition": ("top_supplements", "MATCH (m:Supplement)-[r]->(n:Condition)"),
+}
+
+
+def summarize(rows, ids, k: int = TOP_K) -> dict:
+    """rows of (node id, neighbor id, neighbor name, relation, confidence) -> per-node entry"""
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row[0]].append(row[1:])
+    out = {}
+    for nid in ids:
+        neighbors = grouped.get(nid, [])
+        neighbors.sort(key=lambda n: (-(n[3] if n[3] is not None else 0.0), n[0], n[2]))
+        out[nid] = {
+            "top": [{"id": m, "name": name, "relation": rel, "confidence": conf}
+                    for m, name, rel, conf in neighbors[:k]],
+            "degree": len(neighbors),
+            "relation_counts": dict(Counter(n[2] for n in neighbors)),
+        }
+    return out
+
+
+def from_graph(label: str, ids: list, k: int) -> dict:
+    _, pattern = SIDES[label]
+    rows = kg_access.read(f"""
+    {pattern}
+    WHERE n.id IN $ids
+    RETURN n.id AS id, m.id AS nid, m.name AS name, type(r) AS rel, r.confidence AS confidence
+    """, {"ids": ids})
+    return summarize([(r["id"], r["nid"], r["name"], r["rel"], r["confidence"]) for r in rows], ids, k)
+
+
+def write_properties(label: str, entries: dict, version: int, batch_size: int):
+    prop, _ = SIDES[label]
+    rows = [{"id": nid, "top": json.dumps(e["top"]), "degree": e["degree"],
+             "relation_counts": json.dumps(e["relation_counts"]), "version": version} for nid, e in entries.items()]
+    kg_access.write_batches(f"""
+    UNWIND $rows AS row
+    MATCH (n:{label} {{id: row.id}})
+    SET n.{prop} = row.top, n.degree = row.degree, n.relation_counts = row.relation_counts,
+        n.materialized_version = row.version
+    """, chunks(rows, batch_size))
+
+
+def load_sidecar(path=SIDECAR_PATH) -> dict:
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_sidecar(data: dict, path=SIDECAR_PATH):
+    path = Path(path)
+    tmp = path.with_suffix(".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def refresh(ids_by_label: dict = None, deleted_by_label: dict = None, k: int = TOP_K, batch_size: int = 500,
+            sidecar_path=SIDECAR_PATH) -> dict:
+    """
+    Recompute the given node ids per label (None = every node) in Neo4j and the sidecar.
+    Falls back to a full pass when there's no sidecar from the same K to patch
+    """
+    start = time.perf_counter()
+    sidecar = load_sidecar(sidecar_path)
+    if ids_by_label is not None and (sidecar is None or sidecar.get("k") != k):
+        ids_by_label = None
+    if ids_by_label is None:
+        sidecar = {"k": k, "labels": {label: {} for label in SIDES}}
+    version = kg_access.graph_version()
+
+    counts = {}
+    for label in SIDES:
+        if ids_by_label is None:
+            ids = [r["id"] for r in kg_access.read(f"MATCH (n:{label}) RETURN n.id AS id")]
+        else:
+            ids = sorted(set(ids_by_label.get(label, ())))
+        entries = {}
+        for batch in chunks(ids, batch_size):
+            entries.update(from_graph(label, batch, k))
+        write_properties(label, entries, version, batch_size)
+        sidecar["labels"][label].update(entries)
+        for nid in (deleted_by_label or {}).get(label, ()):
+            sidecar["labels"][label].pop(nid, None)
+        counts[label] = len(entries)
+
+    sidecar["version"] = version
+    save_sidecar(sidecar, sidecar_path)
+    return {"full": ids_by_label is None, "nodes": counts, "version": version,
+            "seconds": round(time.perf_counter() - start, 3)}
+
+
+def refresh_after_sync(changes: dict, **kwargs) -> dict:
+    """Only the endpoints of changed edges, plus neighbors of renamed nodes (their name is in the lists)"""
+    ids = {label: set() for label in SIDES}
+    for key in changes["edges"]["upsert"] + changes["edges"]["delete"]:
+        sid, _, cid = key.split("|")
+        ids["Supplement"].add(sid)
+        ids["Condition"].add(cid)
+    deleted = {}
+    for label, ops in changes["nodes"].items():
+        ids[label].update(ops["create"] + ops["update"])
+        deleted[label] = ops["delete"]
+        ids[label].difference_update(ops["delete"])
+    renamed = {label: ops["update"] for label, ops in changes["nodes"].items() if ops["update"]}
+    for label, node_ids in renamed.items():
+        other = "Condition" if label == "Supplement" else "Supplement"
+        _, pattern = SIDES[label]
+        rows = kg_access.read(f"{pattern} WHERE n.id IN $ids RETURN DISTINCT m.id AS id", {"ids": node_ids})
+        ids[other].update(r["id"] for r in rows)
+    return refresh({label: sorted(v) for label, v in ids.items()}, deleted, **kwargs)
+
+
+def from_csv(data_dir=DATA_DIR, k: int = TOP_K, sidecar_path=SIDECAR_PATH) -> dict:
+    """The sidecar straight from the CSVs, for the in-process graph and checks without Neo4j"""
+    data_dir = Path(data_dir)
+    names = {label: {row["id"]: row["name"] for row in read_nodes(data_dir / fname, id_col, name_col)}
+             for label, (fname, id_col, name_col) in NODE_FILES.items()}
+    # the same edge can appear more than once in the CSV; the graph keeps one relationship per key
+    edges = {}
+    for edge, _ in read_edges(data_dir / EDGES_FILE, REL_TYPES):
+        if edge:
+            key = (edge["sid"], edge["rel"], edge["cid"])
+            # later non-null confidence wins, as in the loader's coalesce
+            if edge["confidence"] is not None or key not in edges:
+                edges[key] = edge["confidence"]
+    supp_rows = [(s, c, names["Condition"].get(c), rel, conf) for (s, rel, c), conf in edges.items()]
+    cond_rows = [(c, s, names["Supplement"].get(s), rel, conf) for (s, rel, c), conf in edges.items()]
+    sidecar = {
+        "k": k,
+        "version": None,
+        "labels": {
+            "Supplement": summarize(supp_rows, sorted(names["Supplement"]), k),
+            "Condition": summarize(cond_rows, sorted(names["Condition"]), k),
+        },
+    }
+    save_sidecar(sidecar, sidecar_path)
+    return {"full": True, "nodes": {label: len(v) for label, v in sidecar["labels"].items()}, "version": None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materialize top-K neighbors and degree stats on KG nodes")
+    parser.add_argument("--k", type=int, default=TOP_K)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--from-csv", action="store_true", help="write only the sidecar, computed from the CSVs")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    args = parser.parse_args()
+
+    if args.from_csv:
+        print(json.dumps(from_csv(args.data_dir, args.k), indent=2))
+        return 0
+    try:
+        print(json.dumps(refresh(k=args.k, batch_size=args.batch_size), indent=2))
+    finally:
+        kg_access.close()
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,24 @@
+"""
+Relationship types of the graph, shared by the extractor (which emits them) and the
+loaders, service and agent (which accept and index them). No dependencies, so importing
+it doesn't pull in either side.
+"""
+
+# extractor/LLM relation label -> KG relationship type; anything else becomes RELATED_TO
+RELATION_TYPES = {
+    "indicated_for": "INDICATED_FOR",
+    "treats": "TREATS",
+    "prevents": "PREVENTS",
+    "helps_with": "HELPS_WITH",
+    "manages": "MANAGES",
+    "relieves": "RELIEVES",
+    "deficiency": "TREATS_DEFICIENCY",
+    "condition": "INDICATED_FOR",
+    "symptom": "RELIEVES_SYMPTOM",
+    "procedure": "USED_FOR_PROCEDURE",
+    "cleanses": "CLEANSES",
+    "procedure_prep": "USED_FOR_PROCEDURE",
+}
+DEFAULT_RELATION = "RELATED_TO"
+# every relationship type the extraction can emit, i.e. what the KG loaders accept
+ALL_RELATION_TYPES = tuple(dict.fromkeys(list(RELATION_TYPES.values()) + [DEFAULT_RELATION]))
@@ -0,0 +1,247 @@
+"""
+Delta sync between an extraction run and the KG.
+
+Reads the node CSVs, edges_detailed.csv and passages.csv, diffs them against the snapshot of the
+last loaded state (kg_snapshot.py) and applies only what changed:
+  - nodes and edges that are new or whose properties changed are upserted
+  - edges missing from the new extraction are deleted (edges are keyed on
+    supplement_id, relation_type, condition_id), as are nodes gone from the node CSVs
+    and sources no edge row mentions any more; passages are created, updated and deleted
+    like nodes
+Every batch is one transaction. When anything changed the graph version is bumped,
+the snapshot replaced and the materialized neighbor lists of the touched nodes
+recomputed (materialize.py); a failed run leaves the old snapshot, and re-running is
+safe because every write is idempotent.
+
+    python sync_kg.py --dry-run      # show the diff only
+    python sync_kg.py                # apply it
+    python sync_kg.py --from-graph   # diff against what's in Neo4j (first sync after load_kg/setup.cypher)
+"""
+import argparse
+import json
+import time
+from collections import defaultdict
+from pathlib import Path
+import kg_access
+import kg_snapshot
+import materialize
+from kg_snapshot import State, digest, edge_digest
+from load_kg import (DATA_DIR, EDGES_FILE, NODE_FILES, PASSAGES_FILE, REL_TYPES, chunks, read_edges, read_nodes,
+                     read_passages)
+
+NODE_UPSERT = """
+UNWIND $rows AS row
+MERGE (n:{label} {{id: row.id}})
+SET n.name = row.name, n.entity_type = row.entity_type
+"""
+NODE_DELETE = """
+UNWIND $rows AS id
+MATCH (n:{label} {{id: id}})
+DETACH DELETE n
+"""
+PASSAGE_UPSERT = """
+UNWIND $rows AS row
+MERGE (p:Passage {id: row.id})
+SET p.text = row.text, p.url = row.url, p.start = row.start, p.end = row.end
+"""
+PASSAGE_DELETE = """
+UNWIND $rows AS id
+MATCH (p:Passage {id: id})
+DELETE p
+"""
+SOURCE_UPSERT = """
+UNWIND $rows AS url
+MERGE (src:Source {id: url})
+SET src.url = url
+"""
+SOURCE_DELETE = """
+UNWIND $rows AS url
+MATCH (src:Source {id: url})
+DETACH DELETE src
+"""
+
+
+def edge_upsert(rel: str) -> str:
+    # exact SETs rather than the loader's coalesce: the row is the merged final state
+    return f"""
+    UNWIND $rows AS row
+    MATCH (s:Supplement {{id: row.sid}})
+    MATCH (c:Condition {{id: row.cid}})
+    MERGE (s)-[r:{rel}]->(c)
+    SET r.confidence = row.confidence,
+        r.extraction_method = row.method,
+        r.evidence_text = row.evidence,
+        r.passage_id = row.passage,
+        r.evidence_start = row.evidence_start,
+        r.evidence_end = row.evidence_end,
+        r.url = row.url
+    """
+
+
+def edge_delete(rel: str) -> str:
+    return f"""
+    UNWIND $rows AS row
+    MATCH (:Supplement {{id: row.sid}})-[r:{rel}]->(:Condition {{id: row.cid}})
+    DELETE r
+    """
+
+
+def read_state(data_dir=DATA_DIR, rel_types=REL_TYPES) -> State:
+    data_dir = Path(data_dir)
+    state = State(keep_rows=True)
+    for label, (fname, id_col, name_col) in NODE_FILES.items():
+        for row in read_nodes(data_dir / fname, id_col, name_col):
+            state.add_node(label, row)
+    for row in read_passages(data_dir / PASSAGES_FILE):
+        state.add_passage(row)
+    for edge, url in read_edges(data_dir / EDGES_FILE, rel_types):
+        if url:
+            state.add_source(url)
+        if edge:
+            state.add_edge(edge)
+    return state
+
+
+def graph_fingerprints(rel_types=REL_TYPES) -> dict:
+    """Fingerprints of what Neo4j holds now, in the snapshot's layout"""
+    nodes = {}
+    for label in kg_snapshot.LABELS:
+        rows = kg_access.read(f"MATCH (n:{label}) RETURN n.id AS id, n.name AS name, n.entity_type AS entity_type")
+        nodes[label] = {r["id"]: digest([r["name"], r["entity_type"]]) for r in rows}
+    edges = {}
+    rows = kg_access.read("""
+    MATCH (s:Supplement)-[r]->(c:Condition) WHERE type(r) IN $types
+    RETURN s.id AS sid, type(r) AS rel, c.id AS cid, r.confidence AS confidence,
+           r.extraction_method AS method, r.evidence_text AS evidence, r.url AS url,
+           r.passage_id AS passage, r.evidence_start AS evidence_start, r.evidence_end AS evidence_end
+    """, {"types": list(rel_types)})
+    for r in rows:
+        evidence = digest(r["evidence"]) if r["evidence"] is not None else None
+        edges[kg_snapshot.edge_key(r)] = edge_digest([r["confidence"], r["method"], evidence, r["url"]],
+                                                     [r["passage"], r["evidence_start"], r["evidence_end"]])
+    rows = kg_access.read("MATCH (p:Passage) RETURN p.id AS id, p.url AS url, p.start AS start, p.end AS end")
+    passages = {r["id"]: digest([r["url"], r["start"], r["end"]]) for r in rows}
+    sources = [r["id"] for r in kg_access.read("MATCH (src:Source) RETURN src.id AS id")]
+    return {"nodes": nodes, "edges": edges, "passages": passages, "sources": sources}
+
+
+def diff(state: State, previous: dict) -> dict:
+    previous = previous or {"nodes": {}, "edges": {}, "sources": []}
+    current = state.fingerprints()
+    changes = {"nodes": {}, "edges": {"upsert": [], "delete": []}, "passages": {}, "sources": {}}
+
+    for label in kg_snapshot.LABELS:
+        old, new = previous["nodes"].get(label, {}), current["nodes"][label]
+        changes["nodes"][label] = {
+            "create": [nid for nid in new if nid not in old],
+            "update": [nid for nid, fp in new.items() if nid in old and old[nid] != fp],
+            "delete": [nid for nid in old if nid not in new],
+        }
+
+    # snapshots saved before passages existed have none
+    old, new = previous.get("passages", {}), current["passages"]
+    changes["passages"] = {
+        "create": [pid for pid in new if pid not in old],
+        "update": [pid for pid, fp in new.items() if pid in old and old[pid] != fp],
+        "delete": [pid for pid in old if pid not in new],
+    }
+
+    old_edges, new_edges = previous["edges"], current["edges"]
+    for key, fp in new_edges.items():
+        if old_edges.get(key) != fp:
+            changes["edges"]["upsert"].append(key)
+    changes["edges"]["delete"] = [key for key in old_edges if key not in new_edges]
+    changes["edges"]["created"] = sum(1 for key in changes["edges"]["upsert"] if key not in old_edges)
+
+    old_sources, new_sources = set(previous["sources"]), set(current["sources"])
+    changes["sources"] = {"create": sorted(new_sources - old_sources), "delete": sorted(old_sources - new_sources)}
+    return changes
+
+
+def summarize(changes: dict) -> dict:
+    edges = changes["edges"]
+    summary = {
+        "edges_created": edges["created"],
+        "edges_updated": len(edges["upsert"]) - edges["created"],
+        "edges_deleted": len(edges["delete"]),
+        "sources_created": len(changes["sources"]["create"]),
+        "sources_deleted": len(changes["sources"]["delete"]),
+    }
+    for label, ops in list(changes["nodes"].items()) + [("passage", changes["passages"])]:
+        for op, ids in ops.items():
+            summary[f"{label.lower()}_{op}d"] = len(ids)
+    return summary
+
+
+def by_rel(keys):
+    groups = defaultdict(list)
+    for key in keys:
+        groups[kg_snapshot.split_key(key)["rel"]].append(key)
+    return groups
+
+
+def apply(changes: dict, state: State, batch_size: int = 1000) -> dict:
+    """Write the diff, one transaction per batch; returns summed update counters"""
+    totals = defaultdict(int)
+
+    def run(query, rows):
+        for batch in chunks(rows, batch_size):
+            for k, v in kg_access.write(query, {"rows": batch}).items():
+                totals[k] += v
+
+    # nodes first so new edges can MATCH their endpoints, node deletes last
+    for label, ops in changes["nodes"].items():
+        rows = [{"id": nid, "name": state.nodes[label][nid][0], "entity_type": state.nodes[label][nid][1]}
+                for nid in ops["create"] + ops["update"]]
+        run(NODE_UPSERT.format(label=label), rows)
+    passages = changes["passages"]
+    run(PASSAGE_UPSERT, [state.passage_row(pid) for pid in passages["create"] + passages["update"]])
+    for rel, keys in by_rel(changes["edges"]["delete"]).items():
+        run(edge_delete(rel), [kg_snapshot.split_key(k) for k in keys])
+    for rel, keys in by_rel(changes["edges"]["upsert"]).items():
+        run(edge_upsert(rel), [state.edge_row(k) for k in keys])
+    for label, ops in changes["nodes"].items():
+        run(NODE_DELETE.format(label=label), ops["delete"])
+    run(PASSAGE_DELETE, passages["delete"])
+    run(SOURCE_UPSERT, changes["sources"]["create"])
+    run(SOURCE_DELETE, changes["sources"]["delete"])
+    return dict(totals)
+
+
+def sync(data_dir=DATA_DIR, rel_types=REL_TYPES, batch_size: int = 1000, from_graph: bool = False,
+         dry_run: bool = False, snapshot_path=kg_snapshot.SNAPSHOT_PATH) -> dict:
+    start = time.perf_counter()
+    state = read_state(data_dir, rel_types)
+    previous = graph_fingerprints(rel_types) if from_graph else kg_snapshot.load_snapshot(snapshot_path)
+    changes = diff(state, previous)
+    summary = summarize(changes)
+    result = {"summary": summary, "changed": any(summary.values()), "dry_run": dry_run}
+
+    if not dry_run and result["changed"]:
+        result["counters"] = apply(changes, state, batch_size)
+        result["version"] = kg_access.bump_version(summary)
+        kg_snapshot.save_snapshot(state.fingerprints(), result["version"], snapshot_path)
+        result["materialized"] = materialize.refresh_after_sync(changes)
+    result["seconds"] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply only what changed between extraction runs to the KG")
+    parser.add_argument("--data-dir", default=str(DATA_DIR))
+    parser.add_argument("--batch-size", type=int, default=1000, help="rows per transaction")
+    parser.add_argument("--from-graph", action="store_true", help="diff against Neo4j instead of the snapshot")
+    parser.add_argument("--snapshot", default=str(kg_snapshot.SNAPSHOT_PATH))
+    parser.add_argument("--dry-run", action="store_true", help="print the diff without writing")
+    args = parser.parse_args()
+
+    try:
+        result = sync(args.data_dir, REL_TYPES, args.batch_size, args.from_graph, args.dry_run, args.snapshot)
+    finally:
+        kg_access.close()
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
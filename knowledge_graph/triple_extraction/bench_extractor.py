@@ -0,0 +1,140 @@
+"""
+Throughput of MedicalEntityExtractor.extract_entities against the per-pattern
+re.finditer loop it replaced, on a synthetic corpus built from the scraped uses text
+plus generated sentences (keywords, negations, odd casing and window edges that cut
+words). Both must return identical entities for every document.
+
+    python bench_extractor.py --mb 20
+"""
+import argparse
+import json
+import random
+import re
+import time
+from pathlib import Path
+import pandas as pd
+from cleaner import MedicalTextCleaner
+from data_structures import MedicalEntity
+from re_extractor import MedicalEntityExtractor
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+FILLER = ["The supplement", "is commonly", "taken daily", "with food", "in adults", "according to",
+          "several reports", "however", "patients", "may", "notice", "benefits", "over weeks"]
+NEGATIONS = ["not used", "not recommended", "should not be used", "ineffective", "no evidence",
+             "insufficient evidence", "does not treat", "contraindicated", "cannot used", "ineffectiveness",
+             "knot indicated"]
+
+
+def naive_extract(text: str) -> list:
+    """The original loop: every pattern over the whole text, negation regexes per match window"""
+    M = MedicalEntityExtractor
+    entities = []
+    text_lower = text.lower()
+    contains_negative = any(re.search(p, text_lower) for p in M.NEGATIVE_PATTERNS)
+    for pattern, r_type, conf in M.CONDITION_PATTERNS:
+        for match in re.finditer(pattern, text, re.IGNORECASE):
+            span = match.group(1) if match.groups() else match.group(0)
+            cleaned = M.clean_entity(span)
+            if not cleaned or len(cleaned) < 3:
+                continue
+            confidence = conf
+            if contains_negative:
+                start, end = match.span()
+                window = text[max(0, start - 50): min(len(text), end + 50)]
+                if any(re.search(p, window.lower()) for p in M.NEGATIVE_PATTERNS):
+                    confidence *= 0.3
+            context = text[max(0, match.start() - 100):min(len(text), match.end() + 100)]
+            entities.append(MedicalEntity(cleaned, M.normalize_entity(cleaned), r_type, confidence, context))
+    return M.deduplicate_entities(entities)
+
+
+def keywords() -> list:
+    words = []
+    for pattern, _, _ in MedicalEntityExtractor.CONDITION_PATTERNS:
+        words += re.findall(r"[a-z]{4,}", pattern)
+    return sorted(set(words))
+
+
+def scraped_texts() -> list:
+    texts = []
+    for name in ("standardized_rows.csv", "standardized_rows_mayo.csv"):
+        path = DATA_DIR / name
+        if path.exists():
+            df = pd.read_csv(path).fillna("")
+            texts += list(MedicalTextCleaner.clean_many(df["uses_text"].astype(str)))
+    return [t for t in texts if t]
+
+
+def synthetic_doc(rng: random.Random, words: list, n_sentences: int) -> str:
+    sentences = []
+    for _ in range(n_sentences):
+        parts = rng.sample(FILLER, 3)
+        kind = rng.random()
+        if kind < 0.4:
+            parts.insert(rng.randrange(4), rng.choice(["used to treat", "indicated for", "for the treatment of",
+                                                       "helps with", "relief of", "before", "used to prevent"]))
+            parts.append(" ".join(rng.sample(words, 2)))
+        elif kind < 0.7:
+            parts.append(rng.choice(words) + rng.choice(["", "s", " deficiency", "oscopy", " surgery"]))
+        if rng.random() < 0.25:
+            parts.insert(rng.randrange(4), rng.choice(NEGATIONS))
+        sentence = " ".join(parts)
+        if rng.random() < 0.1:
+            sentence = sentence.upper()
+        if rng.random() < 0.002:
+            sentence = sentence.replace("s", "ſ", 1).replace("i", "İ", 1).replace("k", "K", 1)
+        sentences.append(sentence + rng.choice([".", ";", ",", " in patients with", ""]))
+    return " ".join(sentences)
+
+
+def corpus(mb: float, seed: int) -> list:
+    rng = random.Random(seed)
+    words = keywords()
+    docs = scraped_texts()
+    size = sum(len(d) for d in docs)
+    while size < mb * 1024 * 1024:
+        doc = synthetic_doc(rng, words, rng.randint(5, 60))
+        docs.append(doc)
+        size += len(doc)
+    rng.shuffle(docs)
+    return docs
+
+
+def timed(fn, docs) -> tuple:
+    start = time.perf_counter()
+    out = [fn(d) for d in docs]
+    return out, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MedicalEntityExtractor throughput")
+    parser.add_argument("--mb", type=float, default=10.0, help="corpus size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    docs = corpus(args.mb, args.seed)
+    mb = sum(len(d.encode("utf-8")) for d in docs) / 1024 / 1024
+    MedicalEntityExtractor.compile()
+    naive, naive_s = timed(naive_extract, docs)
+    fast, fast_s = timed(MedicalEntityExtractor.extract_entities, docs)
+
+    mismatched = [i for i, (a, b) in enumerate(zip(naive, fast)) if [e.to_dict() for e in a] != [e.to_dict() for e in b]]
+    results = {
+        "documents": len(docs),
+        "mb": round(mb, 2),
+        "entities": sum(len(e) for e in fast),
+        "per_pattern_loop": {"seconds": round(naive_s, 3), "mb_per_s": round(mb / naive_s, 2)},
+        "single_pass": {"seconds": round(fast_s, 3), "mb_per_s": round(mb / fast_s, 2)},
+        "speedup": round(naive_s / fast_s, 2),
+        "mismatched_documents": len(mismatched),
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if mismatched else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,120 @@
+"""
+Cost saved against triples lost by each LLMPolicy on a sample of input rows. Every policy
+extracts the same rows through the configured LLM; its cost is the tokens of its requests,
+spent or served from the LLM cache, at --price-in/--price-out USD per million. Triples
+are checked against a labeled sample (--labels: supplement_name, condition and optionally
+relation_type per expected triple; only rows of labeled supplements are sampled), or
+without labels against what the "always" policy finds, which asks about every row in full.
+
+    python bench_llm_policy.py --sample 200 --labels labeled.csv
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+from pathlib import Path
+import pandas as pd
+from combined import SupplementTripleExtractor, row_fields
+from llm_extraction import llm_enabled
+from llm_cache import CACHE_MODES
+from llm_policy import LLM_POLICIES, LLMPolicy
+from re_extractor import MedicalEntityExtractor
+from utils import create_id
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+# gpt-4o-mini list prices, USD per million tokens
+PRICE_IN = 0.15
+PRICE_OUT = 0.60
+
+
+def load_labels(path: str) -> set:
+    """(supplement id, condition id[, relation type]) per labeled triple, ids as extraction makes them"""
+    df = pd.read_csv(path).fillna("")
+    relation = "relation_type" in df.columns
+    keys = set()
+    for r in df.to_dict('records'):
+        key = (create_id(r["supplement_name"]), create_id(MedicalEntityExtractor.normalize_entity(r["condition"])))
+        keys.add(key + (r["relation_type"],) if relation else key)
+    return keys
+
+
+def run_policy(mode: str, input_path: str, rows: list, cache_mode: str) -> tuple:
+    with tempfile.TemporaryDirectory() as out:
+        e = SupplementTripleExtractor(input_path, out, llm_cache=cache_mode, llm_policy=LLMPolicy(mode))
+        per_row = asyncio.run(e.extract_rows(rows))
+    return per_row, e.llm_log, e.stats.get('llm', {}), e.stats.get('llm_policy', {})
+
+
+def summarize(mode, rows, per_row, log, llm, policy, reference, args) -> dict:
+    cache = llm.get('cache', {})
+    input_tokens = llm.get('input_tokens', 0) + cache.get('saved_input_tokens', 0)
+    output_tokens = llm.get('output_tokens', 0) + cache.get('saved_output_tokens', 0)
+    width = len(next(iter(reference), ()))
+    found = {(t.supplement_id, t.condition_id, t.relation_type)[:width] for triples in per_row for t in triples}
+    by_row = {row_id: triples for (row_id, _), triples in zip(rows, per_row)}
+    adding = sum(any(t.extraction_method == "llm" for t in by_row[r['row']]) for r in log)
+    return {
+        "rows_sent": len(log),
+        "rows_failed": sum(not r['ok'] for r in log),
+        "rows_sent_as_sentences": policy.get('trimmed', 0),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": round((input_tokens * args.price_in + output_tokens * args.price_out) / 1e6, 4),
+        "triples": sum(len(triples) for triples in per_row),
+        "llm_triples": sum(t.extraction_method == "llm" for triples in per_row for t in triples),
+        "sent_rows_adding_llm_triples": round(adding / len(log), 3) if log else None,
+        "labels_found": len(found & reference),
+        "recall": round(len(found & reference) / len(reference), 3) if reference else None,
+        "_found": found,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM policy cost saved vs triples lost")
+    parser.add_argument("--input", default=str(DATA_DIR / "standardized_rows.csv"))
+    parser.add_argument("--labels", default=None, help="CSV of expected triples for the sampled supplements")
+    parser.add_argument("--sample", type=int, default=200, help="rows to extract")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-cache", choices=CACHE_MODES, default="use",
+                        help="cached answers cost nothing to rerun but are priced as if asked")
+    parser.add_argument("--price-in", type=float, default=PRICE_IN, help="USD per million input tokens")
+    parser.add_argument("--price-out", type=float, default=PRICE_OUT, help="USD per million output tokens")
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+    if not llm_enabled():
+        print("No LLM configured (OPENAI_API_KEY), nothing to compare")
+        return 2
+
+    with tempfile.TemporaryDirectory() as out:
+        df = SupplementTripleExtractor(args.input, out).load_data()
+    labels = load_labels(args.labels) if args.labels else None
+    if labels is not None:
+        df = df[df['supplement_name'].astype(str).str.strip().map(create_id).isin({k[0] for k in labels})]
+    # repeated rows would share one request in the first run and hit the cache in the others
+    df = df.drop_duplicates(['supplement_name', 'url', 'cleaned_text'])
+    df = df.sample(n=min(args.sample, len(df)), random_state=args.seed)
+    rows = [(row_id, row_fields(row)) for row_id, row in zip(df.index, df.to_dict('records'))]
+
+    runs = {mode: run_policy(mode, args.input, rows, args.llm_cache) for mode in LLM_POLICIES}
+    reference = labels
+    if reference is None:
+        reference = {(t.supplement_id, t.condition_id, t.relation_type) for triples in runs["always"][0] for t in triples}
+    results = {mode: summarize(mode, rows, *run, reference, args) for mode, run in runs.items()}
+    always = results["always"]
+    for mode, r in results.items():
+        if mode != "always":
+            r["cost_saved"] = round(1 - r["cost_usd"] / always["cost_usd"], 3) if always["cost_usd"] else None
+            r["labels_lost"] = len((always["_found"] & reference) - r["_found"])
+    for r in results.values():
+        del r["_found"]
+
+    report = {"rows": len(rows), "labels": len(reference), "labeled": labels is not None, "policies": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,159 @@
+"""
+Memory per triple and edge export/write throughput of the slotted Triple with shared
+strings (StringTable) and column-wise writers, against the plain dataclass records and
+per-record asdict rows they replaced. Triples are built the way extraction builds them
+(combined.entity_triples) from the regex entities of the scraped uses text, row after row
+under synthetic supplement names; the entities are extracted once per text, so evidence
+strings are not part of the measured memory. Both writers must produce identical files.
+
+    python bench_triples.py --triples 200000
+"""
+import argparse
+import filecmp
+import gc
+import json
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from pathlib import Path
+import pandas as pd
+from bench_extractor import scraped_texts
+from combined import entity_triples
+from re_extractor import MedicalEntityExtractor
+from utils import create_id
+from data_structures import StringTable
+from utils import EDGE_COLUMNS, PASSAGE_COLUMNS, TRIPLE_COLUMNS, EdgeWriter, row_passages
+
+
+@dataclass
+class LegacyTriple:
+    """Triple as it was: __dict__ per instance, to_dict through asdict"""
+    supplement_id: str
+    supplement_name: str
+    relation_type: str
+    condition_id: str
+    condition_name: str
+    confidence: float
+    extraction_method: str
+    source_url: str
+    evidence_text: str
+    evidence_offset: int = -1
+    def to_dict(self): return asdict(self)
+
+
+class LegacyEdgeWriter(EdgeWriter):
+    """EdgeWriter building a dict per edge and the DataFrame from those"""
+
+    def write(self, per_row):
+        edges, passages = [], []
+        for triples in per_row:
+            found, refs = row_passages(triples)
+            for t, (pid, start, end) in zip(triples, refs):
+                row = t.to_dict()
+                del row['evidence_text'], row['evidence_offset']
+                edges.append({**row, "passage_id": pid, "evidence_start": start, "evidence_end": end})
+            passages += found
+        new = self.passage_keys.add([bytes.fromhex(p["passage_id"]) for p in passages])
+        passages = [p for p, first in zip(passages, new) if first]
+        if not edges:
+            return
+        edges_df = pd.DataFrame(edges, columns=EDGE_COLUMNS)
+        basic = edges_df[["relation_type", "supplement_id", "condition_id", "source_url"]].rename(
+            columns={"relation_type": "type", "source_url": "url"})
+        for name, df in (("detailed", edges_df), ("basic", basic), ("high_conf", edges_df[edges_df['confidence'] > 0.8]),
+                         ("passages", pd.DataFrame(passages, columns=PASSAGE_COLUMNS))):
+            df.to_csv(self.files[name], header=False, index=False)
+            self.counts[name] += len(df)
+
+
+def input_rows(n_triples: int) -> list:
+    """(name, url, cleaned text, entities) rows cycling through the scraped texts until they yield n_triples"""
+    texts = [(t, MedicalEntityExtractor.extract_entities(t)) for t in scraped_texts()]
+    texts = [(t, e, len(entity_triples("x", "x", "", t, e))) for t, e in texts]
+    texts = [t for t in texts if t[2]]
+    rows, total, i = [], 0, 0
+    while total < n_triples:
+        text, entities, n = texts[i % len(texts)]
+        rows.append((f"Supplement {i % 5000}", f"https://example.org/{i % 5000}", text, entities))
+        total += n
+        i += 1
+    return rows
+
+
+def triples(fields):
+    name, url, text, entities = fields
+    return entity_triples(name, create_id(name), url, text, entities)
+
+
+def legacy(fields):
+    return [LegacyTriple(*(getattr(t, c) for c in TRIPLE_COLUMNS)) for t in triples(fields)]
+
+
+def measured(build, rows) -> tuple:
+    """Per-row triples from build(fields), and the bytes they hold once built"""
+    gc.collect()
+    tracemalloc.start()
+    per_row = [build(fields) for fields in rows]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return per_row, size
+
+
+def timed(fn, *args) -> float:
+    gc.collect()
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def write(writer_cls, per_row, out_dir: Path):
+    with writer_cls(out_dir) as writer:
+        for i in range(0, len(per_row), 5000):
+            writer.write(per_row[i:i + 5000])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Triple memory and write throughput")
+    parser.add_argument("--triples", type=int, default=200_000)
+    parser.add_argument("--output", default=None, help="write results as JSON")
+    args = parser.parse_args()
+
+    rows = input_rows(args.triples)
+    strings = StringTable()
+    old, old_bytes = measured(legacy, rows)
+    new, new_bytes = measured(lambda fields: strings.triples(triples(fields)), rows)
+    n = sum(len(t) for t in new)
+
+    old_flat = [t for triples in old for t in triples]
+    new_flat = [t for triples in new for t in triples]
+    frame_old = timed(lambda: pd.DataFrame([t.to_dict() for t in old_flat], columns=TRIPLE_COLUMNS))
+    frame_new = timed(lambda: pd.DataFrame({c: [getattr(t, c) for t in new_flat] for c in TRIPLE_COLUMNS}))
+    with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b:
+        write_old = timed(write, LegacyEdgeWriter, old, Path(a))
+        write_new = timed(write, EdgeWriter, new, Path(b))
+        names = list(EdgeWriter.FILES.values())
+        _, mismatch, errors = filecmp.cmpfiles(a, b, names, shallow=False)
+
+    results = {
+        "rows": len(rows),
+        "triples": n,
+        "distinct_strings": len(strings),
+        "dataclass_asdict": {"bytes_per_triple": round(old_bytes / n, 1), "frame_s": round(frame_old, 3),
+                             "write_s": round(write_old, 3), "triples_per_s": round(n / write_old)},
+        "slots_columns": {"bytes_per_triple": round(new_bytes / n, 1), "frame_s": round(frame_new, 3),
+                          "write_s": round(write_new, 3), "triples_per_s": round(n / write_new)},
+        "memory_ratio": round(new_bytes / old_bytes, 3),
+        "write_speedup": round(write_old / write_new, 2),
+        "mismatched_files": mismatch + errors,
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if mismatch or errors else 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -1,4 +1,10 @@
 import re
+import pandas as pd
+
+# non-ASCII characters re.IGNORECASE matches to an ASCII letter; folding them first lets
+# plain lowercase string lookups agree with the case-insensitive patterns
+ASCII_FOLD = str.maketrans({'\u0130': 'i', '\u0131': 'i', '\u017f': 's', '\u212a': 'k'})
+
 
 class MedicalTextCleaner:
     JUNK_PATTERNS = [
@@ -18,35 +24,73 @@ class MedicalTextCleaner:
         r'^[A-Z]{2,}(?:\s+[A-Z]{2,})+$',
         r'^\w+\s+Kit\b', r'^\w+\s+Prep\b',
     ]
+    KEYWORDS = [
+        'used to', 'treat', 'prevent', 'manage', 'relief', 'symptoms', 'condition', 'disease',
+        'deficiency', 'indicated for', 'therapy', 'patient', 'clinical', 'medicine',
+        'laxative', 'cleanse', 'preparation', 'colonoscopy', 'procedure', 'injection', 'supplement'
+    ]
+    TAG = re.compile(r'<[^>]+>')
+    # all junk patterns in one pass, to find the texts that have any junk at all; those are
+    # then cleaned pattern by pattern (JUNK_EACH), since removing nested or overlapping junk
+    # phrases in one pass can come out differently. An alternation under re.I tries every
+    # branch at every position; the same alternation lowercased, run case-sensitively over the
+    # folded text, lets the regex engine skip to the branches' first characters (JUNK_PATTERNS
+    # are literals plus \s \d . so lowercasing is safe)
+    JUNK = re.compile('|'.join(f'(?:{p})' for p in JUNK_PATTERNS), re.I | re.S)
+    JUNK_FOLDED = re.compile('|'.join(f'(?:{p})' for p in JUNK_PATTERNS).lower(), re.S)
+    JUNK_EACH = [re.compile(p, re.I | re.S) for p in JUNK_PATTERNS]
+    # runs of whitespace other than a lone space; same result as \s+ -> ' ' without rewriting every gap
+    SPACES = re.compile(r' \s+|[^\S ]\s*')
+    PRODUCT = re.compile('|'.join(f'(?:{p})' for p in PRODUCT_PATTERNS))
+    KEYWORD = re.compile('|'.join(re.escape(kw) for kw in KEYWORDS))
+
     @classmethod
     def clean_text(cls, text: str) -> str:
         if not text or not isinstance(text, str):
             return ""
 
-        cleaned = re.sub(r'<[^>]+>', ' ', text)
+        cleaned = cls.strip_junk(cls.TAG.sub(' ', text))
+        return cls.SPACES.sub(' ', cleaned).strip()
+
+    @classmethod
+    def strip_junk(cls, text: str) -> str:
+        folded = text.translate(ASCII_FOLD).lower()
+        if len(folded) != len(text):
+            junk = cls.JUNK.search(text)
+        else:
+            junk = cls.JUNK_FOLDED.search(folded)
+        if junk is None:
+            return text
+        for pattern in cls.JUNK_EACH:
+            text = pattern.sub(' ', text)
+        return text
 
-        for pattern in cls.JUNK_PATTERNS:
-            cleaned = re.sub(pattern, ' ', cleaned, flags=re.I | re.S)
+    @classmethod
+    def clean_many(cls, texts: pd.Series) -> pd.Series:
+        """clean_text over a column"""
+        # object dtype: the str methods then run Python's re, as clean_text does (the pyarrow
+        # string dtype's regex engine has ASCII-only \s and \w)
+        texts = texts.astype(object).map(lambda t: t if isinstance(t, str) else "")
+        return (texts.str.replace(cls.TAG, ' ', regex=True)
+                .map(cls.strip_junk)
+                .str.replace(cls.SPACES, ' ', regex=True)
+                .str.strip())
 
-        cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-        return cleaned
+    @classmethod
+    def validate_many(cls, cleaned: pd.Series) -> pd.Series:
+        """is_valid_medical_text over a column of cleaned texts"""
+        # object dtype for Python's re and str.lower, as in clean_many
+        cleaned = cleaned.astype(str).astype(object)
+        product = cleaned.str.slice(0, 100).str.match(cls.PRODUCT).astype(bool)
+        keyword = cleaned.str.lower().str.contains(cls.KEYWORD, regex=True).astype(bool)
+        return (cleaned.str.len() >= 40) & ~product & keyword
 
     @classmethod
     def is_valid_medical_text(cls, text: str) -> bool:
         if not text or len(text) < 40:
             return False
 
-        first_100 = text[:100]
-        for pattern in cls.PRODUCT_PATTERNS:
-            if re.match(pattern, first_100):
-                return False
-
-        keywords = [
-            'used to', 'treat', 'prevent', 'manage', 'relief', 'symptoms', 'condition', 'disease',
-            'deficiency', 'indicated for', 'therapy', 'patient', 'clinical', 'medicine',
-            'laxative', 'cleanse', 'preparation', 'colonoscopy', 'procedure', 'injection', 'supplement'
-        ]
+        if cls.PRODUCT.match(text[:100]):
+            return False
 
-        text_lower = text.lower()
-        found = sum(1 for kw in keywords if kw in text_lower)
-        return found >= 1
+        return cls.KEYWORD.search(text.lower()) is not None
@@ -1,18 +1,106 @@
+import asyncio
+import hashlib
+import json
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import Dict, List
 import pandas as pd
 from collections import defaultdict
-from data_structures import Triple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from data_structures import Triple, StringTable, RELATION_TYPES, DEFAULT_RELATION
 from cleaner import MedicalTextCleaner
 from re_extractor import MedicalEntityExtractor
-from llm_extraction import llm_extract_triples, create_relation
-from utils import create_id, write_nodes, write_edges, write_stats
+from llm_extraction import (AsyncLLMExtractor, BATCH_SYSTEM_PROMPT, LLM_BATCH_TOKENS, LLM_CONCURRENCY, LLM_MODEL,
+                            SYSTEM_PROMPT, llm_enabled, llm_extract_triples, create_relation)
+from llm_cache import LLMCache
+from llm_policy import LLMPolicy, prompt_tokens
+from utils import (create_id, write_nodes, write_edges, write_stats, write_llm_log, load_manifest, save_manifest,
+                   row_hash, edge_writer, TRIPLE_COLUMNS)
+
+def row_fields(row) -> tuple:
+    """(name, url, cleaned text); the text is cleaned here unless load_data already did it"""
+    cleaned_text = row.get('cleaned_text')
+    if cleaned_text is None:
+        cleaned_text = MedicalTextCleaner.clean_text(str(row.get('uses_text', '')).strip())
+    return str(row.get('supplement_name', '')).strip(), str(row.get('url', '')).strip(), cleaned_text
+
+
+def regex_row(fields: tuple, policy: LLMPolicy = None):
+    """Regex half of a row, run in the worker processes, and the LLMPlan for the rest. None when there's no usable text"""
+    sup_name, url, cleaned_text = fields
+    if not cleaned_text:
+        return None
+    sup_id = create_id(sup_name)
+    entities = MedicalEntityExtractor.extract_entities(cleaned_text)
+    plan = (policy or LLMPolicy("always")).plan(cleaned_text, entities)
+    return sup_name, sup_id, url, cleaned_text, entity_triples(sup_name, sup_id, url, cleaned_text, entities), plan
+
+
+def entity_triples(sup_name: str, sup_id: str, url: str, cleaned_text: str, entities: list) -> List[Triple]:
+    result: List[Triple] = []
+    for ent in entities:
+        if ent.confidence < 0.5:
+            continue
+
+        result.append(Triple(
+            supplement_id=sup_id,
+            supplement_name=sup_name,
+            relation_type=RELATION_TYPES.get(ent.entity_type, DEFAULT_RELATION),
+            condition_id=create_id(ent.normalized),
+            condition_name=ent.normalized,
+            confidence=ent.confidence,
+            extraction_method=ent.entity_type,
+            source_url=url,
+            evidence_text=ent.source_context[:500],
+            evidence_offset=cleaned_text.find(ent.source_context)
+        ))
+    return result
+
+
+def extraction_fingerprint(llm_batched: bool = False, llm_policy: LLMPolicy = None) -> str:
+    """Everything besides the row itself that decides a row's triples; a manifest from other settings is discarded"""
+    parts = [MedicalTextCleaner.JUNK_PATTERNS, MedicalTextCleaner.PRODUCT_PATTERNS,
+             MedicalEntityExtractor.CONDITION_PATTERNS, MedicalEntityExtractor.NEGATIVE_PATTERNS,
+             MedicalEntityExtractor.NORMALIZATION_MAP, RELATION_TYPES, DEFAULT_RELATION,
+             LLM_MODEL if llm_enabled() else None, SYSTEM_PROMPT if llm_enabled() else None,
+             TRIPLE_COLUMNS]
+    if llm_enabled() and llm_batched:
+        parts.append(BATCH_SYSTEM_PROMPT)
+    if llm_enabled() and llm_policy is not None and llm_policy.settings():
+        parts.append(llm_policy.settings())
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True).encode(), digest_size=8).hexdigest()
+
 
 class SupplementTripleExtractor:
-    def __init__(self, input_path: str, output_dir: str):
+    def __init__(self, input_path: str, output_dir: str, workers: int = 1, llm_concurrency: int = LLM_CONCURRENCY,
+                 llm_cache: str = "use", incremental: bool = False, chunk_size: int = 0, output_format: str = "csv",
+                 llm_batch_tokens: int = LLM_BATCH_TOKENS, llm_policy: LLMPolicy = None):
+        if incremental and chunk_size:
+            raise ValueError("incremental extraction keeps the whole manifest in memory and can't be streamed")
         self.input_path = Path(input_path)
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # workers > 1: regex extraction in that many processes
+        self.workers = workers
+        self.llm_concurrency = llm_concurrency
+        # LLMCache mode: use, refresh (re-ask and overwrite) or off
+        self.llm_cache = llm_cache
+        # > 0: rows share LLM requests up to this many estimated tokens (see AsyncLLMExtractor)
+        self.llm_batch_tokens = llm_batch_tokens
+        # which rows, or which sentences of a row, are sent to the LLM (see LLMPolicy)
+        self.llm_policy = llm_policy or LLMPolicy()
+        # incremental: reuse the triples of rows whose content hash is in the manifest, extract only the rest
+        self.incremental = incremental
+        self.manifest = {}
+        self.invalid_hashes = {}
+        # chunk_size > 0: stream the input that many rows at a time (see stream)
+        self.chunk_size = chunk_size
+        # csv, or parquet (nodes and one edges file; see utils.ParquetEdgeWriter)
+        self.output_format = output_format
+        # one entry per LLM request (row id, outcome, tokens, latency), failures included
+        self.llm_log: List[dict] = []
+        # ids, names and URLs shared by every triple that repeats them
+        self.strings = StringTable()
         self.cleaner = MedicalTextCleaner()
         self.extractor = MedicalEntityExtractor()
         self.stats = {
@@ -26,104 +114,266 @@ class SupplementTripleExtractor:
         }
 
     def process(self) -> Dict[str, any]:
+        if self.chunk_size:
+            return asyncio.run(self.stream())
         df = self.load_data()
         self.stats['total_rows'] = len(df)
 
-        all_triples: List[Triple] = []
         all_conditions: Dict[str, str] = {}
         all_supplements: Dict[str, str] = {}
 
-        for _, row in df.iterrows():
-            triples = self.extract_from_row(row)
-
-            all_triples.extend(triples)
-            for t in triples:
-                all_supplements[t.supplement_id] = t.supplement_name
-                all_conditions[t.condition_id] = t.condition_name
-                self.stats['unique_supplements'].add(t.supplement_id)
-                self.stats['unique_conditions'].add(t.condition_id)
-                self.stats['extraction_methods'][t.extraction_method] += 1
+        rows = [(row_id, row_fields(row)) for row_id, row in zip(df.index, df.to_dict('records'))]
+        # per-row triples come back in input order whatever the worker count, so the accumulators and stats don't depend on it
+        per_row = self.incremental_rows(rows, df['row_hash']) if self.incremental else asyncio.run(self.extract_rows(rows))
+        for triples in per_row:
+            self.count(triples, all_conditions, all_supplements)
 
-        self.stats['total_triples'] = len(all_triples)
-        write_nodes(all_conditions, all_supplements, self.output_dir)
-        write_edges(all_triples, self.output_dir)
+        self.stats['total_triples'] = sum(len(triples) for triples in per_row)
+        write_nodes(all_conditions, all_supplements, self.output_dir, self.output_format)
+        # kept per row: a row's evidence windows are merged into passages (utils.row_passages)
+        self.stats['passages'] = write_edges(per_row, self.output_dir, self.output_format)['passages']
         write_stats(self.stats, self.output_dir)
+        if self.llm_log:
+            write_llm_log(self.llm_log, self.output_dir)
+            self.report_llm()
 
         return self.stats
 
+    async def stream(self) -> Dict[str, any]:
+        """
+        process() for inputs of any size: the CSV is read chunk_size rows at a time and each
+        chunk's edges are appended to the output files before the next chunk is read, so
+        only the node id -> name maps grow with the input. Triples are deduplicated within
+        their row only, as in process(), so the output doesn't depend on chunk_size
+        """
+        conditions: Dict[str, str] = {}
+        supplements: Dict[str, str] = {}
+        with edge_writer(self.output_dir, self.output_format) as edges:
+            async with self.extraction() as extract:
+                for i, chunk in enumerate(pd.read_csv(self.input_path, chunksize=self.chunk_size)):
+                    df = self.prepare(chunk, announce=i == 0)
+                    self.stats['total_rows'] += len(df)
+                    rows = [(row_id, row_fields(row)) for row_id, row in zip(df.index, df.to_dict('records'))]
+                    per_row = await extract(rows)
+                    for triples in per_row:
+                        self.count(triples, conditions, supplements)
+                    edges.write(per_row)
+                    if self.llm_log:
+                        write_llm_log(self.llm_log, self.output_dir, append=i > 0)
+                        self.llm_log = []
+                    print(f"Chunk {i + 1}: {self.stats['total_rows']} valid rows, "
+                          f"{edges.counts['detailed']} edges so far")
+
+        if self.stats['invalid_rows']:
+            print(f"Skipped {self.stats['invalid_rows']} invalid rows")
+        self.stats['total_triples'] = edges.counts['detailed']
+        self.stats['passages'] = edges.counts['passages']
+        write_nodes(conditions, supplements, self.output_dir, self.output_format)
+        write_stats(self.stats, self.output_dir)
+        self.report_llm()
+        return self.stats
+
+    def count(self, triples: List[Triple], conditions: Dict[str, str], supplements: Dict[str, str]):
+        for t in triples:
+            supplements[t.supplement_id] = t.supplement_name
+            conditions[t.condition_id] = t.condition_name
+            self.stats['unique_supplements'].add(t.supplement_id)
+            self.stats['unique_conditions'].add(t.condition_id)
+            self.stats['extraction_methods'][t.extraction_method] += 1
+
+    def report_llm(self):
+        if 'llm' in self.stats:
+            llm = self.stats['llm']
+            print(f"LLM: {llm['requests']} requests, {llm['failed']} failed, {llm['retries']} retries, "
+                  f"{llm['input_tokens']}+{llm['output_tokens']} tokens (per row: llm_requests.csv)")
+            if llm['batches']:
+                print(f"LLM batching: {llm['batched_rows']} rows in {llm['batches']} requests, "
+                      f"{llm['fallback_rows']} retried alone ({llm['failed_batches']} batches failed)")
+            if 'llm_policy' in self.stats:
+                p = self.stats['llm_policy']
+                print(f"LLM policy {p['policy']}: {p['requested']} of {p['rows']} rows sent ({p['trimmed']} as their "
+                      f"uncovered sentences), {p['covered']} left to regex as covered, {p['short']} too short; "
+                      f"~{p['prompt_tokens_saved']} prompt tokens not sent")
+            if llm.get('cache', {}).get('mode', 'off') != 'off':
+                c = llm['cache']
+                print(f"LLM cache ({c['mode']}): {c['hits']} hits, {c['misses']} misses, hit rate {c['hit_rate']}, "
+                      f"{c['entries']} entries / {c['mb']} MB")
+
+    def incremental_rows(self, rows: List[tuple], hashes: pd.Series) -> List[List[Triple]]:
+        """
+        Triples for every valid row in input order, extracting only rows whose hash isn't
+        in the manifest. Rows gone from the input drop out of the new manifest with their
+        triples; rows whose LLM request failed aren't recorded, so the next run retries them
+        """
+        known = self.manifest.get('rows', {})
+        todo, seen = [], set()
+        for row_id, fields in rows:
+            h = hashes[row_id]
+            if known.get(h, {}).get('triples') is None and h not in seen:
+                seen.add(h)
+                todo.append((row_id, fields))
+        fresh = dict(zip((hashes[row_id] for row_id, _ in todo), asyncio.run(self.extract_rows(todo))))
+        failed = {hashes[r['row']] for r in self.llm_log if not r['ok']}
+
+        entries, per_row = {}, []
+        for row_id, _ in rows:
+            h = hashes[row_id]
+            if h in fresh:
+                triples = fresh[h]
+                if h not in failed:
+                    entries[h] = {'valid': True, 'triples': [list(t.to_dict().values()) for t in triples]}
+            else:
+                entries[h] = known[h]
+                triples = self.strings.triples([Triple(*values) for values in known[h]['triples']])
+            per_row.append(triples)
+        for h, valid in self.invalid_hashes.items():
+            entries[h] = {'valid': valid}
+
+        removed = len(set(known) - set(entries))
+        self.stats['incremental'] = {'extracted_rows': len(todo), 'reused_rows': len(rows) - len(todo),
+                                     'removed_rows': removed, 'llm_failed_rows': len(failed)}
+        print(f"Incremental: extracted {len(todo)} new/changed rows, reused {len(rows) - len(todo)}, "
+              f"dropped {removed} removed rows")
+        save_manifest({'fingerprint': self.manifest['fingerprint'], 'rows': entries}, self.output_dir)
+        return per_row
+
     def load_data(self) -> pd.DataFrame:
-        df = pd.read_csv(self.input_path)
+        valid_df = self.prepare(pd.read_csv(self.input_path))
+        if self.stats['invalid_rows'] > 0:
+            print(f"Found {self.stats['invalid_rows']} invalid rows (will be skipped)")
+        return valid_df
 
+    def prepare(self, df: pd.DataFrame, announce: bool = True) -> pd.DataFrame:
+        """Valid rows of an input frame (or chunk of one), with their cleaned text; counts go to stats"""
         if 'uses_text' not in df.columns and 'uses' in df.columns:
             df['uses_text'] = df['uses']
-            print("'uses_text' column not found, using 'uses' instead")
+            if announce:
+                print("'uses_text' column not found, using 'uses' instead")
 
         df = df.fillna("")
-        df['is_valid'] = df.apply(self.validate_row, axis=1)
-        invalid = len(df[~df['is_valid']])
-
-        if invalid > 0:
-            print(f"Found {invalid} invalid rows (will be skipped)")
-            self.stats['invalid_rows'] = invalid
+        todo = pd.Series(True, index=df.index)
+        if self.incremental:
+            self.load_manifest()
+            df['row_hash'] = [row_hash(r.get('supplement_name', ''), r.get('url', ''), r.get('uses_text', ''))
+                              for r in df.to_dict('records')]
+            known = self.manifest['rows']
+            todo = ~df['row_hash'].isin(known)
+
+        # cleaned once for the whole column and handed on to extraction; rows reused from the
+        # manifest are neither cleaned nor extracted, and their validity comes from it too
+        missing = pd.Series("", index=df.index)
+        cleaned = self.cleaner.clean_many(df.get('uses_text', missing)[todo].astype(str))
+        df['cleaned_text'] = ""
+        df.loc[todo, 'cleaned_text'] = cleaned
+        df['is_valid'] = False
+        if self.incremental:
+            df['is_valid'] = [known[h]['valid'] if h in known else False for h in df['row_hash']]
+        names = df.get('supplement_name', missing)[todo]
+        df.loc[todo, 'is_valid'] = names.map(bool).astype(bool) & self.cleaner.validate_many(cleaned)
+        if self.incremental:
+            self.invalid_hashes = {h: False for h in df.loc[~df['is_valid'], 'row_hash']}
+        self.stats['invalid_rows'] += int((~df['is_valid']).sum())
 
         valid_df = df[df['is_valid']].copy()
-        self.stats['valid_rows'] = len(valid_df)
+        self.stats['valid_rows'] += len(valid_df)
 
         return valid_df
 
-    def validate_row(self, row) -> bool:
-        if not row.get('supplement_name'):
-            return False
-
-        uses_text = str(row.get('uses_text', ''))
-        if not uses_text:
-            return False
-
-        cleaned = self.cleaner.clean_text(uses_text)
-        return self.cleaner.is_valid_medical_text(cleaned)
+    def load_manifest(self):
+        self.manifest = load_manifest(self.output_dir) or {}
+        fingerprint = extraction_fingerprint(self.llm_batch_tokens > 0, self.llm_policy)
+        if self.manifest.get('fingerprint') != fingerprint:
+            if self.manifest:
+                print("Extraction settings changed since the manifest was written, reprocessing every row")
+            self.manifest = {'fingerprint': fingerprint, 'rows': {}}
 
     def extract_from_row(self, row) -> List[Triple]:
-        result: List[Triple] = []
-
-        sup_name = str(row.get('supplement_name', '')).strip()
-        sup_id = create_id(sup_name)
-        url = str(row.get('url', '')).strip()
-
-        raw_uses = str(row.get('uses_text', '')).strip()
-        cleaned_text = self.cleaner.clean_text(raw_uses)
-        if not cleaned_text:
-            return result
-
-        entities = self.extractor.extract_entities(cleaned_text)
-        for ent in entities:
-            if ent.confidence < 0.5:
-                continue
-
-            condition_id = create_id(ent.normalized)
-            relation = self.get_relation_type(ent.entity_type)
-
-            result.append(Triple(
-                supplement_id=sup_id,
-                supplement_name=sup_name,
-                relation_type=relation,
-                condition_id=condition_id,
-                condition_name=ent.normalized,
-                confidence=ent.confidence,
-                extraction_method=ent.entity_type,
-                source_url=url,
-                evidence_text=ent.source_context[:500]
-            ))
-
-        llm_results = self.llm_triples(sup_name, sup_id, url, cleaned_text)
-        result.extend(llm_results)
-
+        return self.extract_fields(row_fields(row))
+
+    def extract_fields(self, fields: tuple) -> List[Triple]:
+        regex = regex_row(fields, self.llm_policy)
+        if regex is None:
+            return []
+        sup_name, sup_id, url, cleaned_text, result, plan = regex
+        if plan.text:
+            result = result + self.llm_triples(sup_name, sup_id, url, cleaned_text, plan.text)
         return self.dedup(result)
 
-    def llm_triples(self, sup_name: str, sup_id: str, url: str, cleaned: str) -> List[Triple]:
+    async def extract_rows(self, rows: List[tuple]) -> List[List[Triple]]:
+        async with self.extraction() as extract:
+            return await extract(rows)
+
+    @asynccontextmanager
+    async def extraction(self):
+        """
+        Yields extract(rows) -> per-row triples in input order, which can be awaited for any
+        number of batches of rows. Regex runs in a process pool (workers > 1) or a single
+        worker thread, and each row's LLM request starts as soon as its regex half is back,
+        through one shared async client capped at llm_concurrency in flight
+        """
+        loop = asyncio.get_running_loop()
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else ThreadPoolExecutor(max_workers=1)
+
+        async def one(llm, row_id, fields):
+            regex = await loop.run_in_executor(pool, regex_row, fields, self.llm_policy)
+            if regex is None:
+                return []
+            sup_name, sup_id, url, cleaned_text, triples, plan = regex
+            if llm.enabled and self.llm_policy.mode != "always":
+                self.count_plan(plan, sup_name, cleaned_text, url)
+            if not plan.text:
+                return self.strings.triples(self.dedup(triples))
+            result = await llm.extract(sup_name, plan.text, url)
+            llm_triples = self.items_to_triples(result.items, sup_name, sup_id, url, cleaned_text)
+            if llm.enabled:
+                self.llm_log.append(dict(row=row_id, supplement_name=sup_name, url=url, ok=result.ok,
+                                         status=result.status, error=result.error, attempts=result.attempts,
+                                         cached=result.cached, batch=result.batch, fallback=result.fallback,
+                                         input_tokens=result.input_tokens, output_tokens=result.output_tokens,
+                                         latency_ms=result.latency_ms, triples=len(llm_triples), policy=plan.reason,
+                                         coverage=plan.coverage))
+            return self.strings.triples(self.dedup(triples + llm_triples))
+
+        cache = LLMCache(mode=self.llm_cache) if llm_enabled() else None
+        try:
+            with pool:
+                async with AsyncLLMExtractor(concurrency=self.llm_concurrency, cache=cache,
+                                             batch_tokens=self.llm_batch_tokens) as llm:
+                    async def extract(rows):
+                        per_row = await asyncio.gather(*(one(llm, row_id, fields) for row_id, fields in rows))
+                        self.llm_log.sort(key=lambda r: r['row'])
+                        return per_row
+
+                    yield extract
+                    if llm.enabled:
+                        self.stats['llm'] = llm.stats()
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def count_plan(self, plan, sup_name: str, cleaned: str, url: str):
+        p = self.stats.setdefault('llm_policy', {'policy': self.llm_policy.mode, 'rows': 0, 'requested': 0, 'trimmed': 0,
+                                                 'covered': 0, 'short': 0, 'prompt_tokens_saved': 0})
+        p['rows'] += 1
+        if plan.text:
+            p['requested'] += 1
+            p['trimmed'] += plan.reason == "sentences"
+        else:
+            p[plan.reason] += 1
+        if plan.text != cleaned:
+            sent = prompt_tokens(sup_name, plan.text, url) if plan.text else 0
+            p['prompt_tokens_saved'] += prompt_tokens(sup_name, cleaned, url) - sent
+
+    def llm_triples(self, sup_name: str, sup_id: str, url: str, cleaned: str, text: str = None) -> List[Triple]:
+        """LLM triples of a row, asking about text (part of cleaned) when given"""
+        items = llm_extract_triples(sup_name, text or cleaned, url)
+        return self.items_to_triples(items, sup_name, sup_id, url, cleaned)
+
+    def items_to_triples(self, items: list, sup_name: str, sup_id: str, url: str, cleaned: str) -> List[Triple]:
         triples: List[Triple] = []
-        items = llm_extract_triples(sup_name, cleaned, url)
-
         for item in items:
+            if not isinstance(item, dict):
+                continue
             raw_condition = str(item.get("condition", "")).strip()
             if not raw_condition:
                 continue
@@ -149,27 +399,14 @@ class SupplementTripleExtractor:
                 confidence=confidence,
                 extraction_method="llm",
                 source_url=url,
-                evidence_text=context[:500]
+                evidence_text=context[:500],
+                evidence_offset=cleaned.find(context[:500])
             ))
 
         return triples
 
     def get_relation_type(self, entity_type: str) -> str:
-        m = {
-            'indicated_for': 'INDICATED_FOR',
-            'treats': 'TREATS',
-            'prevents': 'PREVENTS',
-            'helps_with': 'HELPS_WITH',
-            'manages': 'MANAGES',
-            'relieves': 'RELIEVES',
-            'deficiency': 'TREATS_DEFICIENCY',
-            'condition': 'INDICATED_FOR',
-            'symptom': 'RELIEVES_SYMPTOM',
-            'procedure': 'USED_FOR_PROCEDURE',
-            'cleanses': 'CLEANSES',
-            'procedure_prep': 'USED_FOR_PROCEDURE'
-        }
-        return m.get(entity_type, 'RELATED_TO')
+        return RELATION_TYPES.get(entity_type, DEFAULT_RELATION)
 
     def dedup(self, triples: List[Triple]) -> List[Triple]:
         u = {}
@@ -1,15 +1,24 @@
-from dataclasses import dataclass, asdict
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
 
-@dataclass
+# the relation types live next to the loaders that accept them (knowledge_graph/relation_types.py)
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from relation_types import RELATION_TYPES, DEFAULT_RELATION, ALL_RELATION_TYPES  # noqa: E402,F401
+
+# slots: no per-instance __dict__, which is most of a record's size with millions of triples.
+# to_dict is a shallow copy (asdict deep-copies every field)
+@dataclass(slots=True)
 class MedicalEntity:
     raw_text: str
     normalized: str
     entity_type: str
     confidence: float
     source_context: str
-    def to_dict(self): return asdict(self)
+    def to_dict(self): return {name: getattr(self, name) for name in self.__slots__}
 
-@dataclass
+@dataclass(slots=True)
 class Triple:
     supplement_id: str
     supplement_name: str
@@ -20,4 +29,32 @@ class Triple:
     extraction_method: str
     source_url: str
     evidence_text: str
-    def to_dict(self): return asdict(self)
+    # where evidence_text starts in the row's cleaned text, -1 when it isn't a verbatim slice of it
+    evidence_offset: int = -1
+    def to_dict(self): return {name: getattr(self, name) for name in self.__slots__}
+
+# Triple fields whose values repeat across triples; see StringTable
+SHARED_FIELDS = ("supplement_id", "supplement_name", "relation_type", "condition_id", "condition_name",
+                 "extraction_method", "source_url")
+
+class StringTable:
+    """
+    One str object per distinct value. create_id, the normalizer and unpickling from the
+    worker processes make a fresh copy of an id or name for every triple; passing triples
+    through triples() leaves all of them pointing at the same one
+    """
+
+    def __init__(self):
+        self.strings = {}
+
+    def __call__(self, value: str) -> str:
+        return self.strings.setdefault(value, value)
+
+    def __len__(self):
+        return len(self.strings)
+
+    def triples(self, triples: List[Triple]) -> List[Triple]:
+        for t in triples:
+            for name in SHARED_FIELDS:
+                setattr(t, name, self(getattr(t, name)))
+        return triples
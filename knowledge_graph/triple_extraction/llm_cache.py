@@ -0,0 +1,138 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import json as _json
+from pathlib import Path
+from typing import Optional
+
+CACHE_PATH = Path(os.getenv("KG_LLM_CACHE", Path(__file__).resolve().parent.parent / "data" / "llm_cache.sqlite"))
+CACHE_MAX_MB = float(os.getenv("KG_LLM_CACHE_MB", "256"))
+# use: read and write, refresh: re-ask the LLM and overwrite, off: neither
+CACHE_MODES = ("use", "refresh", "off")
+# the size check is a full SUM, so it runs every this many writes (and on close)
+EVICT_EVERY = 64
+
+
+def cache_key(model: str, messages: list, **params) -> str:
+    """Content address of a request: model, prompt and payload (which holds the cleaned text)"""
+    blob = _json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LLMCache:
+    """
+    Parsed LLM extraction results on disk (sqlite, WAL), keyed by cache_key. Several
+    processes can read and write the same file; writes are single upserts and sqlite
+    serializes them (busy_timeout covers the waits). When the file's payloads pass
+    max_mb the least recently used entries are evicted down to 90% of the cap.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_mb: float = CACHE_MAX_MB, mode: str = "use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"cache mode must be one of {CACHE_MODES}, got {mode!r}")
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+        self.conn = None
+        if mode != "off":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    items TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+
+    def get(self, key: str, *more_keys: str) -> Optional[list]:
+        """
+        Cached items, or None on a miss (always a miss unless mode is 'use'). With more
+        keys, the items of the first one cached, counted as a single hit or miss
+        """
+        if self.mode != "use":
+            return None
+        keys = (key,) + more_keys
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT key, items, input_tokens, output_tokens FROM responses WHERE key IN ({','.join('?' * len(keys))})",
+                keys).fetchall()
+            if not rows:
+                self.misses += 1
+                return None
+            found = {row[0]: row for row in rows}
+            key, items, input_tokens, output_tokens = next(found[k] for k in keys if k in found)
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            self.saved_input_tokens += input_tokens
+            self.saved_output_tokens += output_tokens
+        return _json.loads(items)
+
+    def put(self, key: str, model: str, items: list, input_tokens: int = 0, output_tokens: int = 0):
+        if self.mode == "off":
+            return
+        blob = _json.dumps(items, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, blob, len(blob.encode('utf-8')), input_tokens, output_tokens, now, now))
+            self.writes += 1
+            if self.writes % EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        doomed = []
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+            doomed.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        # another process may have evicted some of these already
+        self.evictions += self.conn.executemany("DELETE FROM responses WHERE key = ?", doomed).rowcount
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        out = {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "saved_input_tokens": self.saved_input_tokens,
+            "saved_output_tokens": self.saved_output_tokens,
+        }
+        if self.conn is not None:
+            with self.lock:
+                entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            out.update(entries=entries, mb=round(size / 1024 / 1024, 2))
+        return out
+
+    def close(self):
+        if self.conn is not None:
+            with self.lock:
+                self._evict()
+            self.conn.close()
+            self.conn = None
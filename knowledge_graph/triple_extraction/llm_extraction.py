@@ -1,14 +1,47 @@
+import asyncio
 import os
+import random
 import re
+import threading
+import time
 import json as _json
-from typing import List, Dict
-from openai import OpenAI
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from typing import List, Dict, Optional
+import openai
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
+from data_structures import RELATION_TYPES, DEFAULT_RELATION
+from llm_cache import LLMCache, cache_key
 
 
 load_dotenv()
 
 LLM_MODEL = os.getenv("KG_LLM_MODEL", "gpt-4o-mini")
+LLM_CONCURRENCY = int(os.getenv("KG_LLM_CONCURRENCY", "8"))
+LLM_MAX_RETRIES = int(os.getenv("KG_LLM_MAX_RETRIES", "6"))
+LLM_TIMEOUT_S = float(os.getenv("KG_LLM_TIMEOUT_S", "60"))
+# > 0: pack rows into one request up to this many (estimated) tokens of row payload; 0 = a request per row
+LLM_BATCH_TOKENS = int(os.getenv("KG_LLM_BATCH_TOKENS", "0"))
+LLM_BATCH_ROWS = int(os.getenv("KG_LLM_BATCH_ROWS", "16"))
+# how long a partly filled batch waits for more rows before it is sent
+LLM_BATCH_WAIT_S = float(os.getenv("KG_LLM_BATCH_WAIT_S", "0.05"))
+# token estimate for packing; no tokenizer dependency, English text averages about 4 characters a token
+CHARS_PER_TOKEN = 4
+
+SYSTEM_PROMPT = (
+    "Extract supplement→relation→condition triples as JSON. "
+    "Allowed relation values: {indicated_for,treats,prevents,helps_with,manages,relieves,deficiency,condition,symptom,procedure,cleanses,procedure_prep}. "
+    "Each triple should include keys: condition, relation, confidence (0..1), evidence."
+)
+
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + (
+    " The input is a JSON object whose \"rows\" each have an id, supplement, url and text. "
+    "Answer with one JSON object mapping every row id to the list of triples for that row ([] if none)."
+)
+
+_client = None
+_client_lock = threading.Lock()
 
 def parse_json(text: str):
     if not text or not text.strip():
@@ -38,59 +71,376 @@ def parse_json(text: str):
     return None
 
 
-def llm_extract_triples(supplement_name: str, cleaned_text: str, url: str) -> List[Dict[str, str]]:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return []
-
-    client = OpenAI()
+def llm_enabled() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY"))
 
-    prompt = (
-        "Extract supplement→relation→condition triples as JSON. "
-        "Allowed relation values: {indicated_for,treats,prevents,helps_with,manages,relieves,deficiency,condition,symptom,procedure,cleanses,procedure_prep}. "
-        "Each triple should include keys: condition, relation, confidence (0..1), evidence."
-    )
 
+def build_messages(supplement_name: str, cleaned_text: str, url: str) -> list:
     user_payload = _json.dumps({"supplement": supplement_name, "url": url, "text": cleaned_text})
+    return [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": user_payload}]
+
+
+def build_batch_messages(rows: list) -> list:
+    """One request for several rows, each (row id, supplement, cleaned text, url)"""
+    user_payload = _json.dumps({"rows": [{"id": rid, "supplement": name, "url": url, "text": text}
+                                         for rid, name, text, url in rows]})
+    return [{"role": "system", "content": BATCH_SYSTEM_PROMPT}, {"role": "user", "content": user_payload}]
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def parse_items(output_text: str) -> Optional[list]:
+    """Triples from a response body; None when it isn't JSON we understand"""
+    parsed = parse_json(output_text)
+    if isinstance(parsed, dict) and isinstance(parsed.get("triples"), list):
+        return parsed["triples"]
+    if isinstance(parsed, list):
+        return parsed
+    return None
+
+
+def parse_batch(output_text: str, ids: list) -> dict:
+    """Row id -> triples from a batched response, for each id whose part is a list of triples; the rest are left out"""
+    parsed = parse_json(output_text)
+    if not isinstance(parsed, dict):
+        match = re.search(r"(\{.*\})", output_text or "", flags=re.DOTALL)
+        try:
+            parsed = _json.loads(match.group(1)) if match else None
+        except Exception:
+            return {}
+    if isinstance(parsed, dict) and isinstance(parsed.get("rows"), dict):
+        parsed = parsed["rows"]
+    if not isinstance(parsed, dict):
+        return {}
+    out = {}
+    for rid in ids:
+        part = parsed.get(rid)
+        if isinstance(part, dict) and isinstance(part.get("triples"), list):
+            part = part["triples"]
+        if isinstance(part, list) and all(isinstance(item, dict) for item in part):
+            out[rid] = part
+    return out
+
+
+def get_client() -> OpenAI:
+    """One sync client per process, so its connection pool is reused across rows"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OpenAI(timeout=LLM_TIMEOUT_S)
+        return _client
+
+
+def llm_extract_triples(supplement_name: str, cleaned_text: str, url: str,
+                        cache: LLMCache = None) -> List[Dict[str, str]]:
+    """Single blocking call, errors become []; batch runs go through AsyncLLMExtractor"""
+    if not llm_enabled():
+        return []
+
+    messages = build_messages(supplement_name, cleaned_text, url)
+    key = cache_key(LLM_MODEL, messages, temperature=0)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
 
     try:
-        response = client.responses.create(
-            model=LLM_MODEL,
-            input=[{"role": "system", "content": prompt}, {"role": "user", "content": user_payload}],
-            temperature=0,
-        )
+        response = get_client().responses.create(model=LLM_MODEL, input=messages, temperature=0)
     except Exception:
         return []
 
-    output_text = getattr(response, "output_text", None) or ""
-    parsed = parse_json(output_text)
-    if parsed is None:
+    items = parse_items(getattr(response, "output_text", None) or "")
+    if items is None:
         return []
+    if cache is not None:
+        cache.put(key, LLM_MODEL, items)
+    return items
 
-    if isinstance(parsed, dict) and isinstance(parsed.get("triples"), list):
-        return parsed["triples"]
 
-    if isinstance(parsed, list):
-        return parsed
+@dataclass
+class LLMResult:
+    """Outcome of one row's request, kept for failed rows too"""
+    ok: bool
+    items: list = field(default_factory=list)
+    error: Optional[str] = None
+    status: Optional[int] = None
+    attempts: int = 0
+    cached: bool = False
+    input_tokens: int = 0
+    output_tokens: int = 0
+    latency_ms: float = 0.0
+    # rows answered by the request (tokens are then this row's share); fallback: its part of a batch was unusable
+    batch: int = 1
+    fallback: bool = False
 
-    return []
 
+def retry_after(error) -> Optional[float]:
+    """Seconds the server asked us to wait (retry-after-ms, retry-after seconds or HTTP date)"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
 
-def create_relation(rel_raw: str) -> str:
-    relations = {
-        "indicated_for": "INDICATED_FOR",
-        "treats": "TREATS",
-        "prevents": "PREVENTS",
-        "helps_with": "HELPS_WITH",
-        "manages": "MANAGES",
-        "relieves": "RELIEVES",
-        "deficiency": "TREATS_DEFICIENCY",
-        "condition": "INDICATED_FOR",
-        "symptom": "RELIEVES_SYMPTOM",
-        "procedure": "USED_FOR_PROCEDURE",
-        "cleanses": "CLEANSES",
-        "procedure_prep": "USED_FOR_PROCEDURE",
-    }
 
+def is_retryable(error) -> bool:
+    if isinstance(error, openai.APIConnectionError):  # includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _percentile(samples, p):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class AsyncLLMExtractor:
+    """
+    Row-level LLM extraction for batch runs: one AsyncOpenAI client (one connection
+    pool) shared by all requests, at most `concurrency` in flight, 429/5xx/connection
+    errors retried with full-jitter exponential backoff (or the server's Retry-After
+    when it sends one). Every call returns an LLMResult, so rows that still fail after
+    the retries are reported instead of silently contributing no triples. With a
+    cache, answers for an identical model/prompt/text are served from disk and
+    successful new ones stored.
+
+    With batch_tokens, rows are packed into one request (BATCH_SYSTEM_PROMPT, rows keyed
+    by id) until the next row would pass batch_tokens or batch_rows, or batch_wait after
+    the first row came in. The answer is split back per row; a row whose part is missing
+    or malformed is asked again on its own. Rows longer than batch_tokens always go alone.
+
+        async with AsyncLLMExtractor(concurrency=16) as llm:
+            result = await llm.extract("Magnesium", text, url)
+    """
+
+    def __init__(self, model: str = LLM_MODEL, concurrency: int = LLM_CONCURRENCY,
+                 max_retries: int = LLM_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 60.0,
+                 timeout: float = LLM_TIMEOUT_S, client: AsyncOpenAI = None, cache: LLMCache = None,
+                 batch_tokens: int = LLM_BATCH_TOKENS, batch_rows: int = LLM_BATCH_ROWS,
+                 batch_wait: float = LLM_BATCH_WAIT_S):
+        self.model = model
+        self.cache = cache
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.enabled = client is not None or llm_enabled()
+        # retries are ours, so the SDK's own are off
+        self.client = client or (AsyncOpenAI(max_retries=0, timeout=timeout) if self.enabled else None)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.requests = 0
+        self.failed = 0
+        self.retries = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.latency = []
+        self.inflight = {}
+        self.coalesced = 0
+        self.batch_tokens = batch_tokens
+        self.batch_rows = batch_rows
+        self.batch_wait = batch_wait
+        self.pending = []  # (row, future) of the batch being packed
+        self.pending_tokens = 0
+        self.flush_timer = None
+        self.sending = set()
+        self.batches = 0
+        self.batched_rows = 0
+        self.fallbacks = 0
+        self.failed_batches = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+        if self.client is not None:
+            await self.client.close()
+
+    def backoff(self, attempt: int, error) -> float:
+        hinted = retry_after(error)
+        if hinted is not None:
+            return min(hinted, self.max_delay) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def extract(self, supplement_name: str, cleaned_text: str, url: str) -> LLMResult:
+        if not self.enabled:
+            return LLMResult(ok=True)
+        messages = build_messages(supplement_name, cleaned_text, url)
+        key = cache_key(self.model, messages, temperature=0)
+        tokens = estimate_tokens(cleaned_text)
+        batched = 0 < tokens <= self.batch_tokens
+        # an answer from a batch is cached per row under its own key, so reruns hit however rows get packed
+        batch_key = cache_key(self.model, messages, temperature=0, prompt=BATCH_SYSTEM_PROMPT) if batched else None
+        if self.cache is not None:
+            cached = self.cache.get(*filter(None, (batch_key, key)))
+            if cached is not None:
+                return LLMResult(ok=True, items=cached, cached=True)
+        # identical requests already in flight share one call instead of all missing the cache
+        shared = self.inflight.get(key)
+        if shared is not None:
+            self.coalesced += 1
+            first = await shared
+            return LLMResult(ok=first.ok, items=first.items, error=first.error, status=first.status, cached=True)
+        if batched:
+            task = self._enqueue((key, batch_key, messages, supplement_name, cleaned_text, url), tokens)
+        else:
+            task = asyncio.ensure_future(self._request(key, messages))
+        self.inflight[key] = task
+        try:
+            return await task
+        finally:
+            self.inflight.pop(key, None)
+
+    def _enqueue(self, row: tuple, tokens: int) -> asyncio.Future:
+        if self.pending and (self.pending_tokens + tokens > self.batch_tokens or len(self.pending) >= self.batch_rows):
+            self._flush()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((row, future))
+        self.pending_tokens += tokens
+        if self.flush_timer is None:
+            self.flush_timer = loop.call_later(self.batch_wait, self._flush)
+        return future
+
+    def _flush(self):
+        if self.flush_timer is not None:
+            self.flush_timer.cancel()
+            self.flush_timer = None
+        batch, self.pending, self.pending_tokens = self.pending, [], 0
+        if batch:
+            task = asyncio.ensure_future(self._batch(batch))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _batch(self, batch: list):
+        """Send the packed rows and resolve each row's future, with a single-row request for rows the answer misses"""
+        try:
+            if len(batch) == 1:
+                (key, _, messages, *_), future = batch[0]
+                future.set_result(await self._request(key, messages))
+                return
+            ids = [str(i) for i in range(len(batch))]
+            rows = [(rid, name, text, url) for rid, ((_, _, _, name, text, url), _) in zip(ids, batch)]
+            result = LLMResult(ok=False, batch=len(batch))
+            response = await self._call(build_batch_messages(rows), result)
+            parts = parse_batch(getattr(response, "output_text", None) or "", ids) if response is not None else {}
+            self.batches += 1
+            # rows the answer misses are retried alone and counted in failed by their own result
+            self.failed_batches += not parts
+            total = sum(len(text) for _, _, text, _ in rows)
+
+            async def one(rid, row, future):
+                key, batch_key, messages, _, text, _ = row
+                if rid not in parts:
+                    self.fallbacks += 1
+                    retried = await self._request(key, messages)
+                    retried.fallback = True
+                    future.set_result(retried)
+                    return
+                share = len(text) / total if total else 1 / len(batch)
+                self.batched_rows += 1
+                items = parts[rid]
+                future.set_result(LLMResult(ok=True, items=items, status=result.status, attempts=result.attempts,
+                                            input_tokens=round(result.input_tokens * share),
+                                            output_tokens=round(result.output_tokens * share),
+                                            latency_ms=result.latency_ms, batch=len(batch)))
+                if self.cache is not None:
+                    self.cache.put(batch_key, self.model, items, round(result.input_tokens * share),
+                                   round(result.output_tokens * share))
+
+            await asyncio.gather(*(one(rid, row, future) for rid, (row, future) in zip(ids, batch)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    async def _request(self, key: str, messages: list) -> LLMResult:
+        result = LLMResult(ok=False)
+        response = await self._call(messages, result)
+        if response is not None:
+            items = parse_items(getattr(response, "output_text", None) or "")
+            if items is None:
+                result.error = "unparseable response"
+            else:
+                result.ok, result.items, result.error = True, items, None
+                if self.cache is not None:
+                    self.cache.put(key, self.model, items, result.input_tokens, result.output_tokens)
+        self.failed += not result.ok
+        return result
+
+    async def _call(self, messages: list, result: LLMResult):
+        """The response, or None when the retries ran out (result gets the error, attempts, tokens and latency)"""
+        start = time.perf_counter()
+        response = None
+        for attempt in range(self.max_retries + 1):
+            result.attempts = attempt + 1
+            try:
+                async with self.semaphore:
+                    response = await self.client.responses.create(model=self.model, input=messages, temperature=0)
+            except Exception as e:
+                result.error = f"{type(e).__name__}: {e}"[:300]
+                result.status = getattr(e, "status_code", None)
+                if attempt < self.max_retries and is_retryable(e):
+                    self.retries += 1
+                    await asyncio.sleep(self.backoff(attempt, e))
+                    continue
+                break
+
+            usage = getattr(response, "usage", None)
+            result.input_tokens = getattr(usage, "input_tokens", 0) or 0
+            result.output_tokens = getattr(usage, "output_tokens", 0) or 0
+            result.status, result.error = 200, None
+            break
+
+        result.latency_ms = round((time.perf_counter() - start) * 1000, 1)
+        self.requests += 1
+        self.input_tokens += result.input_tokens
+        self.output_tokens += result.output_tokens
+        self.latency.append(result.latency_ms)
+        return response
+
+    def stats(self) -> dict:
+        out = {
+            "model": self.model,
+            "requests": self.requests,
+            "failed": self.failed,
+            "retries": self.retries,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "batched_rows": self.batched_rows,
+            "fallback_rows": self.fallbacks,
+            "failed_batches": self.failed_batches,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "latency_ms": {"p50": _percentile(self.latency, 50), "p95": _percentile(self.latency, 95),
+                           "max": max(self.latency, default=0.0)},
+        }
+        if self.cache is not None:
+            out["cache"] = self.cache.stats()
+        return out
+
+
+def create_relation(rel_raw: str) -> str:
     key = (rel_raw or "").strip().lower()
-    return relations.get(key, "RELATED_TO")
+    return RELATION_TYPES.get(key, DEFAULT_RELATION)
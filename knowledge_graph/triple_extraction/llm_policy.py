@@ -0,0 +1,94 @@
+import os
+import re
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+from data_structures import MedicalEntity
+from llm_extraction import build_messages, estimate_tokens
+
+# always: every row's full text goes to the LLM; uncovered: rows the regex matches already
+# cover are skipped; sentences: as uncovered, and only the sentences no confident match
+# covers are sent
+LLM_POLICIES = ("always", "uncovered", "sentences")
+LLM_POLICY = os.getenv("KG_LLM_POLICY", "always")
+# a sentence is covered by a regex entity of at least this confidence
+LLM_CONFIDENT = float(os.getenv("KG_LLM_CONFIDENT", "0.85"))
+# a row is covered when covered sentences hold at least this share of its text
+LLM_COVERED = float(os.getenv("KG_LLM_COVERED", "0.6"))
+# a row with less text than this isn't worth a request
+LLM_MIN_CHARS = int(os.getenv("KG_LLM_MIN_CHARS", "80"))
+
+SENTENCE = re.compile(r'[^.!?]+[.!?]*')
+# extract_entities' context window around a match
+CONTEXT_CHARS = 100
+
+
+@dataclass
+class LLMPlan:
+    text: str        # what the LLM is asked about, '' for no request
+    reason: str      # always, short, covered, uncovered or sentences
+    coverage: float  # share of the text in sentences a confident regex match covers
+
+
+def match_point(text: str, ent: MedicalEntity) -> int:
+    """Where the entity's match is in text: its context window is the match plus CONTEXT_CHARS each side"""
+    start = text.find(ent.source_context)
+    if start < 0:
+        return -1
+    end = start + len(ent.source_context)
+    lo = start + CONTEXT_CHARS if start > 0 else 0
+    hi = end - CONTEXT_CHARS if end < len(text) else end
+    found = text.lower().find(ent.raw_text.lower(), lo, max(hi, lo))
+    return found if found >= 0 else max(lo, hi - 1)
+
+
+@dataclass(frozen=True)
+class LLMPolicy:
+    """
+    Which rows, and which part of a row, get an LLM request, scored from the row's regex
+    entities: its sentences are covered by a match of at least `confident`, ambiguous
+    (only weaker matches) or uncovered. A row whose covered sentences hold `covered` of its
+    text, or that is shorter than min_chars, is left to the regex triples; otherwise the full
+    text is sent, or under "sentences" only its ambiguous and uncovered sentences.
+    bench_llm_policy.py weighs the tokens saved against the triples lost
+    """
+    mode: str = LLM_POLICY
+    confident: float = LLM_CONFIDENT
+    covered: float = LLM_COVERED
+    min_chars: int = LLM_MIN_CHARS
+
+    def __post_init__(self):
+        if self.mode not in LLM_POLICIES:
+            raise ValueError(f"unknown LLM policy {self.mode!r}, expected one of {LLM_POLICIES}")
+
+    def settings(self) -> Optional[dict]:
+        """What the extraction fingerprint records; None for always, which changes nothing"""
+        return None if self.mode == "always" else asdict(self)
+
+    def plan(self, text: str, entities: List[MedicalEntity]) -> LLMPlan:
+        if self.mode == "always":
+            return LLMPlan(text, "always", -1.0)
+        sentences = [m.span() for m in SENTENCE.finditer(text)]
+        best = [0.0] * len(sentences)
+        starts = [s for s, _ in sentences]
+        for ent in entities:
+            point = match_point(text, ent)
+            if point < 0 or ent.confidence < 0.5:
+                continue
+            i = max(0, bisect_right(starts, point) - 1)
+            best[i] = max(best[i], ent.confidence)
+        covered = sum(e - s for (s, e), conf in zip(sentences, best) if conf >= self.confident)
+        coverage = round(covered / len(text), 3) if text else 1.0
+        if coverage >= self.covered:
+            return LLMPlan("", "covered", coverage)
+        if len(text) < self.min_chars:
+            return LLMPlan("", "short", coverage)
+        if self.mode == "sentences" and covered:
+            text = " ".join(text[s:e].strip() for (s, e), conf in zip(sentences, best) if conf < self.confident)
+            return LLMPlan(text, "sentences", coverage)
+        return LLMPlan(text, "uncovered", coverage)
+
+
+def prompt_tokens(supplement_name: str, text: str, url: str) -> int:
+    """Estimated prompt tokens of a single-row request"""
+    return sum(estimate_tokens(m["content"]) for m in build_messages(supplement_name, text, url))
@@ -1,7 +1,74 @@
 import re
+from bisect import bisect_left
+from collections import defaultdict
 from typing import List
+from cleaner import ASCII_FOLD
 from data_structures import MedicalEntity
 
+# \b(word|word\s+word|...)\b: pure keyword lists, served by one scan over the words of the text
+KEYWORD_PATTERN = re.compile(r'\\b\(([a-z]+(?:\\s\+[a-z]+)*(?:\|[a-z]+(?:\\s\+[a-z]+)*)*)\)\\b')
+# \b(?:word|word\s+word|...)\s or \bword\s (not \s* or \s?): every match starts with one of
+# the words, as a whole word, so like the keyword lists the pattern is only tried where the
+# word scan finds one. Derived from the pattern source, so editing a pattern can't leave a
+# stale entry behind
+LEADING_PATTERN = re.compile(r'\\b(?:([a-z]+)|\(\?:([a-z]+(?:\\s\+[a-z]+)*(?:\|[a-z]+(?:\\s\+[a-z]+)*)*)\))\\s(?![*?])')
+# pattern source tokens; SAFE_TOKENS only ever match word and space characters
+PATTERN_TOKEN = re.compile(r'\(\?:|\(|\)[?*]?|\||\\[bsw][+*]?|[a-z]+|\\.|.')
+SAFE_TOKENS = {'(', '(?:', ')', ')?', ')*', '|', '\\b', '\\s+', '\\s*', '\\w+', '\\w*'}
+WORD = re.compile(r'\w+')
+NOT_WORD_OR_SPACE = re.compile(r'[^\w\s]')
+
+
+def leading_words(pattern: str):
+    """The words every match of the pattern starts with, None when it has no such prefix"""
+    m = KEYWORD_PATTERN.fullmatch(pattern) or LEADING_PATTERN.match(pattern)
+    if not m:
+        return None
+    words = next(g for g in m.groups() if g)
+    return tuple(dict.fromkeys(alt.split('\\s+')[0] for alt in words.split('|')))
+
+
+def required_word(pattern: str):
+    """
+    A literal every match of the pattern contains, with only [\\w\\s] characters before it
+    inside a match: not optional, not inside an alternation, and preceded by SAFE_TOKENS only.
+    The pattern is skipped when the word is absent, otherwise scanned from its first occurrence
+    """
+    tokens = PATTERN_TOKEN.findall(pattern)
+    for k, word in enumerate(tokens):
+        if len(word) < 4 or not word.isalpha() or not word.islower():
+            if word in SAFE_TOKENS or word.isalpha():
+                continue
+            return None
+        if k + 1 < len(tokens) and tokens[k + 1] in ('?', '*', '{'):
+            continue
+        if enclosed_in_alternative(tokens, k):
+            continue
+        return word
+    return None
+
+
+def enclosed_in_alternative(tokens: list, k: int) -> bool:
+    """Whether token k sits in a branch of an alternation or in an optional group"""
+    for step, opens, closes in ((-1, ')', '('), (1, '(', ')')):
+        depth = low = 0
+        i = k + step
+        while 0 <= i < len(tokens):
+            t = tokens[i]
+            if t.startswith(opens):
+                depth += 1
+            elif t.startswith(closes):
+                depth -= 1
+                if depth < low:
+                    low = depth
+                    if step == 1 and t in (')?', ')*'):
+                        return True
+            elif t == '|' and depth == low:
+                return True
+            i += step
+    return False
+
+
 class MedicalEntityExtractor:
     CONDITION_PATTERNS = [
         (r'\bindicated\s+for\s+(?:the\s+)?(?:treatment\s+of\s+)?([^.;,]+?)(?:\.|;|,|\s+in\s+patients)', 'indicated_for', 0.9),
@@ -60,15 +127,146 @@ class MedicalEntityExtractor:
         'cataplexy (weak or paralyzed muscles)': 'Cataplexy',
     }
 
+    _compiled = None
+
+    @classmethod
+    def compile(cls):
+        """Compiled patterns, keyword index and negation patterns, built once per process"""
+        if cls._compiled is not None:
+            return cls._compiled
+        patterns = [re.compile(p, re.IGNORECASE) for p, _, _ in cls.CONDITION_PATTERNS]
+        keyword_index = defaultdict(list)
+        scanned = []
+        for i, (p, _, _) in enumerate(cls.CONDITION_PATTERNS):
+            leading = leading_words(p)
+            if leading:
+                for first in leading:
+                    keyword_index[first].append(i)
+            else:
+                required = required_word(p)
+                scanned.append((i, (required,) if required else None))
+        negative = [re.compile(p) for p in cls.NEGATIVE_PATTERNS]
+        negative_open = [p[:-2] if p.endswith(r'\b') else p for p in cls.NEGATIVE_PATTERNS]
+        cls._compiled = {
+            'patterns': patterns,
+            'keyword_index': dict(keyword_index),
+            'scanned': scanned,
+            'negative': negative,
+            # every start position of a negation match, and the same without the closing \b
+            # (a window that cuts a word in half ends on a boundary the full text doesn't have)
+            'negative_at': [re.compile('(?=(' + p + '))') for p in cls.NEGATIVE_PATTERNS],
+            'negative_open': [re.compile(p) for p in negative_open],
+            'negative_open_at': [re.compile('(?=(' + p + '))') for p in negative_open],
+            'clean_tail': re.compile(r'\s+(in\s+patients|who\s+have|that\s+is|which\s+is).*$', re.I),
+            'clean_cause': re.compile(r'\s+(caused\s+by|due\s+to|associated\s+with).*$', re.I),
+            'clean_article': re.compile(r'^(the|a|an)\s+', re.I),
+            'spaces': re.compile(r'\s+'),
+        }
+        return cls._compiled
+
+    @classmethod
+    def scan(cls, text: str) -> List[list]:
+        """
+        Matches per CONDITION_PATTERNS entry, the same as re.finditer with each pattern
+        on its own. Keyword-list and leading-word patterns come from one pass over the
+        words of the text: a word that can start a match is tried against the patterns
+        that have it, keeping each pattern's matches non-overlapping like finditer does
+        """
+        c = cls.compile()
+        patterns = c['patterns']
+        hits = [[] for _ in patterns]
+        folded = text.translate(ASCII_FOLD).lower()
+        if len(folded) != len(text):
+            folded = None
+
+        if folded is None:
+            for i in sorted({i for indexes in c['keyword_index'].values() for i in indexes}):
+                hits[i] = list(patterns[i].finditer(text))
+        else:
+            keyword_index = c['keyword_index']
+            last_end = {}
+            for word in WORD.finditer(text):
+                start = word.start()
+                indexes = keyword_index.get(folded[start:word.end()])
+                if not indexes:
+                    continue
+                for i in indexes:
+                    if start < last_end.get(i, 0):
+                        continue
+                    m = patterns[i].match(text, start)
+                    if m:
+                        hits[i].append(m)
+                        last_end[i] = m.end()
+
+        stops = None
+        for i, required in c['scanned']:
+            pos = 0
+            if required and folded is not None:
+                found = [k for k in (folded.find(w) for w in required) if k >= 0]
+                if not found:
+                    continue
+                # back to where a match containing the first occurrence could start
+                if stops is None:
+                    stops = [m.start() for m in NOT_WORD_OR_SPACE.finditer(text)]
+                k = bisect_left(stops, min(found))
+                pos = stops[k - 1] + 1 if k else 0
+            hits[i] = list(patterns[i].finditer(text, pos))
+        return hits
+
+    @classmethod
+    def negation_index(cls, text_lower: str):
+        """Negation matches of the whole (lowercased) text: start-sorted (start, end) spans, open-ended spans by end"""
+        c = cls.compile()
+        spans, open_ends = [], defaultdict(list)
+        for strict, open_, open_at in zip(c['negative_at'], c['negative_open'], c['negative_open_at']):
+            # every strict match is also an open one, and most texts have neither
+            first = open_.search(text_lower)
+            if first is None:
+                continue
+            spans += [(m.start(), m.start() + len(m.group(1))) for m in strict.finditer(text_lower, first.start())]
+            for m in open_at.finditer(text_lower, first.start()):
+                open_ends[m.start() + len(m.group(1))].append(m.start())
+        spans.sort()
+        return spans, open_ends
+
+    @classmethod
+    def negated(cls, text_lower: str, index, ws: int, we: int) -> bool:
+        """
+        Whether a NEGATIVE_PATTERN matches text_lower[ws:we] on its own, from the precomputed
+        spans (each negation pattern has a single possible end for a given start)
+        """
+        spans, open_ends = index
+        for k in range(bisect_left(spans, (ws, -1)), len(spans)):
+            start, end = spans[k]
+            if start >= we:
+                break
+            if end <= we:
+                return True
+        is_word = lambda ch: ch.isalnum() or ch == '_'
+        # a window edge inside a word is a word boundary only in the window
+        if we < len(text_lower) and is_word(text_lower[we - 1]) and is_word(text_lower[we]):
+            if any(start >= ws for start in open_ends.get(we, ())):
+                return True
+        if ws > 0 and is_word(text_lower[ws - 1]) and is_word(text_lower[ws]):
+            window = text_lower[ws:we]
+            return any(p.match(window) for p in cls.compile()['negative'])
+        return False
+
     @classmethod
     def extract_entities(cls, text: str) -> List[MedicalEntity]:
         entities: List[MedicalEntity] = []
         text_lower = text.lower()
+        # lowercasing changed the length (U+0130): window offsets don't line up, check windows directly
+        exact_windows = len(text_lower) != len(text)
 
-        contains_negative = any(re.search(p, text_lower) for p in cls.NEGATIVE_PATTERNS)
+        if exact_windows:
+            contains_negative = any(p.search(text_lower) for p in cls.compile()['negative'])
+        else:
+            negation = cls.negation_index(text_lower)
+            contains_negative = bool(negation[0])
 
-        for pattern, r_type, conf in cls.CONDITION_PATTERNS:
-            for match in re.finditer(pattern, text, re.IGNORECASE):
+        for (pattern, r_type, conf), matches in zip(cls.CONDITION_PATTERNS, cls.scan(text)):
+            for match in matches:
                 span = match.group(1) if match.groups() else match.group(0)
 
                 cleaned = cls.clean_entity(span)
@@ -80,8 +278,13 @@ class MedicalEntityExtractor:
                 # If negative, check the surrounding words
                 if contains_negative:
                     start, end = match.span()
-                    context_window = text[max(0, start - 50): min(len(text), end + 50)]
-                    if any(re.search(p, context_window.lower()) for p in cls.NEGATIVE_PATTERNS):
+                    ws, we = max(0, start - 50), min(len(text), end + 50)
+                    if exact_windows:
+                        window = text[ws:we].lower()
+                        negative = any(p.search(window) for p in cls.compile()['negative'])
+                    else:
+                        negative = cls.negated(text_lower, negation, ws, we)
+                    if negative:
                         confidence *= 0.3
 
                 normalized = cls.normalize_entity(cleaned)
@@ -97,12 +300,13 @@ class MedicalEntityExtractor:
 
     @classmethod
     def clean_entity(cls, t: str) -> str:
-        t = re.sub(r'\s+(in\s+patients|who\s+have|that\s+is|which\s+is).*$', '', t, flags=re.I)
-        t = re.sub(r'\s+(caused\s+by|due\s+to|associated\s+with).*$', '', t, flags=re.I)
+        c = cls.compile()
+        t = c['clean_tail'].sub('', t)
+        t = c['clean_cause'].sub('', t)
 
-        t = re.sub(r'^(the|a|an)\s+', '', t, flags=re.I)
+        t = c['clean_article'].sub('', t)
 
-        cleaned = re.sub(r'\s+', ' ', t).strip()
+        cleaned = c['spaces'].sub(' ', t).strip()
         return cleaned
 
     # Normalize entity names, needs to be improved later
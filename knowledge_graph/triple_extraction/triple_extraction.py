@@ -1,13 +1,38 @@
 import argparse
 from combined import SupplementTripleExtractor
+from llm_extraction import LLM_BATCH_TOKENS, LLM_CONCURRENCY
+from llm_cache import CACHE_MODES
+from llm_policy import LLM_POLICIES, LLM_POLICY, LLMPolicy
+from utils import OUTPUT_FORMATS
 
 def main():
     parser = argparse.ArgumentParser(description='Advanced Medical Triple Extraction - Modular')
     parser.add_argument('--input', default='knowledge_graph/data/standardized_rows.csv')
     parser.add_argument('--output-dir', default='knowledge_graph/data')
+    parser.add_argument('--workers', type=int, default=1, help='processes for regex extraction (1 = serial)')
+    parser.add_argument('--llm-concurrency', type=int, default=LLM_CONCURRENCY, help='max LLM requests in flight')
+    parser.add_argument('--llm-batch-tokens', type=int, default=LLM_BATCH_TOKENS,
+                        help='pack rows into one LLM request up to this many estimated tokens of text (0 = one row '
+                             'per request); rows whose part of the answer is unusable are retried alone')
+    parser.add_argument('--llm-policy', choices=LLM_POLICIES, default=LLM_POLICY,
+                        help='always: every row to the LLM; uncovered: skip rows the regex matches cover or that are '
+                             'too short; sentences: also send only the sentences they leave uncovered')
+    parser.add_argument('--llm-cache', choices=CACHE_MODES, default='use',
+                        help='on-disk LLM response cache: use it, refresh (re-ask and overwrite) or bypass it (off)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only extract rows added or changed since the last run (extraction_manifest.json in --output-dir)')
+    parser.add_argument('--chunk-size', type=int, default=0,
+                        help='stream the input this many rows at a time (flat memory; triples are deduplicated '
+                             'within a row only, as without it)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='csv',
+                        help='parquet: zstd Parquet nodes and one edges file sorted by supplement id (needs pyarrow)')
     args = parser.parse_args()
+    if args.incremental and args.chunk_size:
+        parser.error('--incremental and --chunk-size cannot be combined')
 
-    e = SupplementTripleExtractor(args.input, args.output_dir)
+    e = SupplementTripleExtractor(args.input, args.output_dir, args.workers, args.llm_concurrency,
+                                  args.llm_cache, args.incremental, args.chunk_size, args.format, args.llm_batch_tokens,
+                                  LLMPolicy(args.llm_policy))
     print("Starting extraction...")
     e.process()
     print(f"Extraction complete! Files saved to {args.output_dir}")
@@ -1,7 +1,8 @@
-import re, hashlib, json
+import os, re, csv, bisect, hashlib, json, sqlite3
 import pandas as pd
 from pathlib import Path
 from typing import List, Dict
+from dataclasses import fields
 from data_structures import Triple
 
 def create_id(text: str) -> str:
@@ -14,7 +15,80 @@ def create_id(text: str) -> str:
     fallback = hashlib.md5(str(text).encode()).hexdigest()
     return fallback[:8]
 
-def write_nodes(conditions: Dict[str, str], supplements: Dict[str, str], output_dir: Path):
+OUTPUT_FORMATS = ("csv", "parquet")
+# Parquet output: the edges file replaces edges_relationships.csv (a column subset) and
+# high_confidence_triples.csv (a filter on confidence, which row group statistics can push down)
+PARQUET_COMPRESSION = "zstd"
+DICTIONARY_COLUMNS = ("supplement_id", "supplement_name", "relation_type", "condition_id", "condition_name",
+                      "extraction_method", "source_url", "entity_type", "passage_id")
+INT_COLUMNS = ("start", "end", "evidence_start", "evidence_end")
+
+def parquet_name(fname: str) -> str:
+    return str(Path(fname).with_suffix('.parquet'))
+
+def data_file(path: Path) -> Path:
+    """The Parquet sibling of an output CSV when it is there and at least as new, else the CSV"""
+    path = Path(path)
+    parquet = path.with_suffix('.parquet')
+    try:
+        newer = not path.exists() or parquet.stat().st_mtime_ns >= path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return path
+    return parquet if newer else path
+
+def read_rows(path: Path, columns: List[str]):
+    """
+    Dict rows of an output file, from its Parquet sibling when data_file picks that (through
+    Arrow: memory-mapped, a record batch at a time, each dictionary decoded once per batch)
+    or else from the CSV
+    """
+    path = data_file(path)
+    if path.suffix != '.parquet':
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+        return
+    import pyarrow.parquet as pq
+    parquet = pq.ParquetFile(path, memory_map=True)
+    # files from before a column was added or renamed: the missing ones are left out of the rows
+    columns = [c for c in columns if c in parquet.schema_arrow.names]
+    for batch in parquet.iter_batches(columns=columns):
+        for values in zip(*(arrow_values(batch.column(name)) for name in columns)):
+            yield dict(zip(columns, values))
+
+def arrow_values(array) -> list:
+    import pyarrow as pa
+    if pa.types.is_dictionary(array.type):
+        values = array.dictionary.to_pylist()
+        return [values[i] if i is not None else None for i in array.indices.to_pylist()]
+    return array.to_pylist()
+
+def arrow_table(columns: Dict[str, list]):
+    """Columns of Python values as an Arrow table: DICTIONARY_COLUMNS dictionary-encoded, confidence float, offsets int32, the rest strings"""
+    import pyarrow as pa
+
+    def arrow_type(name):
+        if name in DICTIONARY_COLUMNS:
+            return pa.dictionary(pa.int32(), pa.string())
+        if name in INT_COLUMNS:
+            return pa.int32()
+        return pa.float64() if name == "confidence" else pa.string()
+
+    return pa.table({name: pa.array(values, arrow_type(name)) for name, values in columns.items()})
+
+def write_parquet(table, path: Path):
+    import pyarrow.parquet as pq
+    pq.write_table(table, path, compression=PARQUET_COMPRESSION)
+
+def write_nodes(conditions: Dict[str, str], supplements: Dict[str, str], output_dir: Path, fmt: str = "csv"):
+    if fmt == "parquet":
+        for fname, (id_col, name_col, entity_type), nodes in (
+                ('nodes_conditions.csv', ("condition_id", "condition_name", "condition"), conditions),
+                ('nodes_supplements.csv', ("supplement_id", "supplement_name", "supplement"), supplements)):
+            write_parquet(arrow_table({id_col: list(nodes), name_col: list(nodes.values()),
+                                       "entity_type": [entity_type] * len(nodes)}),
+                          output_dir / parquet_name(fname))
+        return {"conditions": len(conditions), "supplements": len(supplements)}
+
     condition_records = []
     for cid, name in conditions.items():
         condition_records.append({
@@ -39,22 +113,210 @@ def write_nodes(conditions: Dict[str, str], supplements: Dict[str, str], output_
 
     return {"conditions": len(conditions_df), "supplements": len(supplements_df)}
 
-def write_edges(triples: List[Triple], output_dir: Path):
-    records = []
+TRIPLE_COLUMNS = [f.name for f in fields(Triple)]
+# the evidence text itself goes to passages.csv; an edge points at its passage and the slice of it
+EDGE_COLUMNS = [c for c in TRIPLE_COLUMNS if c not in ("evidence_text", "evidence_offset")] + \
+    ["passage_id", "evidence_start", "evidence_end"]
+PASSAGE_COLUMNS = ["passage_id", "source_url", "start", "end", "text"]
+PASSAGES_FILE = "passages.csv"
+BASIC_COLUMNS = {'relation_type': 'type', 'supplement_id': 'supplement_id', 'condition_id': 'condition_id',
+                 'source_url': 'url'}
+HIGH_CONFIDENCE = 0.8
+# triples per DataFrame when writing a list out
+WRITE_BATCH = 50_000
+
+def passage_id(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+def row_passages(triples: List[Triple]):
+    """
+    Evidence of one input row's triples as passages. Evidence copied verbatim from the
+    row's cleaned text is merged with the windows it overlaps or touches into one passage
+    (start/end: its span in the cleaned text); any other evidence is a passage of its own
+    (start = end = -1). Returns the passages as dicts of PASSAGE_COLUMNS, and each triple's
+    (passage_id, evidence_start, evidence_end) within its passage
+    """
+    spans = sorted({(t.evidence_offset, t.evidence_text) for t in triples if t.evidence_offset >= 0})
+    merged = []  # [start, end, text]
+    for start, text in spans:
+        if merged and start <= merged[-1][1]:
+            last = merged[-1]
+            if start + len(text) > last[1]:
+                last[2] += text[last[1] - start:]
+                last[1] = start + len(text)
+        else:
+            merged.append([start, start + len(text), text])
+
+    url = triples[0].source_url if triples else ""
+    passages = {}
+    for start, end, text in merged:
+        passages.setdefault(passage_id(text), {"source_url": url, "start": start, "end": end, "text": text})
+    starts = [m[0] for m in merged]
+    refs = []
     for t in triples:
-        records.append(t.to_dict())
+        if t.evidence_offset >= 0:
+            start, _, text = merged[bisect.bisect_right(starts, t.evidence_offset) - 1]
+            offset = t.evidence_offset - start
+        else:
+            text, offset = t.evidence_text, 0
+            passages.setdefault(passage_id(text), {"source_url": url, "start": -1, "end": -1, "text": text})
+        refs.append((passage_id(text), offset, offset + len(t.evidence_text)))
+    return [{"passage_id": pid, **p} for pid, p in passages.items()], refs
+
+def triple_columns(triples: List[Triple], columns: List[str]) -> Dict[str, list]:
+    """Column name -> values straight from the records, for DataFrames and Arrow tables without a dict per triple"""
+    return {c: [getattr(t, c) for t in triples] for c in columns}
+
+def edge_columns(per_row: List[List[Triple]], written: 'KeyIndex'):
+    """
+    Columns of EDGE_COLUMNS and the passages not written before, for triples grouped by
+    the input row they came from; `written` holds the ids of passages already out
+    """
+    triples, refs, passages = [], [], []
+    for row in per_row:
+        found, row_refs = row_passages(row)
+        triples += row
+        refs += row_refs
+        passages += found
+    columns = triple_columns(triples, EDGE_COLUMNS[:-3])
+    for name, values in zip(EDGE_COLUMNS[-3:], zip(*refs) if refs else ((), (), ())):
+        columns[name] = list(values)
+    new = written.add([bytes.fromhex(p["passage_id"]) for p in passages])
+    return columns, [p for p, first in zip(passages, new) if first]
+
+class EdgeWriter:
+    """
+    edges_detailed.csv, edges_relationships.csv, high_confidence_triples.csv and
+    passages.csv, opened once and appended to batch by batch, so no edges DataFrame bigger
+    than a batch exists. Passages are written once however many edges or rows share them,
+    tracked in a scratch KeyIndex
+    """
+    FILES = {"detailed": "edges_detailed.csv", "basic": "edges_relationships.csv",
+             "high_conf": "high_confidence_triples.csv", "passages": PASSAGES_FILE}
+
+    def __init__(self, output_dir: Path):
+        self.files = {name: open(output_dir / fname, 'w', newline='', encoding='utf-8')
+                      for name, fname in self.FILES.items()}
+        self.passage_keys = KeyIndex(output_dir / PASSAGE_KEYS_FILE)
+        self.counts = {name: 0 for name in self.FILES}
+        header = pd.DataFrame(columns=EDGE_COLUMNS)
+        header.to_csv(self.files['detailed'], index=False)
+        header.to_csv(self.files['high_conf'], index=False)
+        header[list(BASIC_COLUMNS)].rename(columns=BASIC_COLUMNS).to_csv(self.files['basic'], index=False)
+        pd.DataFrame(columns=PASSAGE_COLUMNS).to_csv(self.files['passages'], index=False)
+
+    def write(self, per_row: List[List[Triple]]):
+        """Append the triples of a batch of input rows, each row's triples in one list"""
+        edges, passages = edge_columns(per_row, self.passage_keys)
+        if not edges['supplement_id']:
+            return
+        edges_df = pd.DataFrame(edges)
+        basic = edges_df[list(BASIC_COLUMNS)].rename(columns=BASIC_COLUMNS)
+        high_conf_df = edges_df[edges_df['confidence'] > HIGH_CONFIDENCE]
+        passages_df = pd.DataFrame(passages, columns=PASSAGE_COLUMNS)
+        for name, df in (("detailed", edges_df), ("basic", basic), ("high_conf", high_conf_df),
+                         ("passages", passages_df)):
+            df.to_csv(self.files[name], header=False, index=False)
+            self.counts[name] += len(df)
 
-    edges_df = pd.DataFrame(records)
-    edges_df.to_csv(output_dir / 'edges_detailed.csv', index=False)
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.passage_keys.close()
 
-    basic = edges_df[['relation_type', 'supplement_id', 'condition_id', 'source_url']].copy()
-    basic.columns = ['type', 'supplement_id', 'condition_id', 'url']
-    basic.to_csv(output_dir / 'edges_relationships.csv', index=False)
+    def __enter__(self):
+        return self
 
-    high_conf_df = edges_df[edges_df['confidence'] > 0.8]
-    high_conf_df.to_csv(output_dir / 'high_confidence_triples.csv', index=False)
+    def __exit__(self, *exc):
+        self.close()
 
-    return {"basic": len(basic), "detailed": len(edges_df), "high_conf": len(high_conf_df)}
+class ParquetEdgeWriter:
+    """
+    EdgeWriter for edges_detailed.parquet and passages.parquet: each write() adds zstd row
+    groups of up to WRITE_BATCH rows (edges sorted by supplement id), with dictionary-encoded
+    id, name, relation, method, URL and passage id columns
+    """
+
+    def __init__(self, output_dir: Path):
+        import pyarrow.parquet as pq
+        self.writers = {name: pq.ParquetWriter(output_dir / parquet_name(EdgeWriter.FILES[name]),
+                                               arrow_table({c: [] for c in columns}).schema,
+                                               compression=PARQUET_COMPRESSION)
+                        for name, columns in (("detailed", EDGE_COLUMNS), ("passages", PASSAGE_COLUMNS))}
+        self.passage_keys = KeyIndex(output_dir / PASSAGE_KEYS_FILE)
+        self.counts = {"detailed": 0, "high_conf": 0, "passages": 0}
+
+    def write(self, per_row: List[List[Triple]]):
+        edges, passages = edge_columns(per_row, self.passage_keys)
+        ids = edges['supplement_id']
+        if not ids:
+            return
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        edges = {c: [values[i] for i in order] for c, values in edges.items()}
+        passages = {c: [p[c] for p in passages] for c in PASSAGE_COLUMNS}
+        for name, columns in (("detailed", edges), ("passages", passages)):
+            n = len(columns['passage_id'])
+            if n:
+                self.writers[name].write_table(arrow_table(columns), row_group_size=min(n, WRITE_BATCH))
+                self.counts[name] += n
+        self.counts["high_conf"] += sum(c > HIGH_CONFIDENCE for c in edges['confidence'])
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+        self.passage_keys.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def edge_writer(output_dir: Path, fmt: str = "csv"):
+    return ParquetEdgeWriter(output_dir) if fmt == "parquet" else EdgeWriter(output_dir)
+
+def write_edges(per_row: List[List[Triple]], output_dir: Path, fmt: str = "csv"):
+    """The edge files for the triples of every input row, each row's triples in one list"""
+    with edge_writer(output_dir, fmt) as writer:
+        if fmt == "parquet":
+            # one write, so edges are sorted across the whole file and not just within a row group
+            writer.write(per_row)
+        else:
+            for i in range(0, len(per_row), WRITE_BATCH):
+                writer.write(per_row[i:i + WRITE_BATCH])
+    return dict(writer.counts)
+
+class KeyIndex:
+    """
+    Set of keys in a scratch sqlite file, for de-duplicating across more rows than should
+    be held in memory. The file is recreated on open and deleted on close
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.unlink(missing_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=OFF")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        self.conn.execute("CREATE TABLE keys (key BLOB PRIMARY KEY) WITHOUT ROWID")
+        self.size = 0
+
+    def add(self, keys: List[bytes]) -> List[bool]:
+        """True for each key not seen before (only the first of keys repeated within the list)"""
+        with self.conn:
+            new = [self.conn.execute("INSERT OR IGNORE INTO keys VALUES (?)", (k,)).rowcount == 1 for k in keys]
+        self.size += sum(new)
+        return new
+
+    def close(self):
+        self.conn.close()
+        self.path.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 def write_stats(stats: dict, output_dir: Path):
     summary = stats.copy()
@@ -64,4 +326,33 @@ def write_stats(stats: dict, output_dir: Path):
 
     out_path = output_dir / 'extraction_stats.json'
     with open(out_path, 'w') as f:
-        json.dump(summary, f, indent=2)
\ No newline at end of file
+        json.dump(summary, f, indent=2)
+
+def write_llm_log(records: List[dict], output_dir: Path, append: bool = False):
+    """One line per LLM request; rows with ok=False got no LLM triples and can be rerun"""
+    log_df = pd.DataFrame(records)
+    log_df.to_csv(output_dir / 'llm_requests.csv', index=False, mode='a' if append else 'w', header=not append)
+    return {"requests": len(log_df), "failed": int((~log_df['ok']).sum())}
+
+MANIFEST_FILE = 'extraction_manifest.json'
+# scratch KeyIndex of the passages an edge writer has written
+PASSAGE_KEYS_FILE = '.passage_keys.sqlite'
+
+def row_hash(supplement_name, url, uses_text) -> str:
+    blob = json.dumps([str(supplement_name), str(url), str(uses_text)], ensure_ascii=False)
+    return hashlib.blake2b(blob.encode('utf-8'), digest_size=12).hexdigest()
+
+def load_manifest(output_dir: Path):
+    path = output_dir / MANIFEST_FILE
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, output_dir: Path):
+    """Per-row content hash -> validity and triples of the last run (written atomically)"""
+    path = output_dir / MANIFEST_FILE
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, path)